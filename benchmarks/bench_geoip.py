@@ -0,0 +1,69 @@
+# GeoIP 查询基准：生成 N 个随机 IPv4 区间的 CSV，测量首次解析、缓存载入、
+# 常驻内存（tracemalloc）以及随机查询的每秒次数
+#
+#   python benchmarks/bench_geoip.py --ranges 300000 --lookups 1000000
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import tempfile
+import time
+import tracemalloc
+
+import fake_chrome  # noqa: F401  把仓库根目录加入 sys.path
+import main
+
+
+def write_ranges(path, count):
+    countries = list(main.COUNTRY_LOCALES)
+    bounds = sorted(random.sample(range(1 << 24, (224 << 24) - 1), count * 2))
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            start, end = bounds[2 * i], bounds[2 * i + 1]
+            f.write(f"{socket.inet_ntoa(start.to_bytes(4, 'big'))},"
+                    f"{socket.inet_ntoa(end.to_bytes(4, 'big'))},{random.choice(countries)}\n")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ranges", type=int, default=300000)
+    parser.add_argument("--lookups", type=int, default=1000000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="fpm-geoip-")
+    try:
+        path = os.path.join(workdir, "geoip.csv")
+        write_ranges(path, args.ranges)
+
+        start = time.perf_counter()
+        main.GeoIPDatabase(path)
+        csv_seconds = time.perf_counter() - start
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        db = main.GeoIPDatabase(path)
+        cache_seconds = time.perf_counter() - start
+        resident_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        ips = [socket.inet_ntoa(random.getrandbits(32).to_bytes(4, 'big')) for _ in range(args.lookups)]
+        hits = 0
+        start = time.perf_counter()
+        for ip in ips:
+            if db.lookup(ip) is not None:
+                hits += 1
+        lookup_seconds = time.perf_counter() - start
+
+        print(json.dumps({
+            "ranges": len(db),
+            "csv_load_seconds": round(csv_seconds, 3),
+            "cache_load_seconds": round(cache_seconds, 4),
+            "resident_mb": round(resident_bytes / 1048576, 2),
+            "lookups": args.lookups,
+            "hit_ratio": round(hits / args.lookups, 3),
+            "lookups_per_sec": round(args.lookups / lookup_seconds),
+        }, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,89 @@
+# profiles_config.json 持久化基准：
+#   1. save_profiles 在 N 个环境下的原子写入速度（writes/sec）
+#   2. 多线程高频修改时，合并写把多少次修改压缩成了多少次实际写盘
+#
+#   python benchmarks/bench_persistence.py --profiles 10000
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import fake_chrome
+
+
+def make_profiles(main, count):
+    config = main.generate_random_profile()
+    return {
+        f"{i:08x}": {
+            "name": f"bench-{i}",
+            "config": dict(config),
+            "user_data_dir": main.profile_dir_path(f"{i:08x}"),
+            "status": "stopped",
+            "pid": None,
+            "created_at": "2024-01-01 00:00:00",
+        }
+        for i in range(count)
+    }
+
+
+def bench_atomic_writes(main, profiles, seconds):
+    writes = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        main.save_profiles(profiles)
+        writes += 1
+    elapsed = time.perf_counter() - start
+    return {"writes": writes, "seconds": round(elapsed, 3), "writes_per_sec": round(writes / elapsed, 2),
+            "file_bytes": os.path.getsize(main.CONFIG_FILE)}
+
+
+def bench_coalesced_mutations(main, profiles, seconds, threads):
+    main.save_profiles(profiles)
+    api = main.Api()
+    ids = list(api.profiles)
+    mutations = [0] * threads
+    deadline = time.monotonic() + seconds
+
+    def mutate(slot):
+        i = slot
+        while time.monotonic() < deadline:
+            profile_id = ids[i % len(ids)]
+            api.update_profile(profile_id, f"edited-{i}", api.profiles[profile_id]["config"])
+            mutations[slot] += 1
+            i += threads
+
+    pool = [threading.Thread(target=mutate, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    api._saver.flush()
+    elapsed = time.perf_counter() - start
+    total = sum(mutations)
+    return {"mutations": total, "mutations_per_sec": round(total / elapsed, 1),
+            "disk_writes": api._saver.writes, "debounce_seconds": main.SAVE_DEBOUNCE_SECONDS}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=10000)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="fpm-bench-")
+    try:
+        main = fake_chrome.install(workdir)
+        profiles = make_profiles(main, args.profiles)
+        result = {
+            "profiles": args.profiles,
+            "atomic_save": bench_atomic_writes(main, profiles, args.seconds),
+            "coalesced": bench_coalesced_mutations(main, profiles, args.seconds, args.threads),
+        }
+        print(json.dumps(result, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,45 @@
+# 代理健康检查基准：本地起一个模拟 HTTP 代理（直接返回“出口 IP”），
+# 用 check_proxies_async 并发检测 N 个指向它的代理，统计每秒检测数
+#
+#   python benchmarks/bench_proxy_check.py --proxies 5000 --concurrency 500
+import argparse
+import asyncio
+import json
+import time
+
+import fake_chrome  # noqa: F401  把仓库根目录加入 sys.path
+import main
+
+
+async def fake_proxy(reader, writer):
+    try:
+        await reader.readuntil(b"\r\n\r\n")
+        body = b"203.0.113.7"
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(body), body))
+        await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def run(count, concurrency):
+    server = await asyncio.start_server(fake_proxy, "127.0.0.1", 0, backlog=4096)
+    port = server.sockets[0].getsockname()[1]
+    proxies = [{"id": f"{i:08x}", **main.parse_proxy_line(f"http://127.0.0.1:{port}")} for i in range(count)]
+    async with server:
+        start = time.perf_counter()
+        results = await main.check_proxies_async(proxies, check_url="http://check.invalid/ip",
+                                                 concurrency=concurrency, timeout=10)
+        elapsed = time.perf_counter() - start
+    ok = sum(1 for r in results.values() if r["ok"])
+    return {"proxies": count, "concurrency": concurrency, "ok": ok, "failed": count - ok,
+            "seconds": round(elapsed, 3), "checks_per_sec": round(count / elapsed, 1)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--proxies", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.proxies, args.concurrency)), indent=2))
@@ -0,0 +1,88 @@
+# 启动耗时基准：
+#   1. python -X importtime 下 import main 的累计耗时和最慢的模块
+#   2. 构造 Api 的耗时，以及首页 get_profiles(0, 500) 返回的耗时（N 个环境）
+# 每次运行的结果追加到 benchmarks/results/startup.jsonl，便于跨版本对比
+#
+#   python benchmarks/bench_startup.py --profiles 10000
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_chrome
+
+RESULTS_FILE = os.path.join(fake_chrome.HERE, "results", "startup.jsonl")
+
+
+def measure_importtime(runs):
+    best = None
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                              cwd=fake_chrome.ROOT, capture_output=True, text=True, check=True)
+        modules = []
+        for line in proc.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            modules.append((name.strip(), int(self_us), int(cumulative_us)))
+        total = next(c for name, _, c in modules if name == "main")
+        if best is None or total < best["main_cumulative_us"]:
+            slowest = sorted(modules, key=lambda m: m[1], reverse=True)[:10]
+            best = {"main_cumulative_us": total,
+                    "slowest_self_us": [{"module": n, "self_us": s} for n, s, _ in slowest]}
+    return best
+
+
+def measure_api_startup(count):
+    workdir = tempfile.mkdtemp(prefix="fpm-startup-")
+    try:
+        main = fake_chrome.install(workdir)
+        config = main.generate_random_profile()
+        profiles = {f"{i:08x}": {"name": f"bench-{i}", "config": dict(config),
+                                 "user_data_dir": main.profile_dir_path(f"{i:08x}"),
+                                 "status": "stopped", "pid": None, "created_at": "2024-01-01 00:00:00"}
+                    for i in range(count)}
+        main.save_profiles(profiles)
+
+        start = time.perf_counter()
+        api = main.Api()
+        constructed = time.perf_counter()
+        api.get_profiles(0, 500)
+        first_page = time.perf_counter()
+        return {"profiles": count,
+                "api_init_ms": round((constructed - start) * 1000, 3),
+                "first_page_ms": round((first_page - start) * 1000, 3)}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=fake_chrome.ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    record = {
+        "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "import": measure_importtime(args.runs),
+        "startup": measure_api_startup(args.profiles),
+    }
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(json.dumps(record, indent=2, ensure_ascii=False))
@@ -0,0 +1,136 @@
+# Api 核心路径基准（使用 fake_chrome，不需要真实浏览器）：
+#   create_profile / get_profiles / start_profile+stop_profile / 监控线程单轮开销 / validate_profiles / save_profiles
+# 分别在 100、1k、10k、100k 个环境的规模下测量，每项取多次运行的中位数。
+# 结果写入 benchmarks/results/suite-<revision>.json；--baseline 指定旧结果时打印倍率，便于发现回退
+#
+#   python benchmarks/bench_suite.py --sizes 100,1000,10000 --baseline benchmarks/results/suite-abc1234.json
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import fake_chrome
+from bench_startup import git_revision
+
+RESULTS_DIR = os.path.join(fake_chrome.HERE, "results")
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+# 直接写好 count 个环境的配置文件，避免用 create_profile 搭建 100k 规模时测的是搭建本身
+def seed_profiles(main, count):
+    config = main.generate_random_profile()
+    profiles = {f"{i:08x}": {"name": f"bench-{i}", "config": dict(config),
+                             "user_data_dir": main.profile_dir_path(f"{i:08x}"),
+                             "status": "stopped", "pid": None, "created_at": "2024-01-01 00:00:00"}
+                for i in range(count)}
+    main.save_profiles(profiles)
+
+
+def bench_size(count, repeat, launches):
+    workdir = tempfile.mkdtemp(prefix="fpm-suite-")
+    try:
+        main = fake_chrome.install(workdir)
+        seed_profiles(main, count)
+        api = main.Api()
+        api.profiles
+        result = {"profiles": count}
+
+        configs = [main.generate_random_profile() for _ in range(repeat)]
+        created = []
+        result["create_profile_ms"] = timed(
+            lambda: created.append(api.create_profile("bench", configs[len(created)])["id"]), repeat)
+        result["get_profiles_all_ms"] = timed(lambda: api.get_profiles(), repeat)
+        result["get_profiles_page_ms"] = timed(lambda: api.get_profiles(0, 500), repeat)
+
+        target = created[0]
+
+        def start_stop():
+            started = api.start_profile(target)
+            if not started["success"]:
+                raise RuntimeError(started["error"])
+            api.stop_profile(target)
+        result["start_stop_ms"] = timed(start_stop, launches)
+
+        # 监控线程单轮：先测没有进程退出时的空转，再测有一个进程退出时的回收
+        running = created[1:1 + min(8, len(created) - 1)]
+        for p_id in running:
+            api.start_profile(p_id)
+        result["monitor_idle_ms"] = timed(api._reap_exited_processes, repeat)
+        samples = []
+        for p_id in running:
+            with api._lock:
+                proc = api.running_processes[api.profiles[p_id]["pid"]]
+            proc.terminate()
+            proc.wait()
+            start = time.perf_counter()
+            api._reap_exited_processes()
+            samples.append((time.perf_counter() - start) * 1000)
+        result["monitor_reap_ms"] = round(statistics.median(samples), 3) if samples else None
+
+        api._saver.flush()
+
+        # 全量配置校验：每次先清空已校验登记，测的是冷检查
+        def validate_all():
+            api._valid_ids.clear()
+            api.validate_profiles()
+        result["validate_profiles_ms"] = timed(validate_all, repeat)
+
+        snapshot = api._snapshot_profiles()
+        result["save_profiles_ms"] = timed(lambda: main.save_profiles(snapshot), repeat)
+        result["config_bytes"] = os.path.getsize(main.CONFIG_FILE)
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results, baseline_file):
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = {r["profiles"]: r for r in json.load(f)["results"]}
+    for row in results:
+        old = baseline.get(row["profiles"])
+        if not old:
+            continue
+        for key, value in row.items():
+            if key.endswith("_ms") and value and old.get(key):
+                ratio = value / old[key]
+                flag = "  <-- 变慢" if ratio > 1.2 else ""
+                print(f"{row['profiles']:>7} {key:<22} {old[key]:>10.3f} -> {value:>10.3f} ms  x{ratio:.2f}{flag}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100,1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--launches", type=int, default=5)
+    parser.add_argument("--baseline")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        row = bench_size(size, args.repeat, args.launches)
+        print(json.dumps(row, ensure_ascii=False), flush=True)
+        results.append(row)
+
+    revision = git_revision()
+    record = {"at": time.strftime("%Y-%m-%d %H:%M:%S"), "revision": revision,
+              "python": sys.version.split()[0], "platform": sys.platform, "results": results}
+    output = args.output or os.path.join(RESULTS_DIR, f"suite-{revision or 'unknown'}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+    if args.baseline:
+        compare(results, args.baseline)
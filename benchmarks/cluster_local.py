@@ -0,0 +1,102 @@
+# 在本机起一个协调器和若干 agent（各自独立的数据目录 + fake_chrome），验证多机编排：
+#   - 新建环境按负载分散到各个 agent
+#   - 启动时环境所在 agent 已满载，会先迁移用户目录再在空闲 agent 上启动
+#
+#   python benchmarks/cluster_local.py --agents 3 --profiles 12
+import argparse
+import collections
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_chrome
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_agent(workdir, coordinator_url, agent_id, port):
+    main = fake_chrome.install(workdir)
+    main.SCHEDULE_FILE = os.path.join(workdir, "schedule.json")
+    main.run_agent(coordinator_url, f"127.0.0.1:{port}", agent_id)
+
+
+def wait_for_agents(main, url, count, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            agents = main.cluster_request(url, "/agents")
+            if len([a for a in agents if a["alive"]]) >= count:
+                return agents
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("agent 没有在规定时间内注册")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=3)
+    parser.add_argument("--profiles", type=int, default=12)
+    parser.add_argument("--run-agent", nargs=4, metavar=("WORKDIR", "COORDINATOR", "AGENT_ID", "PORT"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_agent:
+        workdir, coordinator_url, agent_id, port = args.run_agent
+        run_agent(workdir, coordinator_url, agent_id, int(port))
+        sys.exit(0)
+
+    import main
+
+    # 每个 agent 的容量比平均分到的环境数少一个，最后一步才会触发迁移
+    per_agent = max(2, args.profiles // args.agents)
+    env = dict(os.environ, FPM_CLUSTER_HEARTBEAT="0.5", FPM_AGENT_MAX_RUNNING=str(per_agent - 1))
+    main.CLUSTER_HEARTBEAT_SECONDS = 0.5
+    root = tempfile.mkdtemp(prefix="fpm-cluster-")
+    coordinator_port = free_port()
+    url = f"http://127.0.0.1:{coordinator_port}"
+    procs = [subprocess.Popen([sys.executable, os.path.join(fake_chrome.ROOT, "main.py"), "--coordinator",
+                               "--listen", f"127.0.0.1:{coordinator_port}"], env=env)]
+    try:
+        for i in range(args.agents):
+            procs.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "--run-agent",
+                                           os.path.join(root, f"agent{i}"), url, f"agent{i}", str(free_port())],
+                                          env=env))
+        wait_for_agents(main, url, args.agents)
+
+        config = main.generate_random_profile()
+        created = [main.cluster_request(url, "/profiles/create", {"name": f"c{i}", "config": config})
+                   for i in range(args.profiles)]
+        print("创建分布:", dict(collections.Counter(r["agent_id"] for r in created)))
+
+        started = [main.cluster_request(url, "/profiles/start", {"profile_id": r["id"]})
+                   for r in created[:args.agents * (per_agent - 1)]]
+        print("启动分布:", dict(collections.Counter(r["agent_id"] for r in started if r["success"])))
+        for r in created:
+            main.cluster_request(url, "/profiles/stop", {"profile_id": r["id"]})
+
+        # 把 agent0 跑满，再启动 agent0 上剩下的环境，应当迁移到其他 agent 上启动
+        placement = main.cluster_request(url, "/placement")
+        on_agent0 = [p_id for p_id, a_id in placement.items() if a_id == "agent0"]
+        for p_id in on_agent0[:-1]:
+            main.cluster_request(url, "/profiles/start", {"profile_id": p_id})
+        time.sleep(1)
+        print(json.dumps(main.cluster_request(url, "/agents"), indent=2))
+        moved = main.cluster_request(url, "/profiles/start", {"profile_id": on_agent0[-1]})
+        print("迁移启动:", moved)
+        for p_id in main.cluster_request(url, "/placement"):
+            main.cluster_request(url, "/profiles/stop", {"profile_id": p_id})
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+        shutil.rmtree(root, ignore_errors=True)
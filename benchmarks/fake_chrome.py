@@ -0,0 +1,51 @@
+# 模拟 fingerprint-chromium 的可执行文件，供压测/基准脚本使用：
+# 接受任意命令行参数，驻留到被终止或到达 FAKE_CHROME_LIFETIME 秒后退出。
+# FAKE_CHROME_CHILDREN=N 时像真浏览器一样再派生 N 个子进程，用于检查停止时子进程是否一并结束
+import os
+import stat
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+# 在 workdir 下生成可执行的假 chrome，并让 main 模块的路径全部指向 workdir
+def install(workdir):
+    import main
+
+    os.makedirs(workdir, exist_ok=True)
+    script = os.path.abspath(__file__)
+    if sys.platform == 'win32':
+        exe = os.path.join(workdir, 'chrome.bat')
+        with open(exe, 'w', encoding='utf-8') as f:
+            f.write(f'@"{sys.executable}" "{script}" %*\n')
+    else:
+        exe = os.path.join(workdir, 'chrome')
+        with open(exe, 'w', encoding='utf-8') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+        os.chmod(exe, os.stat(exe).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    main.CHROME_PATH = exe
+    main.PROFILES_DIR = os.path.join(workdir, 'profiles')
+    main.CONFIG_FILE = os.path.join(workdir, 'profiles_config.json')
+    main.PROXIES_FILE = os.path.join(workdir, "proxies.json")
+    main.SCHEDULE_FILE = os.path.join(workdir, "schedule.json")
+    main.LIMITS_FILE = os.path.join(workdir, "resource_limits.json")
+    main.HISTORY_DIR = os.path.join(workdir, "profile_history")
+    os.makedirs(main.PROFILES_DIR, exist_ok=True)
+    return main
+
+
+if __name__ == '__main__':
+    import subprocess
+
+    children = int(os.environ.get('FAKE_CHROME_CHILDREN', '0') or 0)
+    for _ in range(children):
+        subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(3600)'])
+    lifetime = float(os.environ.get('FAKE_CHROME_LIFETIME', '0') or 0)
+    deadline = time.monotonic() + lifetime if lifetime > 0 else None
+    while deadline is None or time.monotonic() < deadline:
+        time.sleep(0.05)
@@ -0,0 +1,109 @@
+# Api 并发压测：多个线程对同一个 Api 随机执行 创建/启动/停止/编辑/删除/刷新，
+# 结束后校验内存状态、运行进程表和配置文件三者一致，且监控线程仍然存活
+#
+#   python benchmarks/stress_api.py --threads 32 --seconds 20
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+
+import fake_chrome
+
+
+def worker(api, main, deadline, stats, errors):
+    rnd = random.Random()
+    while time.monotonic() < deadline:
+        with api._lock:
+            ids = list(api.profiles)
+        op = rnd.choice(["create", "start", "start", "stop", "stop", "update", "delete", "list"])
+        try:
+            if op == "create" or not ids:
+                result = api.create_profile(f"stress-{rnd.randint(0, 1 << 30)}", main.generate_random_profile())
+            elif op == "list":
+                api.get_profiles()
+                result = {"success": True}
+            else:
+                profile_id = rnd.choice(ids)
+                if op == "start":
+                    result = api.start_profile(profile_id)
+                elif op == "stop":
+                    result = api.stop_profile(profile_id)
+                elif op == "update":
+                    result = api.update_profile(profile_id, "edited", main.generate_random_profile())
+                else:
+                    result = api.delete_profile(profile_id)
+            key = op if result.get("success") else op + "_rejected"
+            stats[key] = stats.get(key, 0) + 1
+        except Exception:
+            errors.append(traceback.format_exc())
+
+
+def check_consistency(api, main):
+    problems = []
+    with api._lock:
+        for p_id, p_data in api.profiles.items():
+            pid = p_data.get("pid")
+            if p_data.get("status") == "running" and pid not in api.running_processes:
+                problems.append(f"{p_id}: running but pid {pid} not tracked")
+        owned = {p.get("pid") for p in api.profiles.values() if p.get("pid")}
+        for pid in api.running_processes:
+            if pid not in owned:
+                problems.append(f"pid {pid} tracked but owned by no profile")
+        api._saver.flush()
+        with open(main.CONFIG_FILE, encoding='utf-8') as f:
+            on_disk = json.load(f)
+        if set(on_disk) != set(api.profiles):
+            problems.append("profiles_config.json differs from memory")
+    if not api._monitor_thread.is_alive():
+        problems.append("monitor thread died")
+    return problems
+
+
+def run(threads, seconds, lifetime):
+    workdir = tempfile.mkdtemp(prefix="fpm-stress-")
+    os.environ['FAKE_CHROME_LIFETIME'] = str(lifetime)
+    main = fake_chrome.install(workdir)
+    api = main.Api()
+    deadline = time.monotonic() + seconds
+    stats_per_thread = [{} for _ in range(threads)]
+    errors = []
+    pool = [threading.Thread(target=worker, args=(api, main, deadline, stats_per_thread[i], errors))
+            for i in range(threads)]
+    try:
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        # 给监控线程一个周期回收自然退出的进程
+        time.sleep(1.5)
+        problems = check_consistency(api, main)
+    finally:
+        for p_id in list(api.profiles):
+            api.stop_profile(p_id)
+        api._saver.flush()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    totals = {}
+    for stats in stats_per_thread:
+        for key, count in stats.items():
+            totals[key] = totals.get(key, 0) + count
+    print(json.dumps({"threads": threads, "seconds": seconds, "ops": totals,
+                      "errors": len(errors), "problems": problems}, indent=2))
+    for err in errors[:5]:
+        print(err)
+    return not errors and not problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--lifetime", type=float, default=2,
+                        help="假 chrome 自动退出的秒数，用于覆盖监控线程回收路径")
+    args = parser.parse_args()
+    raise SystemExit(0 if run(args.threads, args.seconds, args.lifetime) else 1)
@@ -0,0 +1,76 @@
+# 前端构建：压缩 web/ 下的 index.html / app.css / app.js，按内容哈希命名输出到 web/dist/。
+# 带哈希的文件内容永不变化，本地资源服务器给它们长期缓存头；index.html 每次都重新校验
+#
+#   python build_web.py
+import hashlib
+import os
+import re
+import shutil
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+WEB_DIR = os.path.join(ROOT, "web")
+DIST_DIR = os.path.join(WEB_DIR, "dist")
+HASH_LENGTH = 10
+
+
+def minify_css(text):
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    # 冒号两侧的空格在选择器里有含义（后代 vs 伪类），只处理不会改变语义的符号
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    return text.replace(";}", "}").strip()
+
+
+# 保守压缩：去掉整行注释、缩进和空行，保留换行以免触发自动分号插入的差异
+def minify_js(text):
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("//"):
+            lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def minify_html(text):
+    text = re.sub(r"<!--.*?-->", "", text, flags=re.S)
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip()) + "\n"
+
+
+def write_hashed(name, content):
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:HASH_LENGTH]
+    stem, ext = os.path.splitext(name)
+    hashed_name = f"{stem}.{digest}{ext}"
+    with open(os.path.join(DIST_DIR, hashed_name), "w", encoding="utf-8", newline="\n") as f:
+        f.write(content)
+    return hashed_name
+
+
+def build():
+    def read(name):
+        with open(os.path.join(WEB_DIR, name), encoding="utf-8") as f:
+            return f.read()
+
+    if os.path.exists(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    os.makedirs(DIST_DIR)
+
+    sizes = {}
+    html = read("index.html")
+    for name, minify in (("app.css", minify_css), ("app.js", minify_js)):
+        source = read(name)
+        content = minify(source)
+        hashed_name = write_hashed(name, content)
+        html = html.replace(f'"{name}"', f'"{hashed_name}"')
+        sizes[hashed_name] = (len(source.encode("utf-8")), len(content.encode("utf-8")))
+
+    source = html
+    html = minify_html(html)
+    with open(os.path.join(DIST_DIR, "index.html"), "w", encoding="utf-8", newline="\n") as f:
+        f.write(html)
+    sizes["index.html"] = (len(source.encode("utf-8")), len(html.encode("utf-8")))
+    return sizes
+
+
+if __name__ == '__main__':
+    for name, (before, after) in build().items():
+        print(f"{name:24} {before:>8} -> {after:>8} bytes")
@@ -1,24 +1,97 @@
 # app.py
-import webview
 import json
 import os
+import re
+import shutil
 import subprocess
 import uuid
 import random
 import time
 import threading
-import ctypes
+import atexit
+import traceback
+import contextlib
+import io
+import tarfile
+import tempfile
+import concurrent.futures
+import asyncio
+import base64
+import ipaddress
+import urllib.parse
+import array
+import bisect
+import csv
+import socket
+import collections
+import datetime
+import heapq
+import itertools
+import functools
+import hashlib
+import hmac
+import inspect
+import signal
 import sys
 
-# 最小化控制台窗口
-if sys.platform == 'win32':
-    ctypes.windll.user32.ShowWindow(ctypes.windll.kernel32.GetConsoleWindow(), 6)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import maxminddb
+except ImportError:
+    maxminddb = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import zoneinfo
+except ImportError:
+    zoneinfo = None
 
 PROFILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
 CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles_config.json")
-CHROME_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fingerprint-chromium", "chrome.exe")
-
-os.makedirs(PROFILES_DIR, exist_ok=True)
+# 浏览器可执行文件：FPM_CHROME_PATH 优先，否则用程序目录下按平台命名的 fingerprint-chromium
+CHROME_PATH = os.environ.get("FPM_CHROME_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fingerprint-chromium",
+    "chrome.exe" if sys.platform == 'win32' else "chrome")
+# 配置文件合并写窗口（秒），设为 0 则每次修改立即写盘
+SAVE_DEBOUNCE_SECONDS = float(os.environ.get("FPM_SAVE_DEBOUNCE", "0.5"))
+# 可选的磁盘缓存根目录（例如 /dev/shm/fpm-cache 放到 tmpfs），每个环境使用其下以 ID 命名的子目录
+DISK_CACHE_ROOT = os.environ.get("FPM_DISK_CACHE_DIR", "")
+# 磁盘占用统计/缓存清理的后台线程数
+STORAGE_WORKERS = int(os.environ.get("FPM_STORAGE_WORKERS", "4"))
+# 运行中的环境文件会原地增长而目录 mtime 不变，统计结果最多复用这么多秒
+USAGE_RUNNING_TTL = 30
+# 删除环境时目录先移入 PROFILES_DIR 下的回收区，再在后台删除
+TRASH_DIR_NAME = ".trash"
+# 前端静态资源；执行 build_web.py 后优先使用压缩并带内容哈希的 web/dist
+WEB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web")
+WEB_DIST_DIR = os.path.join(WEB_DIR, "dist")
+# WebView 的持久缓存按 origin 区分，端口固定才能跨启动命中缓存；被占用时退回随机端口
+UI_PORT = int(os.environ.get("FPM_UI_PORT", "18321"))
+# 可选：把每次启动的窗口可交互耗时追加到这个 JSON Lines 文件
+UI_TIMING_FILE = os.environ.get("FPM_UI_TIMING_FILE", "")
+# 离线 GeoIP 数据：start_ip,end_ip,country[,timezone] 格式的 CSV，或 MaxMind .mmdb（需要 maxminddb）
+GEOIP_FILE = os.environ.get("FPM_GEOIP_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "geoip.csv"))
+# 指纹目录：platforms/webgl/timezones/languages 四个带权重的 CSV，缺少的文件用内置列表代替
+CATALOG_DIR = os.environ.get("FPM_CATALOG_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog"))
+SCHEDULE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schedule.json")
+# 分组资源限制（cgroup），单个环境的限制放在环境配置的 limits 字段里
+LIMITS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resource_limits.json")
+PROXIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "proxies.json")
+# 配置修改历史，每个环境一个只追加的 JSON Lines 文件；每个环境至少保留最近这么多个版本
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profile_history")
+HISTORY_KEEP_VERSIONS = max(2, int(os.environ.get("FPM_HISTORY_KEEP", "50")))
+# 代理健康检查：通过代理请求该地址（返回纯文本 IP 或带 ip 字段的 JSON），并发数与单个超时秒数
+PROXY_CHECK_URL = os.environ.get("FPM_PROXY_CHECK_URL", "http://api.ipify.org/")
+PROXY_CHECK_CONCURRENCY = int(os.environ.get("FPM_PROXY_CHECK_CONCURRENCY", "200"))
+PROXY_CHECK_TIMEOUT = float(os.environ.get("FPM_PROXY_CHECK_TIMEOUT", "8"))
 
 
 def load_profiles():
@@ -29,10 +102,634 @@ def load_profiles():
 
 
 def save_profiles(profiles):
-    with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(profiles, f, ensure_ascii=False, indent=2)
+    write_file_atomic(CONFIG_FILE, json.dumps(profiles, ensure_ascii=False, indent=2))
+
+
+# 环境目录按 ID 的哈希分两级存放：PROFILES_DIR/ab/cd/<id>，每层最多 256 个子目录，
+# 路径只由 ID 算出，查找时不需要列目录
+def profile_dir_path(profile_id):
+    digest = hashlib.sha1(profile_id.encode('utf-8')).hexdigest()
+    return os.path.join(PROFILES_DIR, digest[:2], digest[2:4], profile_id)
+
+
+# 把旧版直接放在 PROFILES_DIR 下的环境目录搬到分片路径并改写 user_data_dir，返回改写的条数。
+# 只按配置里的记录逐个处理，不扫描目录；先搬目录后写配置，中途退出下次启动会接着完成。
+# 带 SingletonLock 的目录说明浏览器可能还在用，留到下次启动再搬
+def migrate_profile_dirs(profiles):
+    flat_prefix = PROFILES_DIR + os.sep
+    migrated = 0
+    for p_id, p_data in profiles.items():
+        current = p_data.get("user_data_dir") or ""
+        if not current.startswith(flat_prefix) or os.sep in current[len(flat_prefix):]:
+            continue
+        target = profile_dir_path(p_id)
+        if os.path.isdir(current):
+            if os.path.lexists(os.path.join(current, "SingletonLock")):
+                continue
+            try:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(current, target)
+            except OSError as e:
+                print(f"迁移环境目录失败 {current}: {e}")
+                continue
+        p_data["user_data_dir"] = target
+        migrated += 1
+    return migrated
+
+
+# 先写同目录临时文件并 fsync，再原子替换，写到一半崩溃也不会截断原文件
+def write_file_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if sys.platform != 'win32':
+        # 目录项也要落盘，否则掉电后 rename 可能丢失
+        dir_fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+# 合并写：窗口内的多次修改只触发一次落盘。首次修改后最迟 delay 秒写出，
+# 持续修改也不会无限推迟；delay <= 0 时退化为同步写
+class DebouncedSaver:
+    def __init__(self, snapshot, write, delay=SAVE_DEBOUNCE_SECONDS):
+        self._snapshot = snapshot
+        self._write = write
+        self._delay = delay
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._due = 0.0
+        self._thread = None
+        self._seq = 0
+        self._written_seq = 0
+        # 已取走脏标记、还没写完的 flush 数
+        self._inflight = 0
+        self._holds = 0
+        self.writes = 0
+
+    def schedule(self):
+        if self._delay <= 0:
+            # 同步写的调用方通常持有 Api 的锁，直接写自己这一份，不等其他进行中的写
+            with self._cond:
+                self._dirty = True
+                if self._holds:
+                    return
+                seq = self._claim()
+            self._write_claimed(seq)
+            return
+        with self._cond:
+            if not self._dirty:
+                self._dirty = True
+                self._due = time.monotonic() + self._delay
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    # 批量操作期间暂停后台写盘，退出时统一写一次
+    @contextlib.contextmanager
+    def batch(self):
+        with self._cond:
+            self._holds += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._holds -= 1
+                self._cond.notify_all()
+            self.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty or self._holds:
+                    self._cond.wait()
+                remaining = self._due - time.monotonic()
+                while self._dirty and remaining > 0:
+                    self._cond.wait(remaining)
+                    remaining = self._due - time.monotonic()
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+                time.sleep(1)
+
+    # 返回前保证此前的修改都已落盘：没有新修改时也要等后台线程正在进行的写完成，
+    # 否则退出时的最后一次 flush 可能在写到一半时返回。不要在持有 Api 锁时调用
+    def flush(self):
+        with self._cond:
+            if not self._dirty:
+                while self._inflight:
+                    self._cond.wait()
+                return
+            seq = self._claim()
+        self._write_claimed(seq)
+
+    # 调用方需持有 _cond
+    def _claim(self):
+        self._dirty = False
+        self._seq += 1
+        self._inflight += 1
+        return self._seq
+
+    # 快照在写锁外获取（调用方可能正持有 Api 的锁），按序号丢弃过期快照，避免旧数据覆盖新数据
+    def _write_claimed(self, seq):
+        try:
+            data = self._snapshot()
+            with self._write_lock:
+                if seq < self._written_seq:
+                    return
+                self._write(data)
+                self._written_seq = seq
+                self.writes += 1
+        except BaseException:
+            with self._cond:
+                if not self._dirty:
+                    self._dirty = True
+                    self._due = time.monotonic() + max(self._delay, 1)
+            raise
+        finally:
+            with self._cond:
+                self._inflight -= 1
+                self._cond.notify_all()
+
+
+# Chromium 可随时重建的缓存目录，导出/清理时跳过
+CACHE_DIR_NAMES = frozenset({
+    "Cache", "Code Cache", "GPUCache", "GrShaderCache", "ShaderCache", "GraphiteDawnCache",
+    "DawnCache", "DawnGraphiteCache", "DawnWebGPUCache", "CacheStorage", "ScriptCache",
+})
+# 单实例锁文件记录了本机主机名，带到别的机器上会让 Chromium 认为环境被占用
+SKIPPED_PROFILE_FILES = frozenset({"SingletonLock", "SingletonSocket", "SingletonCookie", "lockfile"})
+
+ARCHIVE_FORMAT = 1
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+ARCHIVE_EXT = ".tar.zst" if zstandard is not None else ".tar.gz"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+# 流式打开环境归档：有 zstandard 时写 .tar.zst，否则写 .tar.gz；读取时按文件头自动识别。
+# tarfile 的流模式按块读写，内存占用与环境大小无关
+@contextlib.contextmanager
+def open_profile_archive(path, mode):
+    raw = open(path, mode + 'b')
+    stream = None
+    try:
+        if mode == 'w':
+            if path.endswith(".zst"):
+                if zstandard is None:
+                    raise RuntimeError("导出 .tar.zst 需要安装 zstandard")
+                stream = zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(raw, closefd=False)
+                tar = tarfile.open(fileobj=stream, mode='w|', bufsize=ARCHIVE_CHUNK_SIZE)
+            else:
+                tar = tarfile.open(fileobj=raw, mode='w|gz', bufsize=ARCHIVE_CHUNK_SIZE)
+        else:
+            magic = raw.read(4)
+            raw.seek(0)
+            if magic == ZSTD_MAGIC:
+                if zstandard is None:
+                    raise RuntimeError("导入 .tar.zst 需要安装 zstandard")
+                stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=False)
+                tar = tarfile.open(fileobj=stream, mode='r|', bufsize=ARCHIVE_CHUNK_SIZE)
+            else:
+                tar = tarfile.open(fileobj=raw, mode='r|*', bufsize=ARCHIVE_CHUNK_SIZE)
+        try:
+            yield tar
+        finally:
+            tar.close()
+    finally:
+        if stream is not None:
+            stream.close()
+        raw.close()
+
+
+# 暂存目录名由归档 ID 和环境 ID 哈希得到，归档里的任意字符串都不会进入路径
+def import_staging_dir(staging_root, export_id, old_id):
+    return os.path.join(staging_root, hashlib.sha1(f"{export_id}/{old_id}".encode('utf-8')).hexdigest())
+
+
+def path_within(path, root):
+    root = os.path.realpath(root)
+    return os.path.commonpath([root, os.path.realpath(path)]) == root
+
+
+# 归档清单里的环境记录按新建环境的规则重新规范化，只保留这几个字段；返回 (记录, 错误)
+def normalize_import_record(record):
+    if not isinstance(record, dict):
+        return None, "记录必须是对象"
+    name = record.get("name")
+    if not isinstance(name, str) or not name.strip():
+        return None, "名称无效"
+    config, errors = normalize_config(record.get("config"))
+    if errors:
+        return None, "配置无效: " + "; ".join(errors)
+    tags, group, created_at = record.get("tags"), record.get("group"), record.get("created_at")
+    return {
+        "name": name,
+        "config": config,
+        "tags": normalize_tags(tags) if isinstance(tags, (str, list)) else [],
+        "group": group.strip() if isinstance(group, str) else "",
+        "created_at": created_at if isinstance(created_at, str) else time.strftime("%Y-%m-%d %H:%M:%S"),
+    }, None
+
+
+# 把一个 user-data-dir 写入归档，跳过缓存和单实例锁，返回写入的字节数
+def add_profile_dir_to_archive(tar, user_data_dir, arc_root):
+    total = 0
+    tar.add(user_data_dir, arcname=arc_root, recursive=False)
+    for dirpath, dirnames, filenames in os.walk(user_data_dir):
+        dirnames[:] = [d for d in dirnames if d not in CACHE_DIR_NAMES]
+        rel_dir = os.path.relpath(dirpath, user_data_dir)
+        arc_dir = arc_root if rel_dir == '.' else f"{arc_root}/{rel_dir.replace(os.sep, '/')}"
+        for name in dirnames:
+            tar.add(os.path.join(dirpath, name), arcname=f"{arc_dir}/{name}", recursive=False)
+        for name in filenames:
+            if name in SKIPPED_PROFILE_FILES:
+                continue
+            full_path = os.path.join(dirpath, name)
+            try:
+                info = tar.gettarinfo(full_path, arcname=f"{arc_dir}/{name}")
+                if info is None:
+                    continue
+                if info.isreg():
+                    with open(full_path, 'rb') as f:
+                        tar.addfile(info, f)
+                    total += info.size
+                else:
+                    tar.addfile(info)
+            except OSError:
+                # 浏览器运行期间可能有文件被占用或刚被删除，跳过单个文件不影响整体导出
+                continue
+    return total
+
+
+# 磁盘占用统计与缓存清理。按目录缓存“直接文件字节数 + 子目录列表”，目录 mtime 不变就复用，
+# 因此重复统计只需要对每个目录 stat 一次；清理任务在后台线程池执行
+class StorageManager:
+    def __init__(self, workers=STORAGE_WORKERS):
+        self._lock = threading.Lock()
+        self._dir_cache = {}
+        self._delete_failures = {}
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="storage")
+
+    def submit(self, fn, *args):
+        return self._pool.submit(fn, *args)
+
+    def map(self, fn, items):
+        return list(self._pool.map(fn, items))
+
+    def _scan_dir(self, path, max_age):
+        st = os.stat(path)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._dir_cache.get(path)
+        if cached and cached[0] == st.st_mtime_ns and now - cached[1] < max_age:
+            return cached[2], cached[3]
+        files_bytes = 0
+        subdirs = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    else:
+                        files_bytes += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+        with self._lock:
+            self._dir_cache[path] = (st.st_mtime_ns, now, files_bytes, subdirs)
+        return files_bytes, subdirs
+
+    def usage(self, user_data_dir, running=False):
+        max_age = USAGE_RUNNING_TTL if running else float("inf")
+        total = 0
+        cache_bytes = 0
+        stack = [(user_data_dir, False)]
+        while stack:
+            path, in_cache = stack.pop()
+            try:
+                files_bytes, subdirs = self._scan_dir(path, max_age)
+            except OSError:
+                continue
+            total += files_bytes
+            if in_cache:
+                cache_bytes += files_bytes
+            for name in subdirs:
+                stack.append((os.path.join(path, name), in_cache or name in CACHE_DIR_NAMES))
+        return {"bytes": total, "cache_bytes": cache_bytes}
+
+    # 改名到同一文件系统下的回收区是瞬时操作，之后由线程池回收空间
+    def trash(self, path):
+        trash_root = os.path.join(PROFILES_DIR, TRASH_DIR_NAME)
+        os.makedirs(trash_root, exist_ok=True)
+        trashed = os.path.join(trash_root, f"{os.path.basename(path)}-{uuid.uuid4().hex[:8]}")
+        os.rename(path, trashed)
+        self.forget(path)
+        self.reclaim(trashed)
+
+    def reclaim(self, path):
+        self._pool.submit(self._remove_tree, path)
+
+    # 启动时继续回收上次没删完的目录
+    def sweep_trash(self):
+        trash_root = os.path.join(PROFILES_DIR, TRASH_DIR_NAME)
+        if os.path.isdir(trash_root):
+            for entry in os.scandir(trash_root):
+                self.reclaim(entry.path)
+
+    def _remove_tree(self, path):
+        errors = []
+        if os.path.lexists(path):
+            shutil.rmtree(path, onerror=lambda func, failed_path, exc: errors.append(f"{failed_path}: {exc[1]}"))
+        with self._lock:
+            if errors:
+                self._delete_failures[path] = {"path": path, "errors": errors[:20], "error_count": len(errors),
+                                               "at": time.strftime("%Y-%m-%d %H:%M:%S")}
+            else:
+                self._delete_failures.pop(path, None)
+
+    def delete_failures(self):
+        with self._lock:
+            return list(self._delete_failures.values())
+
+    def forget(self, user_data_dir):
+        prefix = user_data_dir + os.sep
+        with self._lock:
+            for path in [p for p in self._dir_cache if p == user_data_dir or p.startswith(prefix)]:
+                del self._dir_cache[path]
+
+    # 删除环境目录下所有缓存目录，返回释放的字节数和失败项
+    def purge_caches(self, user_data_dir):
+        freed = 0
+        failures = []
+        for dirpath, dirnames, _ in os.walk(user_data_dir):
+            for name in [d for d in dirnames if d in CACHE_DIR_NAMES]:
+                dirnames.remove(name)
+                cache_dir = os.path.join(dirpath, name)
+                freed += self.usage(cache_dir)["bytes"]
+                shutil.rmtree(cache_dir, onerror=lambda func, path, exc: failures.append(f"{path}: {exc[1]}"))
+        self.forget(user_data_dir)
+        return {"freed_bytes": freed, "failures": failures}
+
+
+# 代理池：导入代理列表、绑定到环境、并发健康检查。启动环境时通过 --proxy-server 传给 Chromium
+# （Chromium 不支持在命令行里携带代理认证信息，带账号密码的代理需要在本机做无认证转发）
+PROXY_SCHEMES = ("http", "https", "socks4", "socks5")
+
+
+def parse_proxy_line(line):
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    scheme = "http"
+    if "://" in line:
+        scheme, line = line.split("://", 1)
+        scheme = scheme.lower()
+        if scheme not in PROXY_SCHEMES:
+            raise ValueError(f"不支持的代理协议: {scheme}")
+    username = password = ""
+    if "@" in line:
+        auth, line = line.rsplit("@", 1)
+        username, _, password = auth.partition(":")
+    parts = line.split(":")
+    if len(parts) == 4 and not username:
+        # host:port:user:pass
+        parts, username, password = parts[:2], parts[2], parts[3]
+    if len(parts) != 2 or not parts[0]:
+        raise ValueError(f"无法解析代理: {line}")
+    host, port = parts[0], int(parts[1])
+    if not 0 < port < 65536:
+        raise ValueError(f"端口无效: {port}")
+    auth = f"{username}:{password}@" if username else ""
+    return {"url": f"{scheme}://{auth}{host}:{port}", "scheme": scheme, "host": host, "port": port,
+            "username": username, "password": password}
+
+
+class ProxyPool:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.proxies = {}
+        if os.path.exists(PROXIES_FILE):
+            with open(PROXIES_FILE, 'r', encoding='utf-8') as f:
+                self.proxies = json.load(f)
+        self._saver = DebouncedSaver(self._snapshot, self._write)
+        atexit.register(self._saver.flush)
+
+    def _snapshot(self):
+        with self._lock:
+            return {p_id: dict(p) for p_id, p in self.proxies.items()}
+
+    def _write(self, proxies):
+        write_file_atomic(PROXIES_FILE, json.dumps(proxies, ensure_ascii=False, indent=2))
+
+    def get(self, proxy_id):
+        with self._lock:
+            proxy = self.proxies.get(proxy_id)
+            return dict(proxy) if proxy else None
+
+    def list(self):
+        with self._lock:
+            return [{**p, "id": p_id} for p_id, p in self.proxies.items()]
+
+    def import_lines(self, text):
+        added = []
+        invalid = []
+        with self._lock:
+            known = {p["url"] for p in self.proxies.values()}
+            for line in text.splitlines():
+                try:
+                    parsed = parse_proxy_line(line)
+                except ValueError as e:
+                    invalid.append(str(e))
+                    continue
+                if parsed is None or parsed["url"] in known:
+                    continue
+                proxy_id = uuid.uuid4().hex[:8]
+                self.proxies[proxy_id] = {**parsed, "status": "unknown", "latency_ms": None, "egress_ip": None,
+                                          "checked_at": None, "fail_count": 0}
+                known.add(parsed["url"])
+                added.append(proxy_id)
+            if added:
+                self._saver.schedule()
+        return {"added": added, "invalid": invalid}
+
+    def remove(self, proxy_ids):
+        with self._lock:
+            removed = [p_id for p_id in proxy_ids if self.proxies.pop(p_id, None) is not None]
+            if removed:
+                self._saver.schedule()
+        return removed
+
+    def update(self, proxy_id, fields):
+        with self._lock:
+            if proxy_id in self.proxies:
+                self.proxies[proxy_id].update(fields)
+                self._saver.schedule()
+
+    def record_checks(self, results):
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            for proxy_id, result in results.items():
+                proxy = self.proxies.get(proxy_id)
+                if proxy is None:
+                    continue
+                proxy["checked_at"] = now
+                if result["ok"]:
+                    proxy.update(status="ok", latency_ms=result["latency_ms"], fail_count=0,
+                                 egress_ip=result["egress_ip"] or proxy.get("egress_ip"))
+                    geo = geo_for_ip(proxy["egress_ip"])
+                    if geo:
+                        proxy.update(country=geo["country"], timezone=geo["timezone"], language=geo["language"])
+                else:
+                    proxy.update(status="dead", latency_ms=None, error=result["error"],
+                                 fail_count=proxy.get("fail_count", 0) + 1)
+            self._saver.schedule()
+
+    # 自动分配：优先选健康且绑定数最少的代理
+    def pick(self, bound_counts):
+        with self._lock:
+            candidates = [p_id for p_id, p in self.proxies.items() if p.get("status") != "dead"]
+            if not candidates:
+                return None
+            return min(candidates, key=lambda p_id: (self.proxies[p_id].get("status") != "ok",
+                                                     bound_counts.get(p_id, 0),
+                                                     self.proxies[p_id].get("latency_ms") or 0))
+
+
+def proxy_server_arg(proxy):
+    # Chromium 的 --proxy-server 只接受 scheme://host:port
+    return f'--proxy-server={proxy["scheme"]}://{proxy["host"]}:{proxy["port"]}'
+
+
+# 按代理检测结果修正指纹：WebRTC IP 对齐出口 IP，已知地区时同步时区和语言
+def align_config_to_proxy(config, proxy):
+    config = dict(config)
+    config["proxy_id"] = proxy["id"]
+    if proxy.get("egress_ip"):
+        config["webrtc_ip"] = proxy["egress_ip"]
+    if proxy.get("timezone"):
+        config["timezone"] = proxy["timezone"]
+    if proxy.get("language"):
+        config["language"] = proxy["language"]
+    return config
+
+
+# 通过代理请求 PROXY_CHECK_URL（仅 http），返回出口 IP 和耗时；支持 PROXY_SCHEMES 中的全部协议，
+# https 代理与代理之间走 TLS，socks4 用 4a 扩展把域名交给代理解析
+async def check_proxy(proxy, check_url, timeout):
+    target = urllib.parse.urlsplit(check_url)
+    target_port = target.port or 80
+    path = target.path or "/"
+    if target.query:
+        path += "?" + target.query
+    started = time.perf_counter()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(proxy["host"], proxy["port"], ssl=proxy["scheme"] == "https" or None), timeout)
+        is_socks = proxy["scheme"] in ("socks4", "socks5")
+        if is_socks:
+            connect = socks5_connect if proxy["scheme"] == "socks5" else socks4_connect
+            await asyncio.wait_for(connect(reader, writer, proxy, target.hostname, target_port), timeout)
+            request_target = path
+        else:
+            request_target = check_url
+        headers = [f"GET {request_target} HTTP/1.1", f"Host: {target.hostname}", "Connection: close",
+                   "User-Agent: fpm-proxy-check"]
+        if not is_socks and proxy.get("username"):
+            token = base64.b64encode(f'{proxy["username"]}:{proxy["password"]}'.encode()).decode()
+            headers.append(f"Proxy-Authorization: Basic {token}")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(65536), timeout)
+        head, _, body = response.partition(b"\r\n\r\n")
+        status_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+        status = status_line.split(" ")
+        if len(status) < 2 or status[1] != "200":
+            return {"ok": False, "error": status_line or "空响应", "latency_ms": None, "egress_ip": None}
+        return {"ok": True, "error": None, "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                "egress_ip": parse_egress_ip(body)}
+    except (OSError, asyncio.TimeoutError, ValueError) as e:
+        return {"ok": False, "error": str(e) or type(e).__name__, "latency_ms": None, "egress_ip": None}
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def socks5_connect(reader, writer, proxy, host, port):
+    methods = b"\x00\x02" if proxy.get("username") else b"\x00"
+    writer.write(b"\x05" + bytes([len(methods)]) + methods)
+    version, method = await reader.readexactly(2)
+    if method == 0x02:
+        user, password = proxy["username"].encode(), proxy["password"].encode()
+        writer.write(b"\x01" + bytes([len(user)]) + user + bytes([len(password)]) + password)
+        if (await reader.readexactly(2))[1] != 0:
+            raise ValueError("SOCKS5 认证失败")
+    elif method != 0x00:
+        raise ValueError("SOCKS5 不接受认证方式")
+    encoded_host = host.encode()
+    writer.write(b"\x05\x01\x00\x03" + bytes([len(encoded_host)]) + encoded_host + port.to_bytes(2, "big"))
+    reply = await reader.readexactly(4)
+    if reply[1] != 0:
+        raise ValueError(f"SOCKS5 连接失败: {reply[1]}")
+    address_length = {0x01: 4, 0x04: 16}.get(reply[3])
+    if address_length is None:
+        address_length = (await reader.readexactly(1))[0]
+    await reader.readexactly(address_length + 2)
+
+
+# SOCKS4a：目标 IP 填 0.0.0.x 表示域名跟在用户 ID 后面；SOCKS4 只有用户 ID，没有密码
+async def socks4_connect(reader, writer, proxy, host, port):
+    writer.write(b"\x04\x01" + port.to_bytes(2, "big") + b"\x00\x00\x00\x01"
+                 + proxy.get("username", "").encode() + b"\x00" + host.encode() + b"\x00")
+    reply = await reader.readexactly(8)
+    if reply[1] != 0x5A:
+        raise ValueError(f"SOCKS4 连接失败: {reply[1]}")
+
+
+def parse_egress_ip(body):
+    text = body.decode("utf-8", "replace").strip()
+    if text.startswith("{"):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None
+        ip = data.get("ip") or data.get("origin") or data.get("query") if isinstance(data, dict) else None
+        text = ip.split(",")[0] if isinstance(ip, str) else ""
+    # 出口 IP 会写进 WebRTC 配置并显示在页面上，只接受合法的 IP 地址
+    try:
+        return str(ipaddress.ip_address(text.split()[0])) if text.strip() else None
+    except ValueError:
+        return None
+
 
+async def check_proxies_async(proxies, check_url=None, concurrency=None, timeout=None):
+    check_url = check_url or PROXY_CHECK_URL
+    semaphore = asyncio.Semaphore(concurrency or PROXY_CHECK_CONCURRENCY)
+    timeout = timeout or PROXY_CHECK_TIMEOUT
 
+    async def run(proxy):
+        async with semaphore:
+            return proxy["id"], await check_proxy(proxy, check_url, timeout)
+
+    return dict(await asyncio.gather(*(run(p) for p in proxies)))
+
+
+# 内置的 WebGL/时区/语言/平台列表：catalog 目录缺少对应文件时使用，
+# 用这些值创建的旧环境也始终能通过校验
 # WebGL 渲染器和供应商的合理组合
 WEBGL_CONFIGS = [
     {"vendor": "Google Inc. (NVIDIA)", "renderer": "ANGLE (NVIDIA, NVIDIA GeForce RTX 3060 Direct3D11 vs_5_0 ps_5_0, D3D11)"},
@@ -57,7 +754,10 @@ TIMEZONES = [
     "America/Anchorage", "Pacific/Honolulu", "America/Toronto", "America/Vancouver",
     "Europe/London", "Europe/Paris", "Europe/Berlin", "Europe/Moscow",
     "Asia/Tokyo", "Asia/Shanghai", "Asia/Seoul", "Asia/Singapore",
-    "Asia/Dubai", "Asia/Kolkata", "Australia/Sydney", "Pacific/Auckland"
+    "Asia/Dubai", "Asia/Kolkata", "Australia/Sydney", "Pacific/Auckland",
+    "Europe/Madrid", "Europe/Rome", "Europe/Amsterdam", "Europe/Stockholm",
+    "Europe/Warsaw", "Europe/Istanbul", "America/Sao_Paulo", "Asia/Taipei",
+    "Asia/Hong_Kong", "Asia/Riyadh"
 ]
 
 LANGUAGES = [
@@ -68,21 +768,274 @@ LANGUAGES = [
 
 PLATFORMS = ["Win32", "Linux x86_64", "MacIntel"]
 
+# 国家代码 -> (默认时区, 默认语言)，GeoIP 数据没有时区列时使用
+COUNTRY_LOCALES = {
+    "US": ("America/New_York", "en-US"), "CA": ("America/Toronto", "en-US"), "GB": ("Europe/London", "en-GB"),
+    "IE": ("Europe/Dublin", "en-GB"), "FR": ("Europe/Paris", "fr-FR"), "DE": ("Europe/Berlin", "de-DE"),
+    "AT": ("Europe/Vienna", "de-DE"), "CH": ("Europe/Zurich", "de-DE"), "ES": ("Europe/Madrid", "es-ES"),
+    "IT": ("Europe/Rome", "it-IT"), "NL": ("Europe/Amsterdam", "nl-NL"), "BE": ("Europe/Brussels", "fr-FR"),
+    "SE": ("Europe/Stockholm", "sv-SE"), "PL": ("Europe/Warsaw", "pl-PL"), "RU": ("Europe/Moscow", "ru-RU"),
+    "TR": ("Europe/Istanbul", "tr-TR"), "PT": ("Europe/Lisbon", "pt-BR"), "BR": ("America/Sao_Paulo", "pt-BR"),
+    "MX": ("America/Mexico_City", "es-ES"), "AR": ("America/Argentina/Buenos_Aires", "es-ES"),
+    "JP": ("Asia/Tokyo", "ja-JP"), "KR": ("Asia/Seoul", "ko-KR"), "CN": ("Asia/Shanghai", "zh-CN"),
+    "TW": ("Asia/Taipei", "zh-TW"), "HK": ("Asia/Hong_Kong", "zh-TW"), "SG": ("Asia/Singapore", "en-US"),
+    "IN": ("Asia/Kolkata", "hi-IN"), "AE": ("Asia/Dubai", "ar-SA"), "SA": ("Asia/Riyadh", "ar-SA"),
+    "AU": ("Australia/Sydney", "en-GB"), "NZ": ("Pacific/Auckland", "en-GB"),
+}
+
+
+# 离线 GeoIP：IPv4 区间按起始地址排序存成三个紧凑数组（起点/终点/国家索引），二分查找；
+# 首次解析 CSV 后写出同名 .bin 缓存，之后直接 frombytes 载入。若是 .mmdb 且装了 maxminddb 则用其内存映射读取
+class GeoIPDatabase:
+    CACHE_VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._mmdb = None
+        self._starts = array.array('I')
+        self._ends = array.array('I')
+        self._locations = array.array('H')
+        self._location_table = []
+        if path.endswith(".mmdb"):
+            if maxminddb is None:
+                raise RuntimeError("读取 .mmdb 需要安装 maxminddb")
+            self._mmdb = maxminddb.open_database(path, maxminddb.MODE_MMAP)
+        elif not self._load_cache():
+            self._load_csv()
+            self._write_cache()
+
+    def _cache_path(self):
+        return self.path + ".bin"
+
+    def _cache_key(self):
+        st = os.stat(self.path)
+        return f"{self.CACHE_VERSION}:{st.st_size}:{st.st_mtime_ns}"
+
+    # CSV 每行: start_ip,end_ip,country[,timezone]，兼容 DB-IP / IP2Location 的 lite 国家库，IPv6 行忽略
+    def _load_csv(self):
+        rows = []
+        table = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if len(row) < 3 or ":" in row[0]:
+                    continue
+                try:
+                    start = ipv4_to_int(row[0])
+                    end = ipv4_to_int(row[1])
+                except (OSError, ValueError):
+                    continue
+                country = row[2].strip().upper()
+                timezone = row[3].strip() if len(row) > 3 and "/" in row[3] else ""
+                key = (country, timezone)
+                if key not in table:
+                    table[key] = len(table)
+                rows.append((start, end, table[key]))
+        rows.sort()
+        self._starts = array.array('I', (r[0] for r in rows))
+        self._ends = array.array('I', (r[1] for r in rows))
+        self._locations = array.array('H', (r[2] for r in rows))
+        self._location_table = [None] * len(table)
+        for key, index in table.items():
+            self._location_table[index] = key
+
+    def _load_cache(self):
+        try:
+            with open(self._cache_path(), 'rb') as f:
+                header = json.loads(f.readline())
+                if header["key"] != self._cache_key():
+                    return False
+                count = header["count"]
+                for arr in (self._starts, self._ends, self._locations):
+                    arr.fromfile(f, count)
+                self._location_table = [tuple(item) for item in header["locations"]]
+            return True
+        except (OSError, ValueError, KeyError, EOFError):
+            self._starts, self._ends, self._locations = array.array('I'), array.array('I'), array.array('H')
+            return False
+
+    def _write_cache(self):
+        header = {"key": self._cache_key(), "count": len(self._starts), "locations": self._location_table}
+        tmp_path = self._cache_path() + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(json.dumps(header).encode('utf-8') + b"\n")
+                for arr in (self._starts, self._ends, self._locations):
+                    arr.tofile(f)
+            os.replace(tmp_path, self._cache_path())
+        except OSError:
+            traceback.print_exc()
+
+    def __len__(self):
+        return len(self._starts)
+
+    def lookup(self, ip):
+        if self._mmdb is not None:
+            record = self._mmdb.get(ip) or {}
+            country = (record.get("country") or record.get("registered_country") or {}).get("iso_code", "")
+            timezone = (record.get("location") or {}).get("time_zone", "")
+            return locale_for(country, timezone) if country else None
+        try:
+            value = ipv4_to_int(ip)
+        except (OSError, ValueError):
+            return None
+        i = bisect.bisect_right(self._starts, value) - 1
+        if i < 0 or value > self._ends[i]:
+            return None
+        country, timezone = self._location_table[self._locations[i]]
+        return locale_for(country, timezone)
+
+
+def ipv4_to_int(ip):
+    return int.from_bytes(socket.inet_aton(ip.strip()), "big")
+
+
+def locale_for(country, timezone=""):
+    default_timezone, language = COUNTRY_LOCALES.get(country, ("", ""))
+    return {"country": country, "timezone": timezone or default_timezone, "language": language}
+
+
+_geoip = None
+_geoip_lock = threading.Lock()
+
+
+# 数据库按需加载且只加载一次；没有配置数据文件时返回 None
+def get_geoip():
+    global _geoip
+    if _geoip is None:
+        with _geoip_lock:
+            if _geoip is None:
+                _geoip = GeoIPDatabase(GEOIP_FILE) if GEOIP_FILE and os.path.exists(GEOIP_FILE) else False
+    return _geoip or None
+
+
+def geo_for_ip(ip):
+    db = get_geoip()
+    return db.lookup(ip) if db is not None and ip else None
+
+
+# 带权重的指纹目录，按平台和供应商建索引；版本号是数据文件内容的哈希，前端据此判断缓存是否可用
+class FingerprintCatalog:
+    def __init__(self, platforms, webgl, timezones, languages, version):
+        self.version = version
+        self.platforms = [name for name, _ in platforms]
+        self.timezones = [name for name, _ in timezones]
+        self.languages = [name for name, _ in languages]
+        self.webgl = webgl
+        self.by_platform = {}
+        self.by_vendor = {}
+        for entry in webgl:
+            self.by_platform.setdefault(entry["platform"], []).append(entry)
+            self.by_vendor.setdefault(entry["vendor"], []).append(entry)
+        self._weights = {
+            "platforms": list(itertools.accumulate(w for _, w in platforms)),
+            "timezones": list(itertools.accumulate(w for _, w in timezones)),
+            "languages": list(itertools.accumulate(w for _, w in languages)),
+        }
+        self._webgl_weights = {platform: list(itertools.accumulate(e["weight"] for e in entries))
+                               for platform, entries in self.by_platform.items()}
+        self._webgl_weights[None] = list(itertools.accumulate(e["weight"] for e in webgl))
+        self._payload = None
+
+    def pick(self, kind):
+        return random.choices(getattr(self, kind), cum_weights=self._weights[kind])[0]
+
+    # 优先从同平台的组合里选，该平台没有数据时从全部组合里选
+    def pick_webgl(self, platform=None):
+        if platform not in self.by_platform:
+            platform = None
+        entries = self.by_platform[platform] if platform else self.webgl
+        return random.choices(entries, cum_weights=self._webgl_weights[platform])[0]
+
+    def webgl_configs(self, platform=None, vendor=None):
+        entries = self.by_platform.get(platform, []) if platform else self.by_vendor.get(vendor, []) if vendor else self.webgl
+        if platform and vendor:
+            entries = [e for e in entries if e["vendor"] == vendor]
+        return [{"vendor": e["vendor"], "renderer": e["renderer"], "platform": e["platform"]} for e in entries]
+
+    # 前端需要的全部下拉数据，只构建一次
+    def payload(self):
+        if self._payload is None:
+            self._payload = {"version": self.version, "platforms": self.platforms, "timezones": self.timezones,
+                             "languages": self.languages, "webgl_configs": self.webgl_configs()}
+        return self._payload
+
+
+def read_catalog_csv(path, columns):
+    rows = []
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if not all(row.get(c) for c in columns):
+                continue
+            weight = float(row.get("weight") or 1)
+            if weight > 0:
+                rows.append({**{c: row[c].strip() for c in columns}, "weight": weight})
+    return rows
+
+
+def load_catalog(directory=None):
+    directory = directory or CATALOG_DIR
+    digest = hashlib.sha1()
+    parts = {}
+    for kind, columns in (("platforms", ["platform"]), ("webgl", ["platform", "vendor", "renderer"]),
+                          ("timezones", ["timezone"]), ("languages", ["language"])):
+        path = os.path.join(directory, f"{kind}.csv")
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+            parts[kind] = read_catalog_csv(path, columns)
+        else:
+            digest.update(f"builtin:{kind}".encode())
+            parts[kind] = None
+    platforms = [(r["platform"], r["weight"]) for r in parts["platforms"] or ()] or [(p, 1) for p in PLATFORMS]
+    webgl = parts["webgl"] or [{"platform": "Win32", "vendor": c["vendor"], "renderer": c["renderer"], "weight": 1}
+                               for c in WEBGL_CONFIGS]
+    timezones = [(r["timezone"], r["weight"]) for r in parts["timezones"] or ()] or [(t, 1) for t in TIMEZONES]
+    languages = [(r["language"], r["weight"]) for r in parts["languages"] or ()] or [(l, 1) for l in LANGUAGES]
+    return FingerprintCatalog(platforms, webgl, timezones, languages, digest.hexdigest()[:12])
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = load_catalog()
+    return _catalog
+
+
+# 数据文件修改后重新加载，校验规则随之重新编译
+def reload_catalog():
+    global _catalog
+    catalog = load_catalog()
+    with _catalog_lock:
+        _catalog = catalog
+    config_validator.cache_clear()
+    return catalog
+
+
 used_noise_seeds = set()
 
 
+# 保留 10 位小数：6 位时取值空间只有约 9.9k 个，几千个环境后就会在这里死循环
 def generate_unique_noise():
     while True:
-        noise = round(random.uniform(0.0001, 0.01), 6)
+        noise = round(random.uniform(0.0001, 0.01), 10)
         if noise not in used_noise_seeds:
             used_noise_seeds.add(noise)
             return noise
 
 
-def generate_random_profile():
-    webgl = random.choice(WEBGL_CONFIGS)
-    return {
-        "platform": random.choice(PLATFORMS),
+# 传入 ip 时 WebRTC IP 使用该地址，并按 GeoIP 结果设置时区和语言
+def generate_random_profile(ip=None):
+    catalog = get_catalog()
+    platform = catalog.pick("platforms")
+    webgl = catalog.pick_webgl(platform)
+    profile = {
+        "platform": platform,
         "hardwareConcurrency": random.choice([2, 4, 6, 8, 10, 12, 16]),
         "deviceMemory": random.choice([2, 4, 8, 16, 32]),
         "maxTouchPoints": 0,
@@ -93,1510 +1046,2993 @@ def generate_random_profile():
         "audio_noise": generate_unique_noise(),
         "clientRects_noise": generate_unique_noise(),
         "webrtc_ip": f"{random.randint(10,192)}.{random.randint(0,255)}.{random.randint(0,255)}.{random.randint(1,254)}",
-        "timezone": random.choice(TIMEZONES),
-        "language": random.choice(LANGUAGES),
+        "timezone": catalog.pick("timezones"),
+        "language": catalog.pick("languages"),
     }
+    if ip:
+        profile["webrtc_ip"] = ip
+        geo = geo_for_ip(ip)
+        if geo:
+            profile["timezone"] = geo["timezone"] or profile["timezone"]
+            profile["language"] = geo["language"] or profile["language"]
+    return profile
 
 
-class Api:
-    def __init__(self):
-        self.profiles = load_profiles()
-        self.running_processes = {}
-        self._monitor_thread = threading.Thread(target=self._monitor_processes, daemon=True)
-        self._monitor_thread.start()
+IPV4_PATTERN = re.compile(r"(25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)(\.(25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)){3}")
 
-    def _monitor_processes(self):
-        while True:
-            to_remove = []
-            for pid, proc in self.running_processes.items():
-                if proc.poll() is not None:
-                    to_remove.append(pid)
-            for pid in to_remove:
-                del self.running_processes[pid]
-                for p_id, p_data in self.profiles.items():
-                    if p_data.get("pid") == pid:
-                        p_data["status"] = "stopped"
-                        p_data["pid"] = None
-                        save_profiles(self.profiles)
-                        break
-            time.sleep(1)
 
-    def get_profiles(self):
-        self.profiles = load_profiles()
-        # 检查运行状态
-        for p_id, p_data in self.profiles.items():
-            pid = p_data.get("pid")
-            if pid and pid in self.running_processes:
-                if self.running_processes[pid].poll() is None:
-                    p_data["status"] = "running"
-                else:
-                    p_data["status"] = "stopped"
-                    p_data["pid"] = None
-                    del self.running_processes[pid]
-            else:
-                p_data["status"] = "stopped"
-                p_data["pid"] = None
-        save_profiles(self.profiles)
-        result = []
-        for p_id, p_data in self.profiles.items():
-            result.append({**p_data, "id": p_id})
-        return result
+def _int_field(low, high):
+    def check(value):
+        if type(value) is not int:
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)) or float(value) != int(float(value)):
+                raise ValueError
+            value = int(float(value))
+        if not low <= value <= high:
+            raise ValueError
+        return value
+    check.hint = f"{low}-{high} 的整数"
+    check.low, check.high = low, high
+    return check
 
-    def get_random_profile(self):
-        return generate_random_profile()
 
-    def get_webgl_configs(self):
-        return WEBGL_CONFIGS
+def _noise_field(value):
+    if type(value) is not float:
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError
+        value = float(value)
+    if not 0 < value < 1:
+        raise ValueError
+    return value
 
-    def get_timezones(self):
-        return TIMEZONES
 
-    def get_languages(self):
-        return LANGUAGES
+_noise_field.hint = "0-1 之间的小数"
 
-    def get_platforms(self):
-        return PLATFORMS
 
-    def create_profile(self, name, config):
-        profile_id = str(uuid.uuid4())[:8]
-        user_data_dir = os.path.join(PROFILES_DIR, profile_id)
-        os.makedirs(user_data_dir, exist_ok=True)
+def _choice_field(choices, hint):
+    def check(value):
+        if value not in choices:
+            value = value.strip() if isinstance(value, str) else value
+            if value not in choices:
+                raise ValueError
+        return value
+    check.hint = hint
+    return check
 
-        profile_data = {
-            "name": name,
-            "config": config,
-            "user_data_dir": user_data_dir,
-            "status": "stopped",
-            "pid": None,
-            "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
-        }
-        self.profiles[profile_id] = profile_data
-        save_profiles(self.profiles)
-        return {"success": True, "id": profile_id}
 
-    def update_profile(self, profile_id, name, config):
-        if profile_id in self.profiles:
-            if self.profiles[profile_id].get("status") == "running":
-                return {"success": False, "error": "无法编辑正在运行的环境"}
-            self.profiles[profile_id]["name"] = name
-            self.profiles[profile_id]["config"] = config
-            save_profiles(self.profiles)
-            return {"success": True}
-        return {"success": False, "error": "环境不存在"}
+def _ip_field(value):
+    if type(value) is str and IPV4_PATTERN.fullmatch(value):
+        return value
+    return str(ipaddress.ip_address(str(value).strip()))
 
-    def delete_profile(self, profile_id):
-        if profile_id in self.profiles:
-            if self.profiles[profile_id].get("status") == "running":
-                return {"success": False, "error": "无法删除正在运行的环境，请先停止"}
-            user_data_dir = self.profiles[profile_id].get("user_data_dir", "")
-            if os.path.exists(user_data_dir):
-                import shutil
-                shutil.rmtree(user_data_dir, ignore_errors=True)
-            del self.profiles[profile_id]
-            save_profiles(self.profiles)
-            return {"success": True}
-        return {"success": False, "error": "环境不存在"}
-
-    def start_profile(self, profile_id):
-        if profile_id not in self.profiles:
-            return {"success": False, "error": "环境不存在"}
-
-        profile = self.profiles[profile_id]
-        if profile.get("status") == "running":
-            return {"success": False, "error": "环境已在运行中"}
-
-        config = profile["config"]
-        user_data_dir = profile["user_data_dir"]
-
-        args = [CHROME_PATH]
-        args.append(f'--user-data-dir={user_data_dir}')
-
-        if config.get("platform"):
-            args.append(f'--fingerprint-platform={config["platform"]}')
-        if config.get("hardwareConcurrency"):
-            args.append(f'--fingerprint-hardwareConcurrency={config["hardwareConcurrency"]}')
-        if config.get("deviceMemory"):
-            args.append(f'--fingerprint-deviceMemory={config["deviceMemory"]}')
-        if config.get("maxTouchPoints") is not None:
-            args.append(f'--fingerprint-maxTouchPoints={config["maxTouchPoints"]}')
-        if config.get("webgl_vendor"):
-            args.append(f'--fingerprint-webgl-vendor={config["webgl_vendor"]}')
-        if config.get("webgl_renderer"):
-            args.append(f'--fingerprint-webgl-renderer={config["webgl_renderer"]}')
-        if config.get("canvas_noise"):
-            args.append(f'--fingerprint-canvas-noise={config["canvas_noise"]}')
-        if config.get("webgl_noise"):
-            args.append(f'--fingerprint-webgl-noise={config["webgl_noise"]}')
-        if config.get("audio_noise"):
-            args.append(f'--fingerprint-audio-noise={config["audio_noise"]}')
-        if config.get("clientRects_noise"):
-            args.append(f'--fingerprint-clientRects-noise={config["clientRects_noise"]}')
-        if config.get("webrtc_ip"):
-            args.append(f'--fingerprint-webrtc-ip={config["webrtc_ip"]}')
-        if config.get("timezone"):
-            args.append(f'--fingerprint-timezone={config["timezone"]}')
-        if config.get("language"):
-            args.append(f'--fingerprint-language={config["language"]}')
 
-        try:
-            CREATE_NO_WINDOW = 0x08000000
-            proc = subprocess.Popen(args, creationflags=CREATE_NO_WINDOW)
-            pid = proc.pid
-            self.running_processes[pid] = proc
-            profile["status"] = "running"
-            profile["pid"] = pid
-            save_profiles(self.profiles)
-            return {"success": True, "pid": pid}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+_ip_field.hint = "IP 地址"
 
-    def stop_profile(self, profile_id):
-        if profile_id not in self.profiles:
-            return {"success": False, "error": "环境不存在"}
 
-        profile = self.profiles[profile_id]
-        pid = profile.get("pid")
+def _text_field(value):
+    if not isinstance(value, str):
+        raise ValueError
+    return value.strip()
 
-        if pid and pid in self.running_processes:
-            proc = self.running_processes[pid]
-            try:
-                proc.terminate()
-                try:
-                    proc.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    proc.kill()
-                del self.running_processes[pid]
-            except Exception:
-                pass
 
-        profile["status"] = "stopped"
-        profile["pid"] = None
-        save_profiles(self.profiles)
-        return {"success": True}
+_text_field.hint = "字符串"
 
-    def get_profile_detail(self, profile_id):
-        if profile_id in self.profiles:
-            return {**self.profiles[profile_id], "id": profile_id}
-        return None
 
+def _limits_field(value):
+    if not isinstance(value, dict):
+        raise ValueError
+    return normalize_limits(value)
 
-HTML = """
-<!DOCTYPE html>
-<html lang="zh-CN">
-<head>
-<meta charset="UTF-8">
-<meta name="viewport" content="width=device-width, initial-scale=1.0">
-<title>指纹浏览器管理器</title>
-<style>
-*, *::before, *::after { margin:0; padding:0; box-sizing:border-box; }
-
-:root {
-    --bg: #0f1117;
-    --bg2: #1a1d27;
-    --bg3: #242836;
-    --bg4: #2d3245;
-    --accent: #6c5ce7;
-    --accent2: #a29bfe;
-    --accent3: #7c6ff7;
-    --green: #00b894;
-    --green2: #55efc4;
-    --red: #e17055;
-    --red2: #ff7675;
-    --yellow: #fdcb6e;
-    --text: #e8e8ed;
-    --text2: #a0a3b1;
-    --text3: #6c7086;
-    --border: #2d3245;
-    --shadow: 0 8px 32px rgba(0,0,0,0.3);
-    --radius: 16px;
-    --radius-sm: 10px;
-    --transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1);
-}
 
-body {
-    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', system-ui, sans-serif;
-    background: var(--bg);
-    color: var(--text);
-    min-height: 100vh;
-    overflow-x: hidden;
-}
+_limits_field.hint = "memory_mb / cpu_percent / pids"
 
-/* Scrollbar */
-::-webkit-scrollbar { width: 6px; }
-::-webkit-scrollbar-track { background: transparent; }
-::-webkit-scrollbar-thumb { background: var(--bg4); border-radius: 3px; }
-::-webkit-scrollbar-thumb:hover { background: var(--accent); }
-
-/* Header */
-.header {
-    background: linear-gradient(135deg, var(--bg2) 0%, var(--bg3) 100%);
-    border-bottom: 1px solid var(--border);
-    padding: 20px 32px;
-    display: flex;
-    align-items: center;
-    justify-content: space-between;
-    position: sticky;
-    top: 0;
-    z-index: 100;
-    backdrop-filter: blur(20px);
-}
 
-.header-left {
-    display: flex;
-    align-items: center;
-    gap: 14px;
-}
-
-.logo {
-    width: 42px;
-    height: 42px;
-    background: linear-gradient(135deg, var(--accent), var(--accent2));
-    border-radius: 12px;
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    font-size: 20px;
-    box-shadow: 0 4px 15px rgba(108,92,231,0.3);
-}
-
-.header h1 {
-    font-size: 22px;
-    font-weight: 700;
-    background: linear-gradient(135deg, var(--text), var(--accent2));
-    -webkit-background-clip: text;
-    -webkit-text-fill-color: transparent;
-}
-
-.header-right {
-    display: flex;
-    align-items: center;
-    gap: 12px;
-}
-
-.stats {
-    display: flex;
-    gap: 20px;
-    margin-right: 16px;
-}
-
-.stat-item {
-    display: flex;
-    align-items: center;
-    gap: 6px;
-    font-size: 13px;
-    color: var(--text2);
-}
-
-.stat-dot {
-    width: 8px;
-    height: 8px;
-    border-radius: 50%;
-}
-
-.stat-dot.green { background: var(--green); box-shadow: 0 0 8px var(--green); }
-.stat-dot.gray { background: var(--text3); }
-
-/* Buttons */
-.btn {
-    display: inline-flex;
-    align-items: center;
-    gap: 8px;
-    padding: 10px 20px;
-    border: none;
-    border-radius: var(--radius-sm);
-    font-size: 14px;
-    font-weight: 600;
-    cursor: pointer;
-    transition: var(--transition);
-    outline: none;
-    white-space: nowrap;
-}
-
-.btn-primary {
-    background: linear-gradient(135deg, var(--accent), var(--accent3));
-    color: white;
-    box-shadow: 0 4px 15px rgba(108,92,231,0.3);
-}
-.btn-primary:hover {
-    transform: translateY(-2px);
-    box-shadow: 0 6px 20px rgba(108,92,231,0.4);
-}
-
-.btn-success {
-    background: linear-gradient(135deg, var(--green), #00d2a0);
-    color: white;
-    box-shadow: 0 4px 15px rgba(0,184,148,0.3);
-}
-.btn-success:hover {
-    transform: translateY(-2px);
-    box-shadow: 0 6px 20px rgba(0,184,148,0.4);
-}
-
-.btn-danger {
-    background: linear-gradient(135deg, var(--red), var(--red2));
-    color: white;
-}
-.btn-danger:hover { transform: translateY(-2px); }
+# 按当前的平台/WebGL/时区/语言列表编译一次后缓存，返回三部分：
+#   字段 -> 校验函数：返回规范化后的值（例如 "8" -> 8），不合法时抛 ValueError
+#   字段 -> 快速判断：只认已规范化的值，批量检查已存储的配置时用，不通过再走完整校验
+#   供应商 -> 渲染器集合
+# 取值范围是指纹目录与内置列表的并集；时区还接受 GeoIP/代理对齐可能写入的 IANA 时区
+@functools.lru_cache(maxsize=None)
+def config_validator():
+    catalog = get_catalog()
+    timezones = set(TIMEZONES) | set(catalog.timezones) | {tz for tz, _ in COUNTRY_LOCALES.values()}
+    if zoneinfo is not None:
+        timezones |= zoneinfo.available_timezones()
+    renderers = {}
+    for webgl in WEBGL_CONFIGS + catalog.webgl:
+        renderers.setdefault(webgl["vendor"], set()).add(webgl["renderer"])
+    choices = {
+        "platform": frozenset(PLATFORMS) | set(catalog.platforms),
+        "webgl_vendor": frozenset(renderers),
+        "webgl_renderer": frozenset().union(*renderers.values()),
+        "timezone": frozenset(timezones),
+        "language": frozenset(LANGUAGES) | set(catalog.languages) | {lang for _, lang in COUNTRY_LOCALES.values()},
+        "display_mode": frozenset(DISPLAY_MODES),
+    }
+    fields = {
+        "platform": _choice_field(choices["platform"], "平台列表中的值"),
+        "hardwareConcurrency": _int_field(1, 256),
+        "deviceMemory": _int_field(1, 1024),
+        "maxTouchPoints": _int_field(0, 20),
+        "webgl_vendor": _choice_field(choices["webgl_vendor"], "WebGL 配置中的供应商"),
+        "webgl_renderer": _choice_field(choices["webgl_renderer"], "WebGL 配置中的渲染器"),
+        "canvas_noise": _noise_field,
+        "webgl_noise": _noise_field,
+        "audio_noise": _noise_field,
+        "clientRects_noise": _noise_field,
+        "webrtc_ip": _ip_field,
+        "timezone": _choice_field(choices["timezone"], "IANA 时区"),
+        "language": _choice_field(choices["language"], "语言列表中的值"),
+        "proxy_id": _text_field,
+        "display_mode": _choice_field(choices["display_mode"], "/".join(DISPLAY_MODES)),
+        "limits": _limits_field,
+    }
+    fast = {key: values.__contains__ for key, values in choices.items()}
+    for key in ("hardwareConcurrency", "deviceMemory", "maxTouchPoints"):
+        fast[key] = lambda v, low=fields[key].low, high=fields[key].high: type(v) is int and low <= v <= high
+    for key in ("canvas_noise", "webgl_noise", "audio_noise", "clientRects_noise"):
+        fast[key] = lambda v: type(v) is float and 0 < v < 1
+    fast["webrtc_ip"] = lambda v: type(v) is str and IPV4_PATTERN.fullmatch(v) is not None
+    fast["proxy_id"] = lambda v: type(v) is str
+    return fields, fast, {vendor: frozenset(names) for vendor, names in renderers.items()}
+
+
+# 返回 (规范化后的配置, 错误列表)；值为 None 或空串的字段视为未设置并去掉
+def normalize_config(config):
+    if not isinstance(config, dict):
+        return None, ["配置必须是对象"]
+    fields, _, renderers = config_validator()
+    result = {}
+    errors = []
+    for key, value in config.items():
+        check = fields.get(key)
+        if check is None:
+            errors.append(f"{key}: 未知字段")
+            continue
+        if value is None or value == "":
+            continue
+        try:
+            result[key] = check(value)
+        except (ValueError, TypeError, OverflowError):
+            errors.append(f"{key}: 应为{check.hint}")
+    vendor, renderer = result.get("webgl_vendor"), result.get("webgl_renderer")
+    if vendor and renderer and renderer not in renderers[vendor]:
+        errors.append("webgl_renderer: 与 webgl_vendor 不匹配")
+    return result, errors
 
-.btn-ghost {
-    background: var(--bg3);
-    color: var(--text2);
-    border: 1px solid var(--border);
-}
-.btn-ghost:hover {
-    background: var(--bg4);
-    color: var(--text);
-    border-color: var(--accent);
-}
 
-.btn-sm {
-    padding: 6px 14px;
-    font-size: 12px;
-    border-radius: 8px;
-}
+# 返回错误列表。已规范化的配置全部走快速判断，十万个环境的一次检查远低于一秒
+def validate_config(config):
+    if type(config) is dict:
+        _, fast, renderers = config_validator()
+        for key, value in config.items():
+            ok = fast.get(key)
+            if ok is None or not ok(value):
+                break
+        else:
+            vendor = config.get("webgl_vendor")
+            if not vendor or config.get("webgl_renderer") in renderers[vendor] or "webgl_renderer" not in config:
+                return []
+    return normalize_config(config)[1]
 
-.btn-icon {
-    width: 36px;
-    height: 36px;
-    padding: 0;
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    border-radius: 10px;
-}
 
-/* Main Content */
-.main {
-    padding: 28px 32px;
-    max-width: 1600px;
-    margin: 0 auto;
-}
+# 环境 ID = 12 位十六进制毫秒时间戳 + 8 位随机后缀，按字符串排序即按创建时间排序；
+# 后缀作为界面显示和查找用的短 ID。旧版 8 位 ID 保持不变，短 ID 就是它本身
+PROFILE_ALIAS_LENGTH = 8
 
-/* Search Bar */
-.toolbar {
-    display: flex;
-    align-items: center;
-    gap: 12px;
-    margin-bottom: 24px;
-}
 
-.search-box {
-    flex: 1;
-    position: relative;
-}
+# 合法的环境 ID：旧版 8 位或新版 20 位小写十六进制。ID 会拼进目录路径和前端的 onclick，
+# 外部来源（例如导入的归档）的 ID 不符合时一律重新分配
+PROFILE_ID_PATTERN = re.compile(r"[0-9a-f]{8}|[0-9a-f]{20}")
 
-.search-box input {
-    width: 100%;
-    padding: 12px 16px 12px 44px;
-    background: var(--bg2);
-    border: 1px solid var(--border);
-    border-radius: var(--radius-sm);
-    color: var(--text);
-    font-size: 14px;
-    transition: var(--transition);
-    outline: none;
-}
 
-.search-box input:focus {
-    border-color: var(--accent);
-    box-shadow: 0 0 0 3px rgba(108,92,231,0.15);
-}
+def profile_alias(profile_id):
+    return profile_id[-PROFILE_ALIAS_LENGTH:]
 
-.search-box input::placeholder { color: var(--text3); }
 
-.search-box .search-icon {
-    position: absolute;
-    left: 14px;
-    top: 50%;
-    transform: translateY(-50%);
-    color: var(--text3);
-    font-size: 16px;
-}
-
-/* Grid */
-.grid {
-    display: grid;
-    grid-template-columns: repeat(auto-fill, minmax(340px, 1fr));
-    gap: 20px;
-}
+# 由 Api 在全局锁内调用。时间戳不随系统时钟回拨而倒退，同一毫秒内的 ID 之间顺序随机；
+# 随机后缀与现有短 ID 冲突时重新抽取，所以短 ID 和完整 ID 都不会重复
+class ProfileIdAllocator:
+    def __init__(self):
+        self._last_ms = 0
 
-/* Card */
-.card {
-    background: var(--bg2);
-    border: 1px solid var(--border);
-    border-radius: var(--radius);
-    padding: 22px;
-    transition: var(--transition);
-    position: relative;
-    overflow: hidden;
-}
+    def allocate(self, profiles, aliases):
+        self._last_ms = max(int(time.time() * 1000), self._last_ms)
+        while True:
+            alias = os.urandom(PROFILE_ALIAS_LENGTH // 2).hex()
+            profile_id = f"{self._last_ms:012x}{alias}"
+            if alias not in aliases and profile_id not in profiles:
+                return profile_id
 
-.card::before {
-    content: '';
-    position: absolute;
-    top: 0;
-    left: 0;
-    right: 0;
-    height: 3px;
-    background: linear-gradient(90deg, var(--accent), var(--accent2));
-    opacity: 0;
-    transition: var(--transition);
-}
 
-.card:hover {
-    border-color: var(--accent);
-    transform: translateY(-3px);
-    box-shadow: var(--shadow);
-}
+# 标签/分组倒排索引和短 ID 表，由 Api 在其全局锁内维护；标签/分组键统一小写
+class ProfileIndex:
+    def __init__(self):
+        self.tags = {}
+        self.groups = {}
+        self.aliases = {}
+
+    def add(self, profile_id, profile):
+        for tag in profile.get("tags") or ():
+            self.tags.setdefault(tag, set()).add(profile_id)
+        self.groups.setdefault((profile.get("group") or "").lower(), set()).add(profile_id)
+        self.aliases[profile_alias(profile_id)] = profile_id
+
+    def remove(self, profile_id, profile):
+        if self.aliases.get(profile_alias(profile_id)) == profile_id:
+            del self.aliases[profile_alias(profile_id)]
+        for index, keys in ((self.tags, profile.get("tags") or ()),
+                            (self.groups, [(profile.get("group") or "").lower()])):
+            for key in keys:
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(profile_id)
+                    if not ids:
+                        del index[key]
+
+    def rebuild(self, profiles):
+        self.tags.clear()
+        self.groups.clear()
+        self.aliases.clear()
+        for profile_id, profile in profiles.items():
+            self.add(profile_id, profile)
+
+
+def config_delta(old, new):
+    delta = {}
+    changed = {k: v for k, v in new.items() if k not in old or old[k] != v}
+    removed = [k for k in old if k not in new]
+    if changed:
+        delta["set"] = changed
+    if removed:
+        delta["unset"] = removed
+    return delta
+
+
+def apply_config_delta(config, record):
+    if "full" in record:
+        return dict(record["full"])
+    config = {k: v for k, v in config.items() if k not in record.get("unset", ())}
+    config.update(record.get("set", {}))
+    return config
+
+
+# 配置历史：HISTORY_DIR/ab/<id>.jsonl，第一行是完整快照，之后每行只记相对上一版本的改动。
+# 行数超过 2 倍保留数时把较早的版本折叠成新的快照，每次追加的均摊成本不变。
+# 调用方持有对应环境的锁，这里的锁只保护版本号缓存
+class ConfigHistory:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
 
-.card:hover::before { opacity: 1; }
+    def path(self, profile_id):
+        digest = hashlib.sha1(profile_id.encode('utf-8')).hexdigest()
+        return os.path.join(HISTORY_DIR, digest[:2], f"{profile_id}.jsonl")
 
-.card-header {
-    display: flex;
-    align-items: center;
-    justify-content: space-between;
-    margin-bottom: 16px;
-}
+    # 写到一半崩溃留下的残行直接跳过
+    def read(self, profile_id):
+        records = []
+        try:
+            with open(self.path(profile_id), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        pass
+        except FileNotFoundError:
+            pass
+        return records
+
+    # [最新版本号, 文件行数]，每个环境只在第一次修改时读一遍文件
+    def _meta_for(self, profile_id):
+        with self._lock:
+            meta = self._meta.get(profile_id)
+        if meta is None:
+            records = self.read(profile_id)
+            meta = [records[-1]["v"], len(records)] if records else [0, 0]
+            with self._lock:
+                self._meta[profile_id] = meta
+        return meta
+
+    # 还没有历史时先把修改前的配置记为第 1 版（时间取环境的创建时间），返回新版本号
+    def record(self, profile_id, previous, config, created_at=None):
+        delta = config_delta(previous or {}, config)
+        if not delta:
+            return None
+        meta = self._meta_for(profile_id)
+        records = []
+        if meta[0] == 0:
+            records.append({"v": 1, "at": created_at, "full": previous or {}})
+            meta[0] = meta[1] = 1
+        meta[0] += 1
+        meta[1] += 1
+        records.append({"v": meta[0], "at": time.strftime("%Y-%m-%d %H:%M:%S"), **delta})
+        path = self.path(profile_id)
+        text = "".join(json.dumps(r, ensure_ascii=False, separators=(',', ':')) + "\n" for r in records)
+        try:
+            f = open(path, 'a', encoding='utf-8')
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = open(path, 'a', encoding='utf-8')
+        with f:
+            f.write(text)
+        if meta[1] > 2 * HISTORY_KEEP_VERSIONS:
+            self.compact(profile_id)
+        return meta[0]
+
+    def compact(self, profile_id):
+        records = self.read(profile_id)
+        if len(records) <= HISTORY_KEEP_VERSIONS:
+            return
+        config = {}
+        for record in records[:-HISTORY_KEEP_VERSIONS + 1]:
+            config = apply_config_delta(config, record)
+        base = records[-HISTORY_KEEP_VERSIONS]
+        kept = [{"v": base["v"], "at": base["at"], "full": config}] + records[-HISTORY_KEEP_VERSIONS + 1:]
+        write_file_atomic(self.path(profile_id),
+                          "".join(json.dumps(r, ensure_ascii=False, separators=(',', ':')) + "\n" for r in kept))
+        self._meta_for(profile_id)[1] = len(kept)
+
+    # 返回 version 时的完整配置；版本不存在或已被压缩时返回 None
+    def config_at(self, profile_id, version):
+        config = None
+        for record in self.read(profile_id):
+            if record["v"] > version:
+                break
+            config = apply_config_delta(config or {}, record)
+            if record["v"] == version:
+                return config
+        return None
 
-.card-title-group {
-    display: flex;
-    align-items: center;
-    gap: 12px;
-    flex: 1;
-    min-width: 0;
-}
+    def remove(self, profile_id):
+        with self._lock:
+            self._meta.pop(profile_id, None)
+        try:
+            os.remove(self.path(profile_id))
+        except FileNotFoundError:
+            pass
+
+
+def normalize_tags(tags):
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    result = []
+    for tag in tags or ():
+        # 标签会出现在筛选表达式里，只保留字母数字、下划线、点和连字符
+        tag = re.sub(r"[^\w.-]+", "-", str(tag).strip().lower()).strip("-")
+        if tag and tag not in result:
+            result.append(tag)
+    return result
+
+
+# 筛选表达式：空格分隔的条件取交集，如 "tag:shop-eu status:stopped"；
+# 同一条件内逗号表示任一（tag:a,b），前缀 - 表示取反，不带冒号的词匹配名称或 ID
+SELECTOR_KEYS = ("tag", "group", "status", "name", "id", "proxy", "platform")
+
+
+def parse_selector(selector):
+    terms = []
+    for token in (selector or "").split():
+        negate = token.startswith("-") and len(token) > 1
+        if negate:
+            token = token[1:]
+        key, sep, value = token.partition(":")
+        if not sep:
+            key, value = "text", token
+        elif key not in SELECTOR_KEYS:
+            raise ValueError(f"未知的筛选条件: {key}")
+        terms.append((key, [v for v in value.lower().split(",") if v] or [""], negate))
+    return terms
+
+
+def selector_term_matches(key, values, profile_id, profile):
+    config = profile.get("config") or {}
+    if key == "tag":
+        return any(v in (profile.get("tags") or ()) for v in values)
+    if key == "group":
+        return (profile.get("group") or "").lower() in values
+    if key == "status":
+        return profile.get("status", "stopped") in values
+    if key == "name":
+        return any(v in profile.get("name", "").lower() for v in values)
+    if key == "id":
+        return any(profile_id.lower().startswith(v) or profile_alias(profile_id).startswith(v) for v in values)
+    if key == "proxy":
+        return (config.get("proxy_id") or "none").lower() in values
+    if key == "platform":
+        return (config.get("platform") or "").lower() in values
+    return values[0] in profile.get("name", "").lower() or values[0] in profile_id.lower()
+
+
+BULK_BATCH_SIZE = 200
+BULK_ACTIONS = ("start", "stop", "delete", "export", "update", "tag", "untag", "group")
+# 各批量操作必须在 params 里提供的参数
+BULK_REQUIRED_PARAMS = {"export": ("path",), "update": ("field", "value"), "tag": ("tags",), "untag": ("tags",)}
+
+
+# 计划任务：cron 表达式或固定间隔触发，对筛选表达式匹配的环境执行启动/停止/轮换。
+# 所有待执行事件放在一个最小堆里，调度线程只需等待堆顶到期；受全局最大运行数和分组配额约束
+SCHEDULE_ACTIONS = ("start", "stop", "rotate")
+SCHEDULE_HISTORY_SIZE = 200
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(","):
+        expr, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if expr == "*":
+            start, end = low, high
+        elif "-" in expr:
+            start, end = (int(x) for x in expr.split("-", 1))
+        else:
+            start = end = int(expr)
+            if step > 1:
+                end = high
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"cron 字段超出范围: {part}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+# 标准 5 段 cron：分 时 日 月 周（0 = 周日）；日和周都被限定时满足其一即可
+def parse_cron(expr):
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError("cron 表达式需要 5 段：分 时 日 月 周")
+    parsed = [parse_cron_field(f, low, high) for f, (low, high) in zip(fields, CRON_FIELDS)]
+    parsed[4] = {d % 7 for d in parsed[4]}
+    parsed.append((fields[2] != "*", fields[4] != "*"))
+    return parsed
+
+
+def cron_next(expr, after):
+    minutes, hours, days, months, weekdays, (dom_set, dow_set) = parse_cron(expr)
+    t = datetime.datetime.fromtimestamp(after).replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+    limit = t + datetime.timedelta(days=366 * 4)
+    while t < limit:
+        if t.month not in months:
+            t = (t.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            continue
+        dom_ok = t.day in days
+        dow_ok = (t.weekday() + 1) % 7 in weekdays
+        if not ((dom_ok or dow_ok) if dom_set and dow_set else (dom_ok and dow_ok)):
+            t = t.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            continue
+        if t.hour not in hours:
+            t = t.replace(minute=0) + datetime.timedelta(hours=1)
+            continue
+        if t.minute not in minutes:
+            t += datetime.timedelta(minutes=1)
+            continue
+        return t.timestamp()
+    return None
+
+
+def job_next_run(job, after):
+    trigger = job["trigger"]
+    if trigger["type"] == "interval":
+        return after + max(1, float(trigger["seconds"]))
+    return cron_next(trigger["expr"], after)
+
+
+DISPLAY_MODES = ("headed", "headless", "xvfb")
+# 环境没有单独设置 display_mode 时使用的显示方式；服务器上通常设为 headless 或 xvfb
+DEFAULT_DISPLAY_MODE = os.environ.get("FPM_DISPLAY_MODE", "headed")
+# Xvfb 虚拟屏幕的分辨率和色深
+XVFB_SCREEN = os.environ.get("FPM_XVFB_SCREEN", "1920x1080x24")
+
+
+class XvfbDisplay:
+    def __init__(self):
+        self.proc = None
+        self.number = None
 
-.card-avatar {
-    width: 42px;
-    height: 42px;
-    border-radius: 12px;
-    background: linear-gradient(135deg, var(--accent), var(--accent2));
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    font-weight: 700;
-    font-size: 16px;
-    color: white;
-    flex-shrink: 0;
-}
+    @property
+    def name(self):
+        return f":{self.number}"
 
-.card-name {
-    font-size: 16px;
-    font-weight: 600;
-    white-space: nowrap;
-    overflow: hidden;
-    text-overflow: ellipsis;
-}
+    # -displayfd 让 Xvfb 自己挑一个空闲的显示号并在就绪后写回管道，避免和其他 X server 抢号
+    def start(self, timeout=10):
+        import select
 
-.card-id {
-    font-size: 11px;
-    color: var(--text3);
-    font-family: monospace;
-}
+        read_fd, write_fd = os.pipe()
+        try:
+            self.proc = subprocess.Popen(["Xvfb", "-displayfd", str(write_fd), "-screen", "0", XVFB_SCREEN,
+                                          "-nolisten", "tcp"], pass_fds=(write_fd,), start_new_session=True,
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            os.close(write_fd)
+            write_fd = None
+            data = b""
+            deadline = time.monotonic() + timeout
+            while not data.endswith(b"\n") and time.monotonic() < deadline:
+                ready, _, _ = select.select([read_fd], [], [], deadline - time.monotonic())
+                if not ready:
+                    break
+                chunk = os.read(read_fd, 16)
+                if not chunk:
+                    break
+                data += chunk
+            if not data.strip().isdigit():
+                self.stop()
+                raise RuntimeError("Xvfb 启动失败")
+            self.number = int(data)
+            return self
+        finally:
+            os.close(read_fd)
+            if write_fd is not None:
+                os.close(write_fd)
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+# 虚拟显示池：启动时预先拉起这么多个 Xvfb，常驻复用
+XVFB_POOL_SIZE = int(os.environ.get("FPM_XVFB_POOL_SIZE", "0"))
+# 每个虚拟显示上最多同时运行的浏览器数
+XVFB_DISPLAY_CAPACITY = int(os.environ.get("FPM_XVFB_DISPLAY_CAPACITY", "4"))
+# 虚拟显示总数上限，0 表示不限；超出预启动数量的显示按需启动，空闲后关闭
+XVFB_MAX_DISPLAYS = int(os.environ.get("FPM_XVFB_MAX_DISPLAYS", "0"))
+
+
+class DisplayPool:
+    def __init__(self, size=None, capacity=None, max_displays=None):
+        self.size = XVFB_POOL_SIZE if size is None else size
+        self.capacity = max(1, XVFB_DISPLAY_CAPACITY if capacity is None else capacity)
+        self.max_displays = XVFB_MAX_DISPLAYS if max_displays is None else max_displays
+        self._lock = threading.Lock()
+        # [{"display": XvfbDisplay, "load": int, "pinned": bool, "assigned": int}]
+        self.slots = []
+
+    def prespawn(self):
+        for _ in range(self.size):
+            try:
+                display = XvfbDisplay().start()
+            except (OSError, RuntimeError) as e:
+                print(f"[display] 无法预启动 Xvfb: {e}")
+                return
+            with self._lock:
+                self.slots.append({"display": display, "load": 0, "pinned": True, "assigned": 0})
+
+    # 选负载最低且未满的显示；Xvfb 意外退出的常驻显示在这里重新拉起
+    def acquire(self):
+        with self._lock:
+            candidates = sorted((s for s in self.slots if s["load"] < self.capacity), key=lambda s: s["load"])
+            for slot in candidates:
+                if slot["display"] is not None and slot["display"].proc.poll() is None:
+                    slot["load"] += 1
+                    slot["assigned"] += 1
+                    return slot["display"]
+            dead = next((s for s in candidates if s["pinned"] and s["load"] == 0 and s["display"] is not None), None)
+            if dead is None and self.max_displays and len(self.slots) >= self.max_displays:
+                raise RuntimeError("没有空闲的虚拟显示")
+            # 先占位再在锁外启动 Xvfb，避免并发启动时超出上限
+            slot = dead or {"display": None, "load": 0, "pinned": False, "assigned": 0}
+            slot["load"] += 1
+            slot["assigned"] += 1
+            if dead is None:
+                self.slots.append(slot)
+        try:
+            display = XvfbDisplay().start()
+        except Exception:
+            with self._lock:
+                slot["load"] -= 1
+                if not slot["pinned"]:
+                    self.slots.remove(slot)
+            raise
+        slot["display"] = display
+        return display
+
+    def release(self, display):
+        with self._lock:
+            slot = next((s for s in self.slots if s["display"] is display), None)
+            if slot is None:
+                return
+            slot["load"] = max(0, slot["load"] - 1)
+            idle = slot["load"] == 0 and not slot["pinned"]
+            if idle:
+                self.slots.remove(slot)
+        if idle:
+            display.stop()
+
+    def report(self):
+        with self._lock:
+            return [{"display": s["display"].name if s["display"] and s["display"].number is not None else None,
+                     "pid": s["display"].proc.pid if s["display"] and s["display"].proc else None,
+                     "alive": bool(s["display"] and s["display"].proc and s["display"].proc.poll() is None),
+                     "load": s["load"], "capacity": self.capacity, "pinned": s["pinned"],
+                     "assigned_total": s["assigned"]} for s in self.slots]
+
+    def shutdown(self):
+        with self._lock:
+            displays = [s["display"] for s in self.slots if s["display"] is not None]
+            self.slots = []
+        for display in displays:
+            display.stop()
+
+
+# 可选：cgroup v2 资源限制的父目录，需要是当前用户可写、已委派（Delegate=yes）的 cgroup，
+# 例如 systemd-run --user --scope -p Delegate=yes 下的目录；留空则不启用
+CGROUP_ROOT = os.environ.get("FPM_CGROUP_ROOT", "")
+CGROUP_CONTROLLERS = ("memory", "cpu", "pids")
+# 监控线程每隔这么多秒读取一次各环境 cgroup 的统计，检测触发上限的事件
+CGROUP_POLL_SECONDS = 5
+RESOURCE_LIMIT_KEYS = ("memory_mb", "cpu_percent", "pids")
+RESOURCE_EVENT_KINDS = ("memory_max_hits", "oom_kills", "pids_max_hits", "cpu_throttled")
+RESOURCE_EVENT_INTERVAL = 60
+
+
+# 空值表示不限制；cpu_percent 以单核为 100
+def normalize_limits(limits):
+    result = {}
+    for key in RESOURCE_LIMIT_KEYS:
+        value = (limits or {}).get(key)
+        if value in (None, "", 0):
+            continue
+        value = float(value) if key == "cpu_percent" else int(value)
+        if value <= 0:
+            raise ValueError(f"{key} 必须大于 0")
+        result[key] = value
+    return result
+
+
+class CgroupManager:
+    def __init__(self, root=None):
+        self.root = CGROUP_ROOT if root is None else root
+
+    @property
+    def available(self):
+        return bool(self.root) and sys.platform.startswith("linux") and \
+            os.path.exists(os.path.join(self.root, "cgroup.controllers"))
+
+    @staticmethod
+    def _write(path, name, value):
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(str(value))
+
+    @staticmethod
+    def _read(path, name):
+        try:
+            with open(os.path.join(path, name), 'r') as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    def _enable_controllers(self, path):
+        available = self._read(path, "cgroup.controllers").split()
+        wanted = " ".join(f"+{c}" for c in CGROUP_CONTROLLERS if c in available)
+        if wanted:
+            self._write(path, "cgroup.subtree_control", wanted)
+
+    def _apply(self, path, limits):
+        self._write(path, "memory.max", limits["memory_mb"] * 1024 * 1024 if "memory_mb" in limits else "max")
+        self._write(path, "cpu.max", f"{int(limits['cpu_percent'] * 1000)} 100000" if "cpu_percent" in limits else "max 100000")
+        self._write(path, "pids.max", limits.get("pids", "max"))
+
+    # 有分组限制时建成 root/group-x/profile-id 两层，分组限制约束组内所有浏览器的总用量
+    def prepare(self, profile_id, group, profile_limits, group_limits):
+        if not self.available or not (profile_limits or group_limits):
+            return None
+        parent = self.root
+        self._enable_controllers(parent)
+        if group_limits:
+            parent = os.path.join(self.root, "group-" + re.sub(r"[^\w.-]", "_", group))
+            os.makedirs(parent, exist_ok=True)
+            self._apply(parent, group_limits)
+            self._enable_controllers(parent)
+        path = os.path.join(parent, f"profile-{profile_id}")
+        os.makedirs(path, exist_ok=True)
+        self._apply(path, profile_limits)
+        return path
+
+    def stats(self, path):
+        def keyed(name):
+            return {k: int(v) for k, v in (line.split() for line in self._read(path, name).splitlines() if line)}
+
+        memory_events = keyed("memory.events")
+        cpu = keyed("cpu.stat")
+        current = self._read(path, "memory.current").strip()
+        pids = self._read(path, "pids.current").strip()
+        return {"memory_bytes": int(current) if current.isdigit() else None,
+                "pids": int(pids) if pids.isdigit() else None,
+                "cpu_usage_usec": cpu.get("usage_usec"),
+                "cpu_throttled": cpu.get("nr_throttled", 0),
+                "memory_max_hits": memory_events.get("max", 0),
+                "oom_kills": memory_events.get("oom_kill", 0),
+                "pids_max_hits": keyed("pids.events").get("max", 0)}
+
+    def remove(self, path):
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
 
-.status-badge {
-    display: inline-flex;
-    align-items: center;
-    gap: 6px;
-    padding: 5px 12px;
-    border-radius: 20px;
-    font-size: 12px;
-    font-weight: 600;
-    flex-shrink: 0;
-}
 
-.status-badge.running {
-    background: rgba(0,184,148,0.12);
-    color: var(--green2);
-}
+# 启动器后端：负责找到浏览器可执行文件、按平台创建进程，以及连同子进程一起结束浏览器
+class BrowserLauncher:
+    # 只用 CHROME_PATH 指定的浏览器，不退回 PATH 里的其他 chrome，避免悄悄换成版本和指纹补丁都不同的浏览器
+    def resolve_binary(self):
+        if os.path.exists(CHROME_PATH):
+            return CHROME_PATH
+        raise FileNotFoundError(f"找不到浏览器可执行文件: {CHROME_PATH}（可用 FPM_CHROME_PATH 指定）")
 
-.status-badge.running .status-dot {
-    width: 7px;
-    height: 7px;
-    border-radius: 50%;
-    background: var(--green);
-    box-shadow: 0 0 8px var(--green);
-    animation: pulse 2s infinite;
-}
+    def popen_kwargs(self):
+        return {}
 
-.status-badge.stopped {
-    background: rgba(108,112,134,0.15);
-    color: var(--text3);
-}
+    def spawn(self, args, env=None, cgroup_path=None):
+        return subprocess.Popen([self.resolve_binary()] + args, env=env, **self.popen_kwargs())
 
-.status-badge.stopped .status-dot {
-    width: 7px;
-    height: 7px;
-    border-radius: 50%;
-    background: var(--text3);
-}
+    def terminate(self, proc):
+        proc.terminate()
 
-@keyframes pulse {
-    0%, 100% { opacity: 1; }
-    50% { opacity: 0.4; }
-}
+    def kill(self, proc):
+        proc.kill()
 
-.card-info {
-    display: grid;
-    grid-template-columns: 1fr 1fr;
-    gap: 8px;
-    margin-bottom: 18px;
-}
+    # 浏览器主进程退出后清理残留的子进程
+    def cleanup(self, proc):
+        pass
 
-.info-item {
-    display: flex;
-    flex-direction: column;
-    gap: 2px;
-}
 
-.info-label {
-    font-size: 11px;
-    color: var(--text3);
-    text-transform: uppercase;
-    letter-spacing: 0.5px;
-}
+class WindowsLauncher(BrowserLauncher):
+    CREATE_NO_WINDOW = 0x08000000
 
-.info-value {
-    font-size: 13px;
-    color: var(--text2);
-    white-space: nowrap;
-    overflow: hidden;
-    text-overflow: ellipsis;
-}
+    def popen_kwargs(self):
+        return {"creationflags": self.CREATE_NO_WINDOW}
 
-.card-actions {
-    display: flex;
-    gap: 8px;
-}
 
-.card-actions .btn { flex: 1; justify-content: center; }
-
-/* Modal */
-.modal-overlay {
-    position: fixed;
-    top: 0;
-    left: 0;
-    right: 0;
-    bottom: 0;
-    background: rgba(0,0,0,0.6);
-    backdrop-filter: blur(8px);
-    display: none;
-    align-items: center;
-    justify-content: center;
-    z-index: 1000;
-    padding: 20px;
-}
+# POSIX 下每个浏览器放在独立的会话/进程组里，停止时对整个进程组发信号，渲染进程不会残留
+class PosixLauncher(BrowserLauncher):
+    # 参数：cgroup 目录、浏览器命令行；标准输入是状态管道的写端（dash 不支持两位数的 fd 重定向）。
+    # shell 先把自己（$$）写进 cgroup.procs，在状态管道上回报 ok，把标准输入换成 /dev/null，
+    # 再 exec 成浏览器：PID 不变，浏览器派生的所有进程从一开始就在 cgroup 里。加入失败时不 exec，以 125 退出
+    CGROUP_EXEC_SHIM = ('if echo $$ > "$1/cgroup.procs"; then echo ok >&0; exec 0</dev/null; shift; exec "$@"; fi; '
+                        'exit 125')
 
-.modal-overlay.active { display: flex; }
-
-.modal {
-    background: var(--bg2);
-    border: 1px solid var(--border);
-    border-radius: 20px;
-    width: 100%;
-    max-width: 720px;
-    max-height: 85vh;
-    overflow: hidden;
-    display: flex;
-    flex-direction: column;
-    box-shadow: 0 25px 60px rgba(0,0,0,0.5);
-    animation: modalIn 0.3s ease;
-}
+    def popen_kwargs(self):
+        return {"start_new_session": True}
 
-@keyframes modalIn {
-    from { transform: scale(0.9) translateY(20px); opacity: 0; }
-    to { transform: scale(1) translateY(0); opacity: 1; }
-}
+    # 不用 preexec_fn：多线程进程里 fork 之后执行 Python 代码可能让子进程死锁
+    def spawn(self, args, env=None, cgroup_path=None):
+        if not cgroup_path:
+            return super().spawn(args, env)
+        read_fd, write_fd = os.pipe()
+        try:
+            proc = subprocess.Popen(["/bin/sh", "-c", self.CGROUP_EXEC_SHIM, "sh", cgroup_path,
+                                     self.resolve_binary()] + args,
+                                    env=env, stdin=write_fd, **self.popen_kwargs())
+        except BaseException:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        # shell 成功时关闭写端、失败时退出，两种情况下这里都会读到 EOF
+        with os.fdopen(read_fd, 'r') as status:
+            joined = status.read() == "ok\n"
+        if not joined:
+            proc.wait()
+            raise OSError(f"无法把浏览器加入 cgroup: {cgroup_path}")
+        return proc
+
+    def _signal_group(self, proc, sig):
+        try:
+            os.killpg(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
 
-.modal-header {
-    display: flex;
-    align-items: center;
-    justify-content: space-between;
-    padding: 22px 28px;
-    border-bottom: 1px solid var(--border);
-}
+    def terminate(self, proc):
+        self._signal_group(proc, signal.SIGTERM)
 
-.modal-header h2 {
-    font-size: 20px;
-    font-weight: 700;
-}
+    def kill(self, proc):
+        self._signal_group(proc, signal.SIGKILL)
 
-.modal-close {
-    width: 36px;
-    height: 36px;
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    border: none;
-    background: var(--bg3);
-    color: var(--text2);
-    border-radius: 10px;
-    cursor: pointer;
-    font-size: 18px;
-    transition: var(--transition);
-}
+    def cleanup(self, proc):
+        self._signal_group(proc, signal.SIGKILL)
 
-.modal-close:hover {
-    background: var(--red);
-    color: white;
-}
 
-.modal-body {
-    padding: 24px 28px;
-    overflow-y: auto;
-    flex: 1;
-}
+def get_launcher():
+    return WindowsLauncher() if sys.platform == 'win32' else PosixLauncher()
 
-.modal-footer {
-    display: flex;
-    justify-content: flex-end;
-    gap: 10px;
-    padding: 18px 28px;
-    border-top: 1px solid var(--border);
-}
 
-/* Form */
-.form-group {
-    margin-bottom: 18px;
-}
+# 租约：自动化任务先 acquire 拿到令牌再启动/停止环境，持有期间其他人不能启停该环境。
+# 环境被占用时按先来后到排队，租约释放或过期后直接交给队首的等待者
+LEASE_DEFAULT_TTL = float(os.environ.get("FPM_LEASE_TTL", "60"))
+LEASE_MAX_TTL = 3600
 
-.form-label {
-    display: block;
-    font-size: 13px;
-    font-weight: 600;
-    color: var(--text2);
-    margin-bottom: 6px;
-}
 
-.form-input, .form-select {
-    width: 100%;
-    padding: 10px 14px;
-    background: var(--bg);
-    border: 1px solid var(--border);
-    border-radius: var(--radius-sm);
-    color: var(--text);
-    font-size: 14px;
-    transition: var(--transition);
-    outline: none;
-}
-
-.form-input:focus, .form-select:focus {
-    border-color: var(--accent);
-    box-shadow: 0 0 0 3px rgba(108,92,231,0.15);
-}
-
-.form-select {
-    appearance: none;
-    background-image: url("data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' width='12' height='12' viewBox='0 0 12 12'%3E%3Cpath fill='%23a0a3b1' d='M6 8L1 3h10z'/%3E%3C/svg%3E");
-    background-repeat: no-repeat;
-    background-position: right 12px center;
-    padding-right: 32px;
-}
-
-.form-select option {
-    background: var(--bg2);
-    color: var(--text);
-}
-
-.form-row {
-    display: grid;
-    grid-template-columns: 1fr 1fr;
-    gap: 14px;
-}
+class LeaseManager:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.leases = {}
+        # profile_id -> deque of waiter dict，waiter 被授予租约时设置它的 event
+        self.queues = {}
+
+    def _grant(self, profile_id, holder, ttl):
+        lease = {"token": uuid.uuid4().hex, "holder": holder, "ttl": ttl,
+                 "expires_at": time.monotonic() + ttl, "acquired_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                 "started": False}
+        self.leases[profile_id] = lease
+        return lease
+
+    # 调用方需持有 _lock；把租约交给队首仍在等待的任务
+    def _hand_over(self, profile_id):
+        queue = self.queues.get(profile_id)
+        while queue:
+            waiter = queue.popleft()
+            if waiter["event"].is_set():
+                continue
+            waiter["lease"] = self._grant(profile_id, waiter["holder"], waiter["ttl"])
+            waiter["event"].set()
+            break
+        if not queue:
+            self.queues.pop(profile_id, None)
+
+    def acquire(self, profile_id, holder, ttl, wait):
+        ttl = min(max(1.0, float(ttl or LEASE_DEFAULT_TTL)), LEASE_MAX_TTL)
+        with self._lock:
+            current = self.leases.get(profile_id)
+            # 过期但浏览器仍由它启动着的租约要等监控线程停掉浏览器后再交接，这里只回收没启动过的
+            if current is not None and current["expires_at"] <= time.monotonic() and not current["started"]:
+                current = None
+                del self.leases[profile_id]
+            if current is None and not self.queues.get(profile_id):
+                return self._grant(profile_id, holder, ttl), None
+            if not wait:
+                return None, len(self.queues.get(profile_id, ()))
+            waiter = {"holder": holder, "ttl": ttl, "event": threading.Event(), "lease": None}
+            self.queues.setdefault(profile_id, collections.deque()).append(waiter)
+            if current is None:
+                self._hand_over(profile_id)
+        waiter["event"].wait(wait)
+        with self._lock:
+            # 置位后 _hand_over 会跳过这个等待者；授予和超时同时发生时以授予为准
+            waiter["event"].set()
+            if waiter["lease"] is None:
+                queue = self.queues.get(profile_id)
+                if queue and waiter in queue:
+                    queue.remove(waiter)
+                return None, len(self.queues.get(profile_id, ()))
+        return waiter["lease"], None
+
+    def heartbeat(self, profile_id, token, ttl):
+        with self._lock:
+            lease = self.leases.get(profile_id)
+            if lease is None or lease["token"] != token or lease["expires_at"] <= time.monotonic():
+                return None
+            if ttl:
+                lease["ttl"] = min(max(1.0, float(ttl)), LEASE_MAX_TTL)
+            lease["expires_at"] = time.monotonic() + lease["ttl"]
+            return lease
+
+    def release(self, profile_id, token):
+        with self._lock:
+            lease = self.leases.get(profile_id)
+            if lease is None or lease["token"] != token:
+                return None
+            del self.leases[profile_id]
+            self._hand_over(profile_id)
+            return lease
+
+    # 没有租约或令牌匹配时返回 None，否则返回拒绝原因
+    def check(self, profile_id, token):
+        with self._lock:
+            lease = self.leases.get(profile_id)
+            if lease is None or lease["expires_at"] <= time.monotonic() or lease["token"] == token:
+                return None
+            return f"环境已被 {lease['holder']} 租用"
+
+    def mark_started(self, profile_id, token):
+        with self._lock:
+            lease = self.leases.get(profile_id)
+            if lease is not None and lease["token"] == token:
+                lease["started"] = True
+
+    # 由监控线程调用：回收过期租约并交给排队者。过期时浏览器还由该租约启动着的环境，
+    # 先转给内部的回收租约，等浏览器停掉后再 release 交给排队者；返回 [(profile_id, 回收令牌)]
+    def reclaim_expired(self):
+        now = time.monotonic()
+        reclaiming = []
+        with self._lock:
+            expired = [(p_id, lease) for p_id, lease in self.leases.items() if lease["expires_at"] <= now]
+            for p_id, lease in expired:
+                if lease["started"]:
+                    reclaiming.append((p_id, self._grant(p_id, "monitor", LEASE_MAX_TTL)["token"]))
+                else:
+                    del self.leases[p_id]
+                    self._hand_over(p_id)
+        return reclaiming
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            return [{"profile_id": p_id, "holder": lease["holder"], "acquired_at": lease["acquired_at"],
+                     "expires_in": round(max(0.0, lease["expires_at"] - now), 1),
+                     "waiting": len(self.queues.get(p_id, ()))}
+                    for p_id, lease in self.leases.items()]
+
+
+class Scheduler:
+    def __init__(self, api):
+        self.api = api
+        self._cond = threading.Condition(threading.RLock())
+        self._heap = []
+        self._seq = itertools.count()
+        self.jobs = {}
+        self.settings = {"max_running": 0, "group_quotas": {}}
+        self.history = collections.deque(maxlen=SCHEDULE_HISTORY_SIZE)
+        # 由计划任务启动、尚未到期停止的环境：job_id -> [profile_id]
+        self._started = {}
+        self._saver = DebouncedSaver(self._snapshot, self._write)
+        atexit.register(self._saver.flush)
+        self._thread = None
+
+    def start(self):
+        if os.path.exists(SCHEDULE_FILE):
+            with open(SCHEDULE_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.jobs = data.get("jobs", {})
+            self.settings.update(data.get("settings", {}))
+            self.history.extend(data.get("history", []))
+        now = time.time()
+        with self._cond:
+            for job in self.jobs.values():
+                self._push_job(job, now)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _snapshot(self):
+        with self._cond:
+            return {"settings": dict(self.settings), "jobs": {j_id: dict(j) for j_id, j in self.jobs.items()},
+                    "history": list(self.history)}
+
+    def _write(self, data):
+        write_file_atomic(SCHEDULE_FILE, json.dumps(data, ensure_ascii=False, indent=2))
+
+    def _push(self, when, kind, payload):
+        heapq.heappush(self._heap, (when, next(self._seq), kind, payload))
+        self._cond.notify()
+
+    def _push_job(self, job, after):
+        job["next_run"] = job_next_run(job, after) if job.get("enabled", True) else None
+        if job["next_run"] is not None:
+            self._push(job["next_run"], "job", job["id"])
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    self._cond.wait(self._heap[0][0] - time.time() if self._heap else None)
+                when, _, kind, payload = heapq.heappop(self._heap)
+                if kind == "job":
+                    job = self.jobs.get(payload)
+                    # 任务被修改/删除后，堆里旧的条目直接丢弃
+                    if job is None or job.get("next_run") != when:
+                        continue
+                    self._push_job(job, max(when, time.time()))
+            try:
+                if kind == "job":
+                    self._execute(job, when)
+                else:
+                    self._stop_started(*payload)
+            except Exception:
+                traceback.print_exc()
+
+    def _record(self, job, when, action, done, skipped):
+        entry = {"job_id": job["id"], "name": job.get("name", ""), "action": action,
+                 "scheduled_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(when)),
+                 "ran_at": time.strftime("%Y-%m-%d %H:%M:%S"), "done": done, "skipped": skipped}
+        with self._cond:
+            job["last_run"] = entry["ran_at"]
+            self.history.append(entry)
+        self._saver.schedule()
+
+    def _execute(self, job, when):
+        try:
+            profile_ids = self.api.select_profiles(job["selector"])
+        except ValueError as e:
+            self._record(job, when, job["action"], [], {"*": str(e)})
+            return
+        done = []
+        skipped = {}
+        action = job["action"]
+        if action == "stop":
+            for p_id in profile_ids:
+                result = self.api.stop_profile(p_id)
+                (done.append(p_id) if result["success"] else skipped.__setitem__(p_id, result["error"]))
+            self._record(job, when, action, done, skipped)
+            return
+
+        if action == "rotate":
+            # 先停掉上一轮启动的环境，再从游标处继续取下一批
+            self._stop_started(job["id"])
+            if profile_ids:
+                cursor = job.get("cursor", 0) % len(profile_ids)
+                profile_ids = profile_ids[cursor:] + profile_ids[:cursor]
+        batch = int(job.get("batch") or 0) or len(profile_ids)
+        for p_id in profile_ids:
+            if len(done) >= batch:
+                break
+            reason = self._quota_exceeded(p_id)
+            if reason:
+                skipped[p_id] = reason
+                continue
+            result = self.api.start_profile(p_id)
+            if result["success"]:
+                done.append(p_id)
+            elif result.get("error") != "环境已在运行中":
+                skipped[p_id] = result["error"]
+        if action == "rotate" and profile_ids:
+            job["cursor"] = (job.get("cursor", 0) + len(done) + len(skipped)) % max(1, len(profile_ids))
+        if done:
+            with self._cond:
+                self._started.setdefault(job["id"], []).extend(done)
+                run_for = float(job.get("run_for") or 0)
+                if run_for > 0:
+                    self._push(time.time() + run_for, "stop", (job["id"], done))
+        self._record(job, when, action, done, skipped)
+
+    def _stop_started(self, job_id, profile_ids=None):
+        with self._cond:
+            started = self._started.get(job_id, [])
+            targets = [p for p in started if profile_ids is None or p in profile_ids]
+            self._started[job_id] = [p for p in started if p not in targets]
+        for p_id in targets:
+            self.api.stop_profile(p_id)
+
+    def _quota_exceeded(self, profile_id):
+        max_running = int(self.settings.get("max_running") or 0)
+        if max_running and len(self.api.running_pids()) >= max_running:
+            return f"已达到最大运行数 {max_running}"
+        profile = self.api.get_profile_detail(profile_id) or {}
+        group = (profile.get("group") or "").lower()
+        quota = int(self.settings.get("group_quotas", {}).get(group) or 0)
+        if group and quota and self.api.group_running_count(group) >= quota:
+            return f"分组 {group} 已达到配额 {quota}"
+        return None
 
-.form-section {
-    margin-bottom: 22px;
-}
+    def save_job(self, job):
+        if job.get("action") not in SCHEDULE_ACTIONS:
+            raise ValueError(f"不支持的动作: {job.get('action')}")
+        parse_selector(job.get("selector", ""))
+        trigger = job.get("trigger") or {}
+        if trigger.get("type") == "cron":
+            parse_cron(trigger.get("expr", ""))
+        elif trigger.get("type") == "interval":
+            if float(trigger.get("seconds") or 0) <= 0:
+                raise ValueError("间隔必须大于 0 秒")
+        else:
+            raise ValueError("触发方式只能是 cron 或 interval")
+        with self._cond:
+            job_id = job.get("id") or uuid.uuid4().hex[:8]
+            previous = self.jobs.get(job_id, {})
+            job = {**previous, **job, "id": job_id, "enabled": job.get("enabled", True)}
+            self.jobs[job_id] = job
+            self._push_job(job, time.time())
+        self._saver.schedule()
+        return job
+
+    def delete_job(self, job_id):
+        with self._cond:
+            removed = self.jobs.pop(job_id, None) is not None
+        if removed:
+            self._stop_started(job_id)
+            self._saver.schedule()
+        return removed
+
+    def run_now(self, job_id):
+        with self._cond:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        threading.Thread(target=self._execute, args=(job, time.time()), daemon=True).start()
+        return True
+
+    def set_limits(self, max_running, group_quotas):
+        with self._cond:
+            self.settings["max_running"] = max(0, int(max_running or 0))
+            self.settings["group_quotas"] = {g.strip().lower(): int(n) for g, n in (group_quotas or {}).items()
+                                             if g.strip() and int(n) > 0}
+        self._saver.schedule()
+
+    # 从堆里取最近的若干次计划执行；cron/间隔任务再往后推算，直到凑够数量
+    def upcoming(self, limit=20):
+        with self._cond:
+            runs = []
+            for job in self.jobs.values():
+                when = job.get("next_run")
+                while when is not None and len([r for r in runs if r[1] == job["id"]]) < limit:
+                    runs.append((when, job["id"]))
+                    when = job_next_run(job, when)
+            pending_stops = [(when, payload[0]) for when, _, kind, payload in self._heap if kind == "stop"]
+        runs.sort()
+        result = [{"at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(when)), "job_id": j_id,
+                   "name": self.jobs[j_id].get("name", ""), "action": self.jobs[j_id]["action"]}
+                  for when, j_id in runs[:limit] if j_id in self.jobs]
+        stops = [{"at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(when)), "job_id": j_id,
+                  "name": self.jobs.get(j_id, {}).get("name", ""), "action": "stop (run_for)"}
+                 for when, j_id in sorted(pending_stops)[:limit]]
+        return sorted(result + stops, key=lambda r: r["at"])[:limit]
+
+
+# 每个方法保留最近这么多次调用的耗时，用于计算分位数
+API_LATENCY_SAMPLES = 1024
+# 可选：每次 js_api 调用写一行 JSON 日志；"-" 表示输出到 stderr
+API_LOG_FILE = os.environ.get("FPM_API_LOG", "")
+# 只记录耗时不低于该值（毫秒）的调用，0 表示全部记录
+API_LOG_SLOW_MS = float(os.environ.get("FPM_API_LOG_SLOW_MS", "0"))
+API_CAPTURE_MODES = ("cprofile", "tracemalloc")
+
+
+class ApiCallStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.methods = {}
+        # 方法名 -> 抓取模式，下一次调用该方法时在 cProfile / tracemalloc 下执行
+        self.armed = {}
+        self.captures = collections.deque(maxlen=20)
+        self._log_lock = threading.Lock()
+
+    def record(self, name, elapsed_ms, arg_bytes, error, failed):
+        with self._lock:
+            stats = self.methods.get(name)
+            if stats is None:
+                stats = self.methods[name] = {"calls": 0, "errors": 0, "failures": 0, "total_ms": 0.0,
+                                              "max_ms": 0.0, "arg_bytes": 0,
+                                              "samples": collections.deque(maxlen=API_LATENCY_SAMPLES)}
+            stats["calls"] += 1
+            stats["errors"] += error is not None
+            stats["failures"] += failed
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["arg_bytes"] += arg_bytes
+            stats["samples"].append(elapsed_ms)
+        if API_LOG_FILE and elapsed_ms >= API_LOG_SLOW_MS:
+            self.log({"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "method": name, "ms": round(elapsed_ms, 3),
+                      "arg_bytes": arg_bytes, "ok": error is None and not failed,
+                      "error": repr(error) if error is not None else None})
+
+    def log(self, entry):
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._log_lock:
+            if API_LOG_FILE == "-":
+                print(line, file=sys.stderr, flush=True)
+            else:
+                with open(API_LOG_FILE, 'a', encoding='utf-8') as f:
+                    f.write(line + "\n")
+
+    def take_armed(self, name):
+        if not self.armed:
+            return None
+        with self._lock:
+            return self.armed.pop(name, None)
+
+    def summary(self):
+        with self._lock:
+            rows = [(name, dict(stats), sorted(stats["samples"])) for name, stats in self.methods.items()]
+        result = []
+        for name, stats, samples in rows:
+            def pct(q):
+                return round(samples[min(len(samples) - 1, int(q * len(samples)))], 3)
+            result.append({"method": name, "calls": stats["calls"], "errors": stats["errors"],
+                           "failures": stats["failures"], "avg_ms": round(stats["total_ms"] / stats["calls"], 3),
+                           "p50_ms": pct(0.5), "p95_ms": pct(0.95), "p99_ms": pct(0.99),
+                           "max_ms": round(stats["max_ms"], 3),
+                           "avg_arg_bytes": stats["arg_bytes"] // stats["calls"]})
+        result.sort(key=lambda r: r["p95_ms"], reverse=True)
+        return result
 
-.form-section-title {
-    font-size: 14px;
-    font-weight: 700;
-    color: var(--accent2);
-    margin-bottom: 14px;
-    padding-bottom: 8px;
-    border-bottom: 1px solid var(--border);
-    display: flex;
-    align-items: center;
-    gap: 8px;
-}
 
-.randomize-btn {
-    margin-left: auto;
-    padding: 4px 12px;
-    font-size: 11px;
-    background: var(--bg3);
-    border: 1px solid var(--border);
-    color: var(--accent2);
-    border-radius: 6px;
-    cursor: pointer;
-    transition: var(--transition);
-}
+# 在 cProfile 或 tracemalloc 下执行一次 call；调用抛异常时报告同样写入 reports
+def run_captured(mode, call, reports):
+    if mode == "cprofile":
+        import cProfile
+        import pstats
 
-.randomize-btn:hover {
-    background: var(--accent);
-    color: white;
-    border-color: var(--accent);
-}
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(call)
+        finally:
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(30)
+            reports.append(out.getvalue())
+    import tracemalloc
+
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start(10)
+    before = tracemalloc.take_snapshot()
+    try:
+        return call()
+    finally:
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if not already_tracing:
+            tracemalloc.stop()
+        lines = [f"current={current} peak={peak}"]
+        lines += [str(stat) for stat in after.compare_to(before, "lineno")[:25]]
+        reports.append("\n".join(lines))
+
+
+def _arg_size(args, kwargs):
+    if not args and not kwargs:
+        return 0
+    try:
+        return len(json.dumps([args, kwargs], ensure_ascii=False, default=str))
+    except (TypeError, ValueError):
+        return -1
+
+
+def _instrumented(name, fn):
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        calls = self.__dict__.get("_calls")
+        if calls is None:
+            return fn(self, *args, **kwargs)
+        mode = calls.take_armed(name)
+        reports = []
+        error = None
+        result = None
+        start = time.perf_counter()
+        try:
+            if mode is None:
+                result = fn(self, *args, **kwargs)
+            else:
+                result = run_captured(mode, lambda: fn(self, *args, **kwargs), reports)
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            failed = isinstance(result, dict) and result.get("success") is False
+            calls.record(name, elapsed_ms, _arg_size(args, kwargs), error, failed)
+            if mode is not None:
+                calls.captures.append({"method": name, "mode": mode, "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                                       "ms": round(elapsed_ms, 3), "report": "".join(reports)})
+    # pywebview 按参数名生成 JS 端的桩函数，包装后要保留原签名
+    wrapper.__signature__ = inspect.signature(fn)
+    return wrapper
+
+
+# 给暴露给前端的所有公开方法加上耗时/参数大小/错误计数
+def instrument_api(cls):
+    for name, fn in list(vars(cls).items()):
+        if not name.startswith("_") and inspect.isfunction(fn):
+            setattr(cls, name, _instrumented(name, fn))
+    return cls
+
+
+# 可选：Prometheus 文本格式指标的监听端口，0 表示不开启
+METRICS_PORT = int(os.environ.get("FPM_METRICS_PORT", "0"))
+# 只在本机采集时保持 127.0.0.1；需要从其他机器抓取时设为 0.0.0.0
+METRICS_HOST = os.environ.get("FPM_METRICS_HOST", "127.0.0.1")
+LAUNCH_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+WRITE_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+    def render(self, name, help_text):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum {total:.6f}")
+        lines.append(f"{name}_count {cumulative}")
+        return lines
+
+
+class FleetMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {"launch_success": 0, "launch_failure": 0, "crashes": 0}
+        self.launch_latency = Histogram(LAUNCH_LATENCY_BUCKETS)
+        self.write_latency = Histogram(WRITE_LATENCY_BUCKETS)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def render(self, api):
+        total = api.profile_count()
+        pids = api.running_pids()
+        with self._lock:
+            counters = dict(self.counters)
+        rss = browser_rss_bytes(pids)
+        lines = [
+            "# HELP fpm_profiles_total Profiles in the store.",
+            "# TYPE fpm_profiles_total gauge",
+            f"fpm_profiles_total {total}",
+            "# HELP fpm_profiles_running Browser processes currently running.",
+            "# TYPE fpm_profiles_running gauge",
+            f"fpm_profiles_running {len(pids)}",
+            "# HELP fpm_launches_total Browser launch attempts by result.",
+            "# TYPE fpm_launches_total counter",
+            f'fpm_launches_total{{result="success"}} {counters["launch_success"]}',
+            f'fpm_launches_total{{result="failure"}} {counters["launch_failure"]}',
+            "# HELP fpm_browser_crashes_total Browsers that exited without stop_profile.",
+            "# TYPE fpm_browser_crashes_total counter",
+            f"fpm_browser_crashes_total {counters['crashes']}",
+        ]
+        lines += self.launch_latency.render("fpm_launch_latency_seconds", "Time from start_profile to process spawned.")
+        lines += self.write_latency.render("fpm_persistence_write_seconds", "Duration of profile config writes.")
+        displays = api.display_report()
+        if displays:
+            lines += ["# HELP fpm_display_load Browsers running on each virtual display.",
+                      "# TYPE fpm_display_load gauge"]
+            lines += [f'fpm_display_load{{display="{d["display"]}"}} {d["load"]}' for d in displays]
+        if rss is not None:
+            lines += ["# HELP fpm_browser_rss_bytes Resident memory of all browser processes and their children.",
+                      "# TYPE fpm_browser_rss_bytes gauge",
+                      f"fpm_browser_rss_bytes {rss}"]
+        return "\n".join(lines) + "\n"
+
+
+# 浏览器会派生大量子进程，RSS 按进程树累加；没有 psutil 时在 Linux 上读 /proc，其他平台不上报
+def browser_rss_bytes(pids):
+    if psutil is not None:
+        total = 0
+        for pid in pids:
+            try:
+                root = psutil.Process(pid)
+                for proc in [root] + root.children(recursive=True):
+                    total += proc.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+    if not os.path.isdir("/proc"):
+        return None
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", 'rb') as f:
+                # comm 字段可能含空格，ppid 在最后一个 ')' 之后的第二个字段
+                ppid = int(f.read().rsplit(b")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    stack = list(pids)
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, ()))
+        try:
+            with open(f"/proc/{pid}/statm", 'rb') as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
 
-/* Empty State */
-.empty-state {
-    text-align: center;
-    padding: 80px 20px;
-    color: var(--text3);
-}
 
-.empty-icon {
-    font-size: 64px;
-    margin-bottom: 16px;
-    opacity: 0.5;
-}
+@instrument_api
+class Api:
+    def __init__(self):
+        self._calls = ApiCallStats()
+        self.metrics = FleetMetrics()
+        # _lock 只保护 profiles / running_processes 这两个共享字典，持有时间要尽量短；
+        # 同一环境的启动/停止/编辑/删除由各自的环境锁串行化，互不阻塞其他环境
+        self._lock = threading.RLock()
+        self._profile_locks = {}
+        self._index = ProfileIndex()
+        self._ids = ProfileIdAllocator()
+        self._history = ConfigHistory()
+        # 当前配置已通过校验的环境；写入时校验并登记，系统内部改写配置时移除，下次启动前再查
+        self._valid_ids = set()
+        # 配置在后台线程加载，窗口无需等待；首次访问 self.profiles 时才会阻塞到加载完成
+        self._profiles = None
+        self._load_error = None
+        self._loaded = threading.Event()
+        self.running_processes = {}
+        # stop_profile 正在停止的进程，监控线程回收它们时不算崩溃
+        self._stopping = set()
+        self._launcher = get_launcher()
+        # 浏览器 pid -> 它所在的虚拟显示
+        self._displays = {}
+        self._display_pool = DisplayPool()
+        self._cgroups = CgroupManager()
+        self._group_limits = {}
+        # 浏览器 pid -> {"profile_id", "path", "counters", "reported_at"}，counters 是上次上报时的事件计数
+        self._cgroup_paths = {}
+        self._resource_events = collections.deque(maxlen=200)
+        self._resource_event_seq = 0
+        self._last_cgroup_poll = 0.0
+        atexit.register(self._display_pool.shutdown)
+        if self._display_pool.size:
+            threading.Thread(target=self._display_pool.prespawn, daemon=True).start()
+        self._saver = DebouncedSaver(self._snapshot_profiles, self._write_profiles)
+        self._storage = StorageManager()
+        self._purge_results = {}
+        self._proxies = ProxyPool()
+        self._proxy_check_thread = None
+        self._scheduler = Scheduler(self)
+        self._leases = LeaseManager()
+        self.window_created_at = None
+        atexit.register(self._saver.flush)
+        threading.Thread(target=self._load, daemon=True).start()
+        self._monitor_thread = threading.Thread(target=self._monitor_processes, daemon=True)
+        self._monitor_thread.start()
 
-.empty-state h3 {
-    font-size: 20px;
-    color: var(--text2);
-    margin-bottom: 8px;
-}
+    @property
+    def profiles(self):
+        if not self._loaded.is_set():
+            self._loaded.wait()
+        if self._load_error is not None:
+            raise RuntimeError(f"加载 {CONFIG_FILE} 失败: {self._load_error}")
+        return self._profiles
 
-.empty-state p {
-    font-size: 14px;
-    margin-bottom: 24px;
-}
+    def _load(self):
+        try:
+            os.makedirs(PROFILES_DIR, exist_ok=True)
+            profiles = load_profiles()
+            # 上次退出时仍在运行的环境，进程已不归本实例管理
+            for p_data in profiles.values():
+                p_data["status"] = "stopped"
+                p_data["pid"] = None
+            if migrate_profile_dirs(profiles):
+                save_profiles(profiles)
+            self._index.rebuild(profiles)
+            if os.path.exists(LIMITS_FILE):
+                with open(LIMITS_FILE, 'r', encoding='utf-8') as f:
+                    self._group_limits = json.load(f).get("groups", {})
+            self._profiles = profiles
+        except Exception as e:
+            traceback.print_exc()
+            self._load_error = e
+        finally:
+            self._loaded.set()
+        self._storage.sweep_trash()
+        self._scheduler.start()
+
+    def _profile_lock(self, profile_id):
+        with self._lock:
+            lock = self._profile_locks.get(profile_id)
+            if lock is None:
+                lock = self._profile_locks[profile_id] = threading.Lock()
+            return lock
+
+    def _save(self):
+        self._saver.schedule()
+
+    # 只在锁内做浅拷贝，耗时的序列化和写盘放到锁外
+    def _snapshot_profiles(self):
+        with self._lock:
+            return {p_id: {**p_data, "config": dict(p_data.get("config") or {})}
+                    for p_id, p_data in self.profiles.items()}
 
-/* Toast */
-.toast-container {
-    position: fixed;
-    top: 20px;
-    right: 20px;
-    z-index: 2000;
-    display: flex;
-    flex-direction: column;
-    gap: 8px;
-}
+    def _monitor_processes(self):
+        while True:
+            try:
+                self._reap_exited_processes()
+                self._reclaim_expired_leases()
+                if self._cgroup_paths and time.monotonic() - self._last_cgroup_poll >= CGROUP_POLL_SECONDS:
+                    self._last_cgroup_poll = time.monotonic()
+                    with self._lock:
+                        cgroups = list(self._cgroup_paths.values())
+                    for cgroup in cgroups:
+                        self._check_cgroup_events(cgroup)
+            except Exception:
+                # 监控线程不能因为单次异常退出，否则所有环境的状态都不再更新
+                traceback.print_exc()
+            time.sleep(1)
 
-.toast {
-    padding: 14px 20px;
-    border-radius: var(--radius-sm);
-    font-size: 14px;
-    font-weight: 500;
-    box-shadow: var(--shadow);
-    animation: toastIn 0.3s ease;
-    display: flex;
-    align-items: center;
-    gap: 10px;
-    min-width: 280px;
-}
+    # 持有者失联导致租约过期时，停掉它启动的浏览器，下一个持有者拿到的是干净的环境
+    def _reclaim_expired_leases(self):
+        def stop_and_release(profile_id, token):
+            try:
+                self.stop_profile(profile_id, token)
+            finally:
+                self._leases.release(profile_id, token)
+
+        for p_id, token in self._leases.reclaim_expired():
+            threading.Thread(target=stop_and_release, args=(p_id, token), daemon=True).start()
+
+    # 对比上次上报时的计数，新增的触顶/OOM/限流记为事件，前端按序号增量拉取；
+    # 同一环境同一类事件一分钟内只报一次（OOM 每次都报），避免持续限流时刷屏
+    def _check_cgroup_events(self, cgroup):
+        stats = self._cgroups.stats(cgroup["path"])
+        now = time.monotonic()
+        for kind in RESOURCE_EVENT_KINDS:
+            delta = stats[kind] - cgroup["counters"].get(kind, 0)
+            if delta <= 0:
+                continue
+            if kind != "oom_kills" and now - cgroup["reported_at"].get(kind, -RESOURCE_EVENT_INTERVAL) < RESOURCE_EVENT_INTERVAL:
+                continue
+            cgroup["counters"][kind] = stats[kind]
+            cgroup["reported_at"][kind] = now
+            with self._lock:
+                self._resource_event_seq += 1
+                name = (self.profiles.get(cgroup["profile_id"]) or {}).get("name", "")
+                self._resource_events.append({"seq": self._resource_event_seq, "profile_id": cgroup["profile_id"],
+                                              "name": name, "kind": kind, "delta": delta,
+                                              "at": time.strftime("%Y-%m-%d %H:%M:%S")})
+
+    def _write_profiles(self, profiles):
+        start = time.perf_counter()
+        save_profiles(profiles)
+        self.metrics.write_latency.observe(time.perf_counter() - start)
+
+    def _reap_exited_processes(self):
+        with self._lock:
+            exited = [pid for pid, proc in self.running_processes.items() if proc.poll() is not None]
+            if not exited:
+                return
+            crashed = sum(1 for pid in exited if pid not in self._stopping)
+            if crashed:
+                self.metrics.inc("crashes", crashed)
+            procs = [self.running_processes.pop(pid) for pid in exited]
+            displays = [self._displays.pop(pid) for pid in exited if pid in self._displays]
+            cgroups = [self._cgroup_paths.pop(pid) for pid in exited if pid in self._cgroup_paths]
+            exited = set(exited)
+            stopped = []
+            for p_id, p_data in self.profiles.items():
+                if p_data.get("pid") in exited:
+                    p_data["status"] = "stopped"
+                    p_data["pid"] = None
+                    stopped.append((p_id, p_data.get("user_data_dir")))
+            self._save()
+        for proc in procs:
+            self._launcher.cleanup(proc)
+        for p_id, user_data_dir in stopped:
+            self._forget_storage(p_id, user_data_dir)
+        for display in displays:
+            self._display_pool.release(display)
+        for cgroup in cgroups:
+            # 浏览器被 OOM 杀掉等情况下，最后一次的计数变化也要记成事件
+            self._check_cgroup_events(cgroup)
+            self._cgroups.remove(cgroup["path"])
+
+    # 不传 limit 时返回完整列表；传 limit 时分页返回，前端先渲染第一页再补齐其余部分
+    def get_profiles(self, offset=0, limit=None):
+        # 已退出的进程走统一的回收流程：释放显示、清理进程组和 cgroup、计入崩溃数
+        self._reap_exited_processes()
+        with self._lock:
+            # 检查运行状态，只有状态变化时才写盘
+            changed = False
+            for p_id, p_data in self.profiles.items():
+                pid = p_data.get("pid")
+                if pid and pid in self.running_processes:
+                    if p_data.get("status") != "running":
+                        p_data["status"] = "running"
+                        changed = True
+                elif p_data.get("status") != "stopped" or pid is not None:
+                    p_data["status"] = "stopped"
+                    p_data["pid"] = None
+                    changed = True
+            if changed:
+                self._save()
+            if limit is None:
+                return [{**p_data, "id": p_id} for p_id, p_data in self.profiles.items()]
+            items = list(self.profiles.items())[offset:offset + limit]
+            return {
+                "profiles": [{**p_data, "id": p_id} for p_id, p_data in items],
+                "total": len(self.profiles),
+                "running": len(self.running_processes),
+            }
+
+    # 供调度器、指标导出和集群 agent 读取的汇总，调用方不需要接触 Api 的锁和内部索引
+    def running_pids(self):
+        with self._lock:
+            return list(self.running_processes)
+
+    # 配置还在后台加载时返回 0，不阻塞指标抓取
+    def profile_count(self):
+        with self._lock:
+            return len(self._profiles) if self._loaded.is_set() and self._profiles is not None else 0
+
+    def profile_ids(self):
+        with self._lock:
+            return list(self.profiles)
+
+    def group_running_count(self, group):
+        with self._lock:
+            return sum(1 for p_id in self._index.groups.get(group, ())
+                       if self.profiles[p_id].get("status") == "running")
+
+    def display_report(self):
+        return self._display_pool.report()
+
+    # 前端 init 完成后回报可交互耗时，用于对比资源拆分/缓存前后的启动速度
+    def report_ui_timing(self, interactive_ms):
+        timing = {"at": time.strftime("%Y-%m-%d %H:%M:%S"), "page_interactive_ms": interactive_ms}
+        if self.window_created_at is not None:
+            timing["window_to_interactive_ms"] = round((time.perf_counter() - self.window_created_at) * 1000, 1)
+        if UI_TIMING_FILE:
+            with open(UI_TIMING_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(timing) + "\n")
+        return timing
+
+    def get_diagnostics(self):
+        return {"methods": self._calls.summary(), "armed": dict(self._calls.armed),
+                "captures": list(self._calls.captures)[::-1]}
+
+    # 下一次调用 method 时在 cProfile / tracemalloc 下执行一次，结果在 get_diagnostics 的 captures 里
+    def capture_next_call(self, method, mode="cprofile"):
+        if mode not in API_CAPTURE_MODES:
+            return {"success": False, "error": f"不支持的抓取模式: {mode}"}
+        if method.startswith("_") or not callable(getattr(self, method, None)):
+            return {"success": False, "error": f"没有这个方法: {method}"}
+        with self._calls._lock:
+            self._calls.armed[method] = mode
+        return {"success": True}
 
-.toast.success {
-    background: linear-gradient(135deg, rgba(0,184,148,0.9), rgba(0,210,160,0.9));
-    color: white;
-}
+    # 一次桥接往返执行多个调用：calls 为 [{"method": 方法名, "args": [...]}]，按顺序执行。
+    # 每项结果为 {"result": ...} 或 {"error": ...}，单个调用出错不影响其余调用；
+    # 每个调用照常经过 instrument_api 统计
+    def batch(self, calls):
+        results = []
+        for call in calls or ():
+            method = call.get("method") or ""
+            if method.startswith("_") or method == "batch" or not inspect.isfunction(getattr(type(self), method, None)):
+                results.append({"error": f"没有这个方法: {method}"})
+                continue
+            try:
+                results.append({"result": getattr(self, method)(*(call.get("args") or ()))})
+            except Exception as e:
+                results.append({"error": str(e) or type(e).__name__})
+        return results
 
-.toast.error {
-    background: linear-gradient(135deg, rgba(225,112,85,0.9), rgba(255,118,117,0.9));
-    color: white;
-}
+    def get_random_profile(self, ip=None):
+        return generate_random_profile(ip)
 
-.toast.info {
-    background: linear-gradient(135deg, rgba(108,92,231,0.9), rgba(124,111,247,0.9));
-    color: white;
-}
+    def lookup_geo(self, ip):
+        return geo_for_ip(ip)
 
-@keyframes toastIn {
-    from { transform: translateX(100px); opacity: 0; }
-    to { transform: translateX(0); opacity: 1; }
-}
+    def get_webgl_configs(self, platform=None, vendor=None):
+        return get_catalog().webgl_configs(platform, vendor)
 
-/* Confirm Dialog */
-.confirm-overlay {
-    position: fixed;
-    top: 0; left: 0; right: 0; bottom: 0;
-    background: rgba(0,0,0,0.6);
-    backdrop-filter: blur(8px);
-    display: none;
-    align-items: center;
-    justify-content: center;
-    z-index: 1500;
-}
+    def get_timezones(self):
+        return get_catalog().timezones
 
-.confirm-overlay.active { display: flex; }
-
-.confirm-box {
-    background: var(--bg2);
-    border: 1px solid var(--border);
-    border-radius: var(--radius);
-    padding: 28px;
-    max-width: 400px;
-    width: 90%;
-    text-align: center;
-    box-shadow: 0 25px 60px rgba(0,0,0,0.5);
-    animation: modalIn 0.3s ease;
-}
+    def get_languages(self):
+        return get_catalog().languages
 
-.confirm-box h3 { margin-bottom: 10px; font-size: 18px; }
-.confirm-box p { color: var(--text2); font-size: 14px; margin-bottom: 24px; }
-.confirm-actions { display: flex; gap: 10px; justify-content: center; }
-
-/* Responsive */
-@media (max-width: 768px) {
-    .header { padding: 16px 20px; }
-    .main { padding: 20px; }
-    .grid { grid-template-columns: 1fr; }
-    .form-row { grid-template-columns: 1fr; }
-    .stats { display: none; }
-    .toolbar { flex-wrap: wrap; }
-}
-</style>
-</head>
-<body>
-
-<div class="header">
-    <div class="header-left">
-        <div class="logo">🌐</div>
-        <h1>指纹浏览器管理器</h1>
-        <label class="form-label">by Zeb</label>
-    </div>
-    <div class="header-right">
-        <div class="stats">
-            <div class="stat-item">
-                <span class="stat-dot green"></span>
-                <span>运行中: <strong id="runningCount">0</strong></span>
-            </div>
-            <div class="stat-item">
-                <span class="stat-dot gray"></span>
-                <span>总数: <strong id="totalCount">0</strong></span>
-            </div>
-        </div>
-        <button class="btn btn-primary" onclick="openCreateModal()">
-            <span>＋</span> 新建环境
-        </button>
-    </div>
-</div>
-
-<div class="main">
-    <div class="toolbar">
-        <div class="search-box">
-            <span class="search-icon">🔍</span>
-            <input type="text" id="searchInput" placeholder="搜索环境名称或ID..." oninput="filterProfiles()">
-        </div>
-        <button class="btn btn-ghost" onclick="refreshProfiles()">🔄 刷新</button>
-    </div>
-    <div class="grid" id="profileGrid"></div>
-</div>
-
-<!-- Create/Edit Modal -->
-<div class="modal-overlay" id="profileModal">
-    <div class="modal">
-        <div class="modal-header">
-            <h2 id="modalTitle">新建环境</h2>
-            <button class="modal-close" onclick="closeModal()">✕</button>
-        </div>
-        <div class="modal-body">
-            <div class="form-section">
-                <div class="form-section-title">
-                    <span>📋</span> 基本信息
-                </div>
-                <div class="form-group">
-                    <label class="form-label">环境名称 *</label>
-                    <input type="text" class="form-input" id="profileName" placeholder="输入环境名称">
-                </div>
-            </div>
-
-            <div class="form-section">
-                <div class="form-section-title">
-                    <span>🖥️</span> 系统信息
-                    <button class="randomize-btn" onclick="randomizeAll()">🎲 全部随机</button>
-                </div>
-                <div class="form-row">
-                    <div class="form-group">
-                        <label class="form-label">平台 (Platform)</label>
-                        <select class="form-select" id="fp_platform">
-                            <option value="">随机</option>
-                        </select>
-                    </div>
-                    <div class="form-group">
-                        <label class="form-label">CPU 核心数</label>
-                        <select class="form-select" id="fp_hardwareConcurrency">
-                            <option value="">随机</option>
-                            <option value="2">2</option>
-                            <option value="4">4</option>
-                            <option value="6">6</option>
-                            <option value="8">8</option>
-                            <option value="10">10</option>
-                            <option value="12">12</option>
-                            <option value="16">16</option>
-                        </select>
-                    </div>
-                </div>
-                <div class="form-row">
-                    <div class="form-group">
-                        <label class="form-label">设备内存 (GB)</label>
-                        <select class="form-select" id="fp_deviceMemory">
-                            <option value="">随机</option>
-                            <option value="2">2</option>
-                            <option value="4">4</option>
-                            <option value="8">8</option>
-                            <option value="16">16</option>
-                            <option value="32">32</option>
-                        </select>
-                    </div>
-                    <div class="form-group">
-                        <label class="form-label">最大触摸点数</label>
-                        <select class="form-select" id="fp_maxTouchPoints">
-                            <option value="">随机</option>
-                            <option value="0">0 (无触摸)</option>
-                            <option value="1">1</option>
-                            <option value="5">5</option>
-                            <option value="10">10</option>
-                        </select>
-                    </div>
-                </div>
-            </div>
-
-            <div class="form-section">
-                <div class="form-section-title">
-                    <span>🎮</span> WebGL 配置
-                </div>
-                <div class="form-group">
-                    <label class="form-label">WebGL 供应商</label>
-                    <input type="text" class="form-input" id="fp_webgl_vendor" placeholder="随机生成">
-                </div>
-                <div class="form-group">
-                    <label class="form-label">WebGL 渲染器</label>
-                    <input type="text" class="form-input" id="fp_webgl_renderer" placeholder="随机生成">
-                </div>
-                <div class="form-group">
-                    <label class="form-label">WebGL 预设</label>
-                    <select class="form-select" id="webglPreset" onchange="applyWebGLPreset()">
-                        <option value="">自定义 / 随机</option>
-                    </select>
-                </div>
-            </div>
-
-            <div class="form-section">
-                <div class="form-section-title">
-                    <span>🔊</span> 噪声参数
-                </div>
-                <div class="form-row">
-                    <div class="form-group">
-                        <label class="form-label">Canvas 噪声</label>
-                        <input type="text" class="form-input" id="fp_canvas_noise" placeholder="随机 (0.0001~0.01)">
-                    </div>
-                    <div class="form-group">
-                        <label class="form-label">WebGL 噪声</label>
-                        <input type="text" class="form-input" id="fp_webgl_noise" placeholder="随机 (0.0001~0.01)">
-                    </div>
-                </div>
-                <div class="form-row">
-                    <div class="form-group">
-                        <label class="form-label">Audio 噪声</label>
-                        <input type="text" class="form-input" id="fp_audio_noise" placeholder="随机 (0.0001~0.01)">
-                    </div>
-                    <div class="form-group">
-                        <label class="form-label">ClientRects 噪声</label>
-                        <input type="text" class="form-input" id="fp_clientRects_noise" placeholder="随机 (0.0001~0.01)">
-                    </div>
-                </div>
-            </div>
-
-            <div class="form-section">
-                <div class="form-section-title">
-                    <span>🌍</span> 网络与地区
-                </div>
-                <div class="form-row">
-                    <div class="form-group">
-                        <label class="form-label">WebRTC IP</label>
-                        <input type="text" class="form-input" id="fp_webrtc_ip" placeholder="随机生成">
-                    </div>
-                    <div class="form-group">
-                        <label class="form-label">时区</label>
-                        <select class="form-select" id="fp_timezone">
-                            <option value="">随机</option>
-                        </select>
-                    </div>
-                </div>
-                <div class="form-row">
-                    <div class="form-group">
-                        <label class="form-label">语言</label>
-                        <select class="form-select" id="fp_language">
-                            <option value="">随机</option>
-                        </select>
-                    </div>
-                    <div class="form-group"></div>
-                </div>
-            </div>
-        </div>
-        <div class="modal-footer">
-            <button class="btn btn-ghost" onclick="closeModal()">取消</button>
-            <button class="btn btn-primary" id="modalSaveBtn" onclick="saveProfile()">创建环境</button>
-        </div>
-    </div>
-</div>
-
-<!-- Detail Modal -->
-<div class="modal-overlay" id="detailModal">
-    <div class="modal">
-        <div class="modal-header">
-            <h2>环境详情</h2>
-            <button class="modal-close" onclick="closeDetailModal()">✕</button>
-        </div>
-        <div class="modal-body" id="detailBody"></div>
-        <div class="modal-footer">
-            <button class="btn btn-ghost" onclick="closeDetailModal()">关闭</button>
-        </div>
-    </div>
-</div>
-
-<!-- Confirm Dialog -->
-<div class="confirm-overlay" id="confirmOverlay">
-    <div class="confirm-box">
-        <h3 id="confirmTitle">确认操作</h3>
-        <p id="confirmMessage">确定要执行此操作吗？</p>
-        <div class="confirm-actions">
-            <button class="btn btn-ghost" onclick="closeConfirm()">取消</button>
-            <button class="btn btn-danger" id="confirmBtn" onclick="confirmAction()">确认</button>
-        </div>
-    </div>
-</div>
-
-<div class="toast-container" id="toastContainer"></div>
-
-<script>
-let allProfiles = [];
-let editingId = null;
-let pendingConfirmAction = null;
-let webglConfigs = [];
-let timezones = [];
-let languages = [];
-let platforms = [];
-
-// Init
-async function init() {
-    platforms = await pywebview.api.get_platforms();
-    timezones = await pywebview.api.get_timezones();
-    languages = await pywebview.api.get_languages();
-    webglConfigs = await pywebview.api.get_webgl_configs();
-
-    const platformSel = document.getElementById('fp_platform');
-    platforms.forEach(p => {
-        const opt = document.createElement('option');
-        opt.value = p; opt.textContent = p;
-        platformSel.appendChild(opt);
-    });
-
-    const tzSel = document.getElementById('fp_timezone');
-    timezones.forEach(t => {
-        const opt = document.createElement('option');
-        opt.value = t; opt.textContent = t;
-        tzSel.appendChild(opt);
-    });
-
-    const langSel = document.getElementById('fp_language');
-    languages.forEach(l => {
-        const opt = document.createElement('option');
-        opt.value = l; opt.textContent = l;
-        langSel.appendChild(opt);
-    });
-
-    const presetSel = document.getElementById('webglPreset');
-    webglConfigs.forEach((c, i) => {
-        const opt = document.createElement('option');
-        opt.value = i;
-        const shortRenderer = c.renderer.length > 60 ? c.renderer.substring(0, 60) + '...' : c.renderer;
-        opt.textContent = shortRenderer;
-        presetSel.appendChild(opt);
-    });
-
-    refreshProfiles();
-    setInterval(refreshProfiles, 3000);
-}
+    def get_platforms(self):
+        return get_catalog().platforms
+
+    # 前端带上缓存的版本号，版本一致时只回一个标记，不再传输整个目录
+    def get_catalog(self, version=None):
+        catalog = get_catalog()
+        if version and version == catalog.version:
+            return {"version": version, "unchanged": True}
+        return catalog.payload()
+
+    def reload_catalog(self):
+        catalog = reload_catalog()
+        with self._lock:
+            self._valid_ids.clear()
+        return {"success": True, "version": catalog.version, "webgl_configs": len(catalog.webgl)}
+
+    # ID 在锁内分配并立即登记，并发创建不会拿到同一个 ID 或短 ID
+    def create_profile(self, name, config, tags=None, group=None):
+        config, errors = normalize_config(config)
+        if errors:
+            return {"success": False, "error": "配置无效: " + "; ".join(errors)}
+        profile_data = {
+            "name": name,
+            "config": config,
+            "tags": normalize_tags(tags),
+            "group": (group or "").strip(),
+            "user_data_dir": None,
+            "status": "stopped",
+            "pid": None,
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        with self._lock:
+            profile_id = self._ids.allocate(self.profiles, self._index.aliases)
+            profile_data["user_data_dir"] = user_data_dir = profile_dir_path(profile_id)
+            self.profiles[profile_id] = profile_data
+            self._index.add(profile_id, profile_data)
+            self._valid_ids.add(profile_id)
+            self._save()
+        os.makedirs(user_data_dir, exist_ok=True)
+        return {"success": True, "id": profile_id}
 
-function applyWebGLPreset() {
-    const idx = document.getElementById('webglPreset').value;
-    if (idx !== '') {
-        const config = webglConfigs[parseInt(idx)];
-        document.getElementById('fp_webgl_vendor').value = config.vendor;
-        document.getElementById('fp_webgl_renderer').value = config.renderer;
-    }
-}
+    # 接受完整 ID 或 8 位短 ID，找不到时原样返回
+    def _resolve_id(self, profile_id):
+        with self._lock:
+            if profile_id in self.profiles:
+                return profile_id
+            return self._index.aliases.get(profile_id, profile_id)
+
+    # tags / group 为 None 时保持不变
+    def update_profile(self, profile_id, name, config, tags=None, group=None):
+        profile_id = self._resolve_id(profile_id)
+        config, errors = normalize_config(config)
+        if errors:
+            return {"success": False, "error": "配置无效: " + "; ".join(errors)}
+        with self._profile_lock(profile_id):
+            with self._lock:
+                if profile_id not in self.profiles:
+                    return {"success": False, "error": "环境不存在"}
+                profile = self.profiles[profile_id]
+                if profile.get("status") == "running":
+                    return {"success": False, "error": "无法编辑正在运行的环境"}
+                previous = profile.get("config") or {}
+                profile["name"] = name
+                profile["config"] = config
+                self._valid_ids.add(profile_id)
+                if tags is not None or group is not None:
+                    self._index.remove(profile_id, profile)
+                    if tags is not None:
+                        profile["tags"] = normalize_tags(tags)
+                    if group is not None:
+                        profile["group"] = group.strip()
+                    self._index.add(profile_id, profile)
+                self._save()
+            self._history.record(profile_id, previous, config, profile.get("created_at"))
+            return {"success": True}
 
-async function randomizeAll() {
-    const rnd = await pywebview.api.get_random_profile();
-    document.getElementById('fp_platform').value = rnd.platform;
-    document.getElementById('fp_hardwareConcurrency').value = rnd.hardwareConcurrency;
-    document.getElementById('fp_deviceMemory').value = rnd.deviceMemory;
-    document.getElementById('fp_maxTouchPoints').value = rnd.maxTouchPoints;
-    document.getElementById('fp_webgl_vendor').value = rnd.webgl_vendor;
-    document.getElementById('fp_webgl_renderer').value = rnd.webgl_renderer;
-    document.getElementById('fp_canvas_noise').value = rnd.canvas_noise;
-    document.getElementById('fp_webgl_noise').value = rnd.webgl_noise;
-    document.getElementById('fp_audio_noise').value = rnd.audio_noise;
-    document.getElementById('fp_clientRects_noise').value = rnd.clientRects_noise;
-    document.getElementById('fp_webrtc_ip').value = rnd.webrtc_ip;
-    document.getElementById('fp_timezone').value = rnd.timezone;
-    document.getElementById('fp_language').value = rnd.language;
-    document.getElementById('webglPreset').value = '';
-    showToast('已随机生成所有参数', 'info');
-}
+    def delete_profile(self, profile_id):
+        profile_id = self._resolve_id(profile_id)
+        with self._profile_lock(profile_id):
+            with self._lock:
+                if profile_id not in self.profiles:
+                    return {"success": False, "error": "环境不存在"}
+                if self.profiles[profile_id].get("status") == "running":
+                    return {"success": False, "error": "无法删除正在运行的环境，请先停止"}
+                user_data_dir = self.profiles[profile_id].get("user_data_dir", "")
+            # 目录先改名移入回收区（瞬时完成），真正的删除交给后台线程池
+            if user_data_dir and os.path.exists(user_data_dir):
+                try:
+                    self._storage.trash(user_data_dir)
+                except OSError as e:
+                    return {"success": False, "error": f"无法移除环境目录: {e}"}
+            if DISK_CACHE_ROOT:
+                self._storage.reclaim(os.path.join(DISK_CACHE_ROOT, profile_id))
+            with self._lock:
+                self._index.remove(profile_id, self.profiles.pop(profile_id))
+                self._profile_locks.pop(profile_id, None)
+                self._valid_ids.discard(profile_id)
+                self._save()
+            self._history.remove(profile_id)
+            return {"success": True}
 
-async function refreshProfiles() {
-    allProfiles = await pywebview.api.get_profiles();
-    renderProfiles();
-    updateStats();
-}
+    def delete_profiles(self, profile_ids):
+        deleted = []
+        failed = {}
+        for p_id in profile_ids:
+            result = self.delete_profile(p_id)
+            if result["success"]:
+                deleted.append(p_id)
+            else:
+                failed[p_id] = result["error"]
+        return {"success": not failed, "deleted": deleted, "failed": failed}
+
+    # 标签/分组条件先走倒排索引缩小候选集，其余条件逐个过滤
+    def select_profiles(self, selector):
+        terms = parse_selector(selector)
+        with self._lock:
+            candidates = None
+            for key, values, negate in terms:
+                if negate or key not in ("tag", "group"):
+                    continue
+                index = self._index.tags if key == "tag" else self._index.groups
+                ids = set().union(*(index.get(v, ()) for v in values))
+                candidates = ids if candidates is None else candidates & ids
+            if candidates is None:
+                candidates = self.profiles.keys()
+            selected = []
+            for p_id in candidates:
+                profile = self.profiles.get(p_id)
+                if profile is not None and all(selector_term_matches(key, values, p_id, profile) != negate
+                                               for key, values, negate in terms):
+                    selected.append(p_id)
+            return sorted(selected)
+
+    def get_tags(self):
+        with self._lock:
+            return {
+                "tags": {tag: len(ids) for tag, ids in self._index.tags.items()},
+                "groups": {group: len(ids) for group, ids in self._index.groups.items() if group},
+            }
+
+    # 按筛选表达式批量执行；每批 BULK_BATCH_SIZE 个环境，整批只写一次配置文件
+    def bulk_operation(self, selector, action, params=None):
+        params = params or {}
+        if action not in BULK_ACTIONS:
+            return {"success": False, "error": f"不支持的批量操作: {action}"}
+        missing = [key for key in BULK_REQUIRED_PARAMS.get(action, ()) if params.get(key) is None]
+        if missing:
+            return {"success": False, "error": f"批量操作 {action} 缺少参数: {', '.join(missing)}"}
+        try:
+            profile_ids = self.select_profiles(selector)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        if action == "export":
+            return {**self.export_profiles(profile_ids, params["path"]), "matched": len(profile_ids)}
+
+        done = []
+        failed = {}
+        for i in range(0, len(profile_ids), BULK_BATCH_SIZE):
+            with self._saver.batch():
+                for p_id in profile_ids[i:i + BULK_BATCH_SIZE]:
+                    result = self._bulk_apply(p_id, action, params)
+                    if result["success"]:
+                        done.append(p_id)
+                    else:
+                        failed[p_id] = result["error"]
+        return {"success": not failed, "matched": len(profile_ids), "done": done, "failed": failed}
+
+    def _bulk_apply(self, profile_id, action, params):
+        if action == "start":
+            return self.start_profile(profile_id)
+        if action == "stop":
+            return self.stop_profile(profile_id)
+        if action == "delete":
+            return self.delete_profile(profile_id)
+        with self._profile_lock(profile_id):
+            with self._lock:
+                profile = self.profiles.get(profile_id)
+                if profile is None:
+                    return {"success": False, "error": "环境不存在"}
+                previous = profile["config"]
+                if action == "update":
+                    if profile.get("status") == "running":
+                        return {"success": False, "error": "无法编辑正在运行的环境"}
+                    config, errors = normalize_config({**profile["config"], params["field"]: params["value"]})
+                    if errors:
+                        return {"success": False, "error": "配置无效: " + "; ".join(errors)}
+                    profile["config"] = config
+                    self._valid_ids.add(profile_id)
+                else:
+                    self._index.remove(profile_id, profile)
+                    if action == "tag":
+                        profile["tags"] = normalize_tags((profile.get("tags") or []) + normalize_tags(params["tags"]))
+                    elif action == "untag":
+                        removed = set(normalize_tags(params["tags"]))
+                        profile["tags"] = [t for t in profile.get("tags") or [] if t not in removed]
+                    else:
+                        profile["group"] = (params.get("group") or "").strip()
+                    self._index.add(profile_id, profile)
+                self._save()
+            if action == "update":
+                self._history.record(profile_id, previous, profile["config"], profile.get("created_at"))
+            return {"success": True}
 
-function updateStats() {
-    const running = allProfiles.filter(p => p.status === 'running').length;
-    document.getElementById('runningCount').textContent = running;
-    document.getElementById('totalCount').textContent = allProfiles.length;
-}
+    def get_schedule(self):
+        scheduler = self._scheduler
+        with scheduler._cond:
+            jobs = [dict(job) for job in scheduler.jobs.values()]
+            for job in jobs:
+                if job.get("next_run"):
+                    job["next_run"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job["next_run"]))
+            history = list(scheduler.history)[-50:][::-1]
+            settings = dict(scheduler.settings)
+        return {"jobs": jobs, "settings": settings, "upcoming": scheduler.upcoming(), "history": history}
+
+    def save_schedule_job(self, job):
+        try:
+            return {"success": True, "job": self._scheduler.save_job(job)}
+        except (ValueError, TypeError) as e:
+            return {"success": False, "error": str(e)}
 
-function filterProfiles() {
-    renderProfiles();
-}
+    def delete_schedule_job(self, job_id):
+        if self._scheduler.delete_job(job_id):
+            return {"success": True}
+        return {"success": False, "error": "任务不存在"}
 
-function renderProfiles() {
-    const query = document.getElementById('searchInput').value.toLowerCase();
-    const grid = document.getElementById('profileGrid');
-    let filtered = allProfiles;
+    def run_schedule_job(self, job_id):
+        if self._scheduler.run_now(job_id):
+            return {"success": True}
+        return {"success": False, "error": "任务不存在"}
 
-    if (query) {
-        filtered = filtered.filter(p =>
-            p.name.toLowerCase().includes(query) ||
-            p.id.toLowerCase().includes(query)
-        );
-    }
+    def set_schedule_limits(self, max_running, group_quotas):
+        try:
+            self._scheduler.set_limits(max_running, group_quotas)
+        except (ValueError, TypeError) as e:
+            return {"success": False, "error": str(e)}
+        return {"success": True}
 
-    if (filtered.length === 0) {
-        grid.innerHTML = `
-            <div class="empty-state" style="grid-column: 1/-1;">
-                <div class="empty-icon">📁</div>
-                <h3>${query ? '未找到匹配的环境' : '还没有任何环境'}</h3>
-                <p>${query ? '尝试使用其他关键词搜索' : '点击上方"新建环境"按钮创建你的第一个浏览器环境'}</p>
-                ${!query ? '<button class="btn btn-primary" onclick="openCreateModal()">＋ 新建环境</button>' : ''}
-            </div>
-        `;
-        return;
-    }
+    def get_delete_failures(self):
+        return self._storage.delete_failures()
+
+    def start_profile(self, profile_id, lease_token=None):
+        profile_id = self._resolve_id(profile_id)
+        started_at = time.perf_counter()
+        with self._profile_lock(profile_id):
+            with self._lock:
+                if profile_id not in self.profiles:
+                    return {"success": False, "error": "环境不存在"}
+                leased_by = self._leases.check(profile_id, lease_token)
+                if leased_by:
+                    return {"success": False, "error": leased_by}
+
+                profile = self.profiles[profile_id]
+                if profile.get("status") == "running":
+                    return {"success": False, "error": "环境已在运行中"}
+
+                config = dict(profile["config"])
+                user_data_dir = profile["user_data_dir"]
+                group = (profile.get("group") or "").lower()
+                validated = profile_id in self._valid_ids
+
+            if not validated:
+                errors = validate_config(config)
+                if errors:
+                    return {"success": False, "error": "配置无效: " + "; ".join(errors)}
+                with self._lock:
+                    self._valid_ids.add(profile_id)
 
-    grid.innerHTML = filtered.map(p => {
-        const isRunning = p.status === 'running';
-        const cfg = p.config || {};
-        const initial = (p.name || '?')[0].toUpperCase();
-        const avatarColors = [
-            'linear-gradient(135deg, #6c5ce7, #a29bfe)',
-            'linear-gradient(135deg, #00b894, #55efc4)',
-            'linear-gradient(135deg, #e17055, #ff7675)',
-            'linear-gradient(135deg, #fdcb6e, #f39c12)',
-            'linear-gradient(135deg, #0984e3, #74b9ff)',
-            'linear-gradient(135deg, #e84393, #fd79a8)',
-        ];
-        const colorIdx = p.id.charCodeAt(0) % avatarColors.length;
-
-        return `
-        <div class="card">
-            <div class="card-header">
-                <div class="card-title-group">
-                    <div class="card-avatar" style="background:${avatarColors[colorIdx]}">${initial}</div>
-                    <div>
-                        <div class="card-name">${escapeHtml(p.name)}</div>
-                        <div class="card-id">#${p.id}</div>
-                    </div>
-                </div>
-                <div class="status-badge ${isRunning ? 'running' : 'stopped'}">
-                    <span class="status-dot"></span>
-                    ${isRunning ? '运行中' : '已停止'}
-                </div>
-            </div>
-            <div class="card-info">
-                <div class="info-item">
-                    <span class="info-label">平台</span>
-                    <span class="info-value">${cfg.platform || '-'}</span>
-                </div>
-                <div class="info-item">
-                    <span class="info-label">CPU / 内存</span>
-                    <span class="info-value">${cfg.hardwareConcurrency || '-'}核 / ${cfg.deviceMemory || '-'}GB</span>
-                </div>
-                <div class="info-item">
-                    <span class="info-label">语言</span>
-                    <span class="info-value">${cfg.language || '-'}</span>
-                </div>
-                <div class="info-item">
-                    <span class="info-label">时区</span>
-                    <span class="info-value">${cfg.timezone || '-'}</span>
-                </div>
-            </div>
-            <div class="card-actions">
-                ${isRunning
-                    ? `<button class="btn btn-danger btn-sm" onclick="stopProfile('${p.id}')">⏹ 停止</button>`
-                    : `<button class="btn btn-success btn-sm" onclick="startProfile('${p.id}')">▶ 启动</button>`
-                }
-                <button class="btn btn-ghost btn-sm" onclick="viewDetail('${p.id}')">📋 详情</button>
-                <button class="btn btn-ghost btn-sm" onclick="openEditModal('${p.id}')" ${isRunning ? 'disabled style="opacity:0.4;pointer-events:none;"' : ''}>✏️ 编辑</button>
-                <button class="btn btn-ghost btn-sm" onclick="confirmDelete('${p.id}')" ${isRunning ? 'disabled style="opacity:0.4;pointer-events:none;"' : ''}>🗑</button>
-            </div>
-        </div>
-        `;
-    }).join('');
-}
+            try:
+                profile_limits = normalize_limits(config.get("limits"))
+            except (ValueError, TypeError) as e:
+                return {"success": False, "error": f"资源限制无效: {e}"}
+            group_limits = self._group_limits.get(group) if group else None
+
+            args = [f'--user-data-dir={user_data_dir}']
+            if DISK_CACHE_ROOT:
+                args.append(f'--disk-cache-dir={os.path.join(DISK_CACHE_ROOT, profile_id)}')
+
+            if config.get("platform"):
+                args.append(f'--fingerprint-platform={config["platform"]}')
+            if config.get("hardwareConcurrency"):
+                args.append(f'--fingerprint-hardwareConcurrency={config["hardwareConcurrency"]}')
+            if config.get("deviceMemory"):
+                args.append(f'--fingerprint-deviceMemory={config["deviceMemory"]}')
+            if config.get("maxTouchPoints") is not None:
+                args.append(f'--fingerprint-maxTouchPoints={config["maxTouchPoints"]}')
+            if config.get("webgl_vendor"):
+                args.append(f'--fingerprint-webgl-vendor={config["webgl_vendor"]}')
+            if config.get("webgl_renderer"):
+                args.append(f'--fingerprint-webgl-renderer={config["webgl_renderer"]}')
+            if config.get("canvas_noise"):
+                args.append(f'--fingerprint-canvas-noise={config["canvas_noise"]}')
+            if config.get("webgl_noise"):
+                args.append(f'--fingerprint-webgl-noise={config["webgl_noise"]}')
+            if config.get("audio_noise"):
+                args.append(f'--fingerprint-audio-noise={config["audio_noise"]}')
+            if config.get("clientRects_noise"):
+                args.append(f'--fingerprint-clientRects-noise={config["clientRects_noise"]}')
+            if config.get("webrtc_ip"):
+                args.append(f'--fingerprint-webrtc-ip={config["webrtc_ip"]}')
+            if config.get("timezone"):
+                args.append(f'--fingerprint-timezone={config["timezone"]}')
+            if config.get("language"):
+                args.append(f'--fingerprint-language={config["language"]}')
+
+            if config.get("proxy_id"):
+                proxy = self._proxies.get(config["proxy_id"])
+                if proxy is None:
+                    # 不能静默直连，否则会暴露本机真实 IP
+                    return {"success": False, "error": "绑定的代理不存在，请重新选择代理"}
+                args.append(proxy_server_arg(proxy))
+
+            display_mode = config.get("display_mode") or DEFAULT_DISPLAY_MODE
+            display = None
+            cgroup_path = None
+            env = None
+            if display_mode == "headless":
+                args.append('--headless=new')
+            try:
+                if display_mode == "xvfb":
+                    display = self._display_pool.acquire()
+                    env = {**os.environ, "DISPLAY": display.name}
+                cgroup_path = self._cgroups.prepare(profile_id, group, profile_limits, group_limits)
+                proc = self._launcher.spawn(args, env, cgroup_path)
+            except Exception as e:
+                if display is not None:
+                    self._display_pool.release(display)
+                if cgroup_path is not None:
+                    self._cgroups.remove(cgroup_path)
+                self.metrics.inc("launch_failure")
+                return {"success": False, "error": str(e)}
+            self.metrics.inc("launch_success")
+            self.metrics.launch_latency.observe(time.perf_counter() - started_at)
 
-function escapeHtml(s) {
-    const d = document.createElement('div');
-    d.textContent = s;
-    return d.innerHTML;
-}
+            pid = proc.pid
+            if lease_token:
+                self._leases.mark_started(profile_id, lease_token)
+            with self._lock:
+                self.running_processes[pid] = proc
+                if display is not None:
+                    self._displays[pid] = display
+                if cgroup_path is not None:
+                    self._cgroup_paths[pid] = {"profile_id": profile_id, "path": cgroup_path,
+                                                "counters": {}, "reported_at": {}}
+                profile["status"] = "running"
+                profile["pid"] = pid
+                self._save()
+            result = {"success": True, "pid": pid}
+            if (profile_limits or group_limits) and cgroup_path is None:
+                result["warning"] = "未配置 FPM_CGROUP_ROOT 或系统不支持 cgroup v2，资源限制未生效"
+            return result
+
+    def stop_profile(self, profile_id, lease_token=None):
+        profile_id = self._resolve_id(profile_id)
+        with self._profile_lock(profile_id):
+            with self._lock:
+                if profile_id not in self.profiles:
+                    return {"success": False, "error": "环境不存在"}
+                leased_by = self._leases.check(profile_id, lease_token)
+                if leased_by:
+                    return {"success": False, "error": leased_by}
+
+                profile = self.profiles[profile_id]
+                pid = profile.get("pid")
+                proc = self.running_processes.get(pid) if pid else None
+                if proc is not None:
+                    self._stopping.add(pid)
+
+            # 等待进程退出最多 5 秒，期间不能持有全局锁
+            if proc is not None:
+                try:
+                    self._launcher.terminate(proc)
+                    try:
+                        proc.wait(timeout=5)
+                    except subprocess.TimeoutExpired:
+                        self._launcher.kill(proc)
+                    self._launcher.cleanup(proc)
+                except Exception:
+                    pass
+
+            with self._lock:
+                if pid:
+                    self.running_processes.pop(pid, None)
+                    self._stopping.discard(pid)
+                    display = self._displays.pop(pid, None)
+                    cgroup = self._cgroup_paths.pop(pid, None)
+                else:
+                    display = cgroup = None
+                profile["status"] = "stopped"
+                profile["pid"] = None
+                self._save()
+            if display is not None:
+                self._display_pool.release(display)
+            if cgroup is not None:
+                self._cgroups.remove(cgroup["path"])
+            if proc is not None:
+                self._forget_storage(profile_id, profile.get("user_data_dir"))
+            return {"success": True}
 
-// Modal
-function openCreateModal() {
-    editingId = null;
-    document.getElementById('modalTitle').textContent = '新建环境';
-    document.getElementById('modalSaveBtn').textContent = '创建环境';
-    clearForm();
-    randomizeAll();
-    document.getElementById('profileModal').classList.add('active');
-}
+    # 运行期间统计的占用按目录 mtime 缓存，文件原地变大时 mtime 不变；
+    # 浏览器退出后丢掉这些条目，停止状态下的长期缓存从退出后的第一次完整扫描开始
+    def _forget_storage(self, profile_id, user_data_dir):
+        if user_data_dir:
+            self._storage.forget(user_data_dir)
+        if DISK_CACHE_ROOT:
+            self._storage.forget(os.path.join(DISK_CACHE_ROOT, profile_id))
+
+    # wait > 0 时最多阻塞 wait 秒排队等待；同一环境的等待者按先来后到获得租约
+    def acquire_lease(self, profile_id, holder, ttl=None, wait=0):
+        profile_id = self._resolve_id(profile_id)
+        with self._lock:
+            if profile_id not in self.profiles:
+                return {"success": False, "error": "环境不存在"}
+        lease, position = self._leases.acquire(profile_id, holder, ttl, float(wait or 0))
+        if lease is None:
+            return {"success": False, "error": "环境已被占用", "queue_length": position}
+        return {"success": True, "token": lease["token"], "ttl": lease["ttl"]}
+
+    def heartbeat_lease(self, profile_id, token, ttl=None):
+        profile_id = self._resolve_id(profile_id)
+        lease = self._leases.heartbeat(profile_id, token, ttl)
+        if lease is None:
+            return {"success": False, "error": "租约不存在或已过期"}
+        return {"success": True, "ttl": lease["ttl"]}
+
+    def release_lease(self, profile_id, token):
+        profile_id = self._resolve_id(profile_id)
+        if self._leases.release(profile_id, token) is None:
+            return {"success": False, "error": "租约不存在或已过期"}
+        return {"success": True}
 
-async function openEditModal(id) {
-    editingId = id;
-    document.getElementById('modalTitle').textContent = '编辑环境';
-    document.getElementById('modalSaveBtn').textContent = '保存修改';
-    const detail = await pywebview.api.get_profile_detail(id);
-    if (!detail) {
-        showToast('环境不存在', 'error');
-        return;
-    }
-    const cfg = detail.config || {};
-    document.getElementById('profileName').value = detail.name || '';
-    document.getElementById('fp_platform').value = cfg.platform || '';
-    document.getElementById('fp_hardwareConcurrency').value = cfg.hardwareConcurrency || '';
-    document.getElementById('fp_deviceMemory').value = cfg.deviceMemory || '';
-    document.getElementById('fp_maxTouchPoints').value = cfg.maxTouchPoints != null ? cfg.maxTouchPoints : '';
-    document.getElementById('fp_webgl_vendor').value = cfg.webgl_vendor || '';
-    document.getElementById('fp_webgl_renderer').value = cfg.webgl_renderer || '';
-    document.getElementById('fp_canvas_noise').value = cfg.canvas_noise || '';
-    document.getElementById('fp_webgl_noise').value = cfg.webgl_noise || '';
-    document.getElementById('fp_audio_noise').value = cfg.audio_noise || '';
-    document.getElementById('fp_clientRects_noise').value = cfg.clientRects_noise || '';
-    document.getElementById('fp_webrtc_ip').value = cfg.webrtc_ip || '';
-    document.getElementById('fp_timezone').value = cfg.timezone || '';
-    document.getElementById('fp_language').value = cfg.language || '';
-    document.getElementById('webglPreset').value = '';
-    document.getElementById('profileModal').classList.add('active');
-}
+    def get_leases(self):
+        return self._leases.snapshot()
 
-function closeModal() {
-    document.getElementById('profileModal').classList.remove('active');
-    editingId = null;
-}
+    def get_display_pool(self):
+        return self._display_pool.report()
 
-function clearForm() {
-    document.getElementById('profileName').value = '';
-    document.getElementById('fp_platform').value = '';
-    document.getElementById('fp_hardwareConcurrency').value = '';
-    document.getElementById('fp_deviceMemory').value = '';
-    document.getElementById('fp_maxTouchPoints').value = '';
-    document.getElementById('fp_webgl_vendor').value = '';
-    document.getElementById('fp_webgl_renderer').value = '';
-    document.getElementById('fp_canvas_noise').value = '';
-    document.getElementById('fp_webgl_noise').value = '';
-    document.getElementById('fp_audio_noise').value = '';
-    document.getElementById('fp_clientRects_noise').value = '';
-    document.getElementById('fp_webrtc_ip').value = '';
-    document.getElementById('fp_timezone').value = '';
-    document.getElementById('fp_language').value = '';
-    document.getElementById('webglPreset').value = '';
-}
+    def get_group_limits(self):
+        with self._lock:
+            return {"groups": dict(self._group_limits), "cgroup_enabled": self._cgroups.available}
 
-async function saveProfile() {
-    const name = document.getElementById('profileName').value.trim();
-    if (!name) {
-        showToast('请输入环境名称', 'error');
-        document.getElementById('profileName').focus();
-        return;
-    }
+    # 新的分组限制从下次启动起生效；limits 为空时删除该分组的限制
+    def set_group_limits(self, group, limits):
+        group = (group or "").strip().lower()
+        if not group:
+            return {"success": False, "error": "请填写分组"}
+        try:
+            limits = normalize_limits(limits)
+        except (ValueError, TypeError) as e:
+            return {"success": False, "error": str(e)}
+        with self._lock:
+            if limits:
+                self._group_limits[group] = limits
+            else:
+                self._group_limits.pop(group, None)
+            data = json.dumps({"groups": self._group_limits}, ensure_ascii=False, indent=2)
+            write_file_atomic(LIMITS_FILE, data)
+        return {"success": True}
 
-    const getVal = id => document.getElementById(id).value;
-
-    const config = {};
-    if (getVal('fp_platform')) config.platform = getVal('fp_platform');
-    if (getVal('fp_hardwareConcurrency')) config.hardwareConcurrency = parseInt(getVal('fp_hardwareConcurrency'));
-    if (getVal('fp_deviceMemory')) config.deviceMemory = parseInt(getVal('fp_deviceMemory'));
-    if (getVal('fp_maxTouchPoints') !== '') config.maxTouchPoints = parseInt(getVal('fp_maxTouchPoints'));
-    if (getVal('fp_webgl_vendor')) config.webgl_vendor = getVal('fp_webgl_vendor');
-    if (getVal('fp_webgl_renderer')) config.webgl_renderer = getVal('fp_webgl_renderer');
-    if (getVal('fp_canvas_noise')) config.canvas_noise = parseFloat(getVal('fp_canvas_noise'));
-    if (getVal('fp_webgl_noise')) config.webgl_noise = parseFloat(getVal('fp_webgl_noise'));
-    if (getVal('fp_audio_noise')) config.audio_noise = parseFloat(getVal('fp_audio_noise'));
-    if (getVal('fp_clientRects_noise')) config.clientRects_noise = parseFloat(getVal('fp_clientRects_noise'));
-    if (getVal('fp_webrtc_ip')) config.webrtc_ip = getVal('fp_webrtc_ip');
-    if (getVal('fp_timezone')) config.timezone = getVal('fp_timezone');
-    if (getVal('fp_language')) config.language = getVal('fp_language');
-
-    // 没填的参数用随机值
-    const rnd = await pywebview.api.get_random_profile();
-    if (!config.platform) config.platform = rnd.platform;
-    if (!config.hardwareConcurrency) config.hardwareConcurrency = rnd.hardwareConcurrency;
-    if (!config.deviceMemory) config.deviceMemory = rnd.deviceMemory;
-    if (config.maxTouchPoints == null || isNaN(config.maxTouchPoints)) config.maxTouchPoints = rnd.maxTouchPoints;
-    if (!config.webgl_vendor) config.webgl_vendor = rnd.webgl_vendor;
-    if (!config.webgl_renderer) config.webgl_renderer = rnd.webgl_renderer;
-    if (!config.canvas_noise) config.canvas_noise = rnd.canvas_noise;
-    if (!config.webgl_noise) config.webgl_noise = rnd.webgl_noise;
-    if (!config.audio_noise) config.audio_noise = rnd.audio_noise;
-    if (!config.clientRects_noise) config.clientRects_noise = rnd.clientRects_noise;
-    if (!config.webrtc_ip) config.webrtc_ip = rnd.webrtc_ip;
-    if (!config.timezone) config.timezone = rnd.timezone;
-    if (!config.language) config.language = rnd.language;
-
-    let result;
-    if (editingId) {
-        result = await pywebview.api.update_profile(editingId, name, config);
-    } else {
-        result = await pywebview.api.create_profile(name, config);
-    }
+    def get_resource_stats(self, profile_ids=None):
+        with self._lock:
+            cgroups = [c for c in self._cgroup_paths.values() if not profile_ids or c["profile_id"] in profile_ids]
+        return {c["profile_id"]: self._cgroups.stats(c["path"]) for c in cgroups}
 
-    if (result.success) {
-        showToast(editingId ? '环境已更新' : '环境创建成功', 'success');
-        closeModal();
-        refreshProfiles();
-    } else {
-        showToast(result.error || '操作失败', 'error');
-    }
-}
+    def get_resource_events(self, since=0):
+        with self._lock:
+            return [e for e in self._resource_events if e["seq"] > since]
 
-// Actions
-async function startProfile(id) {
-    const result = await pywebview.api.start_profile(id);
-    if (result.success) {
-        showToast('浏览器环境已启动', 'success');
-        refreshProfiles();
-    } else {
-        showToast(result.error || '启动失败', 'error');
-    }
-}
+    def get_profile_detail(self, profile_id):
+        profile_id = self._resolve_id(profile_id)
+        with self._lock:
+            if profile_id in self.profiles:
+                return {**self.profiles[profile_id], "id": profile_id}
+            return None
+
+    # 检查已存储的配置，已登记为有效的环境直接跳过；返回不合法的环境及原因
+    def validate_profiles(self, profile_ids=None):
+        started_at = time.perf_counter()
+        # ID 和配置分两个列表存放，不为每个环境分配元组，十万规模下可避免反复触发 GC
+        with self._lock:
+            ids = [p_id for p_id in (profile_ids or self.profiles)
+                   if p_id in self.profiles and p_id not in self._valid_ids]
+            configs = [self.profiles[p_id].get("config") for p_id in ids]
+        invalid = {}
+        for p_id, config in zip(ids, configs):
+            errors = validate_config(config)
+            if errors:
+                invalid[p_id] = errors
+        with self._lock:
+            # 检查期间被改过的配置不登记
+            self._valid_ids.update(p_id for p_id, config in zip(ids, configs)
+                                   if p_id not in invalid and p_id in self.profiles
+                                   and self.profiles[p_id].get("config") is config)
+        return {"checked": len(ids), "invalid": invalid,
+                "seconds": round(time.perf_counter() - started_at, 3)}
+
+    # 版本从新到旧；快照版本的 set 是完整配置。从未修改过的环境只有第 1 版
+    def get_profile_history(self, profile_id):
+        profile_id = self._resolve_id(profile_id)
+        with self._lock:
+            profile = self.profiles.get(profile_id)
+            if profile is None:
+                return {"success": False, "error": "环境不存在"}
+            config = dict(profile.get("config") or {})
+            created_at = profile.get("created_at")
+        records = self._history.read(profile_id) or [{"v": 1, "at": created_at, "full": config}]
+        versions = [{"version": r["v"], "at": r["at"], "snapshot": "full" in r,
+                     "set": r.get("full", r.get("set", {})), "unset": r.get("unset", [])}
+                    for r in reversed(records)]
+        return {"success": True, "current": records[-1]["v"], "versions": versions}
+
+    # 回滚也是一次修改：把配置恢复成 version 时的内容，并追加为新版本
+    def revert_profile(self, profile_id, version):
+        profile_id = self._resolve_id(profile_id)
+        with self._profile_lock(profile_id):
+            with self._lock:
+                profile = self.profiles.get(profile_id)
+                if profile is None:
+                    return {"success": False, "error": "环境不存在"}
+                if profile.get("status") == "running":
+                    return {"success": False, "error": "无法编辑正在运行的环境"}
+                previous = profile.get("config") or {}
+            config = self._history.config_at(profile_id, int(version))
+            if config is None:
+                if int(version) != 1 or self._history.read(profile_id):
+                    return {"success": False, "error": "该版本不存在或已被压缩"}
+                config = previous
+            with self._lock:
+                profile["config"] = config
+                self._valid_ids.discard(profile_id)
+                self._save()
+            new_version = self._history.record(profile_id, previous, config, profile.get("created_at"))
+            return {"success": True, "version": new_version, "config": config}
+
+    def get_storage_usage(self, profile_ids=None):
+        with self._lock:
+            targets = [(p_id, p["user_data_dir"], p.get("status") == "running")
+                       for p_id, p in self.profiles.items()
+                       if (not profile_ids or p_id in profile_ids) and p.get("user_data_dir")]
+
+        def measure(target):
+            p_id, user_data_dir, running = target
+            usage = self._storage.usage(user_data_dir, running)
+            if DISK_CACHE_ROOT:
+                usage["cache_bytes"] += self._storage.usage(os.path.join(DISK_CACHE_ROOT, p_id), running)["bytes"]
+            return {"id": p_id, **usage, "last_purge": self._purge_results.get(p_id)}
+
+        usages = self._storage.map(measure, targets)
+        return {
+            "profiles": usages,
+            "total_bytes": sum(u["bytes"] for u in usages),
+            "cache_bytes": sum(u["cache_bytes"] for u in usages),
+        }
 
-async function stopProfile(id) {
-    const result = await pywebview.api.stop_profile(id);
-    if (result.success) {
-        showToast('浏览器环境已停止', 'success');
-        refreshProfiles();
-    } else {
-        showToast(result.error || '停止失败', 'error');
-    }
-}
+    # 后台清理已停止环境的缓存；清理期间持有环境锁，避免与启动冲突
+    def purge_caches(self, profile_ids=None):
+        with self._lock:
+            targets = [p_id for p_id, p in self.profiles.items()
+                       if (not profile_ids or p_id in profile_ids) and p.get("status") != "running"]
+
+        def purge(p_id):
+            with self._profile_lock(p_id):
+                with self._lock:
+                    profile = self.profiles.get(p_id)
+                    if profile is None or profile.get("status") == "running":
+                        return
+                    user_data_dir = profile["user_data_dir"]
+                result = self._storage.purge_caches(user_data_dir)
+                if DISK_CACHE_ROOT:
+                    shutil.rmtree(os.path.join(DISK_CACHE_ROOT, p_id), ignore_errors=True)
+                self._purge_results[p_id] = {**result, "at": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+        for p_id in targets:
+            self._storage.submit(purge, p_id)
+        return {"success": True, "queued": len(targets)}
+
+    def _proxy_bindings(self):
+        counts = {}
+        with self._lock:
+            for p_data in self.profiles.values():
+                proxy_id = (p_data.get("config") or {}).get("proxy_id")
+                if proxy_id:
+                    counts[proxy_id] = counts.get(proxy_id, 0) + 1
+        return counts
+
+    def get_proxies(self):
+        counts = self._proxy_bindings()
+        # 密码不回传给前端
+        return [{**{k: v for k, v in p.items() if k not in ("password", "url")},
+                 "bound": counts.get(p["id"], 0)} for p in self._proxies.list()]
+
+    def import_proxies(self, text):
+        result = self._proxies.import_lines(text)
+        return {"success": True, "added": len(result["added"]), "invalid": result["invalid"]}
+
+    def delete_proxies(self, proxy_ids):
+        counts = self._proxy_bindings()
+        bound = [p_id for p_id in proxy_ids if counts.get(p_id)]
+        removed = self._proxies.remove([p_id for p_id in proxy_ids if not counts.get(p_id)])
+        if bound:
+            return {"success": False, "removed": removed, "error": f"{len(bound)} 个代理仍绑定在环境上，请先解绑"}
+        return {"success": True, "removed": removed}
+
+    # 健康检查在后台线程的事件循环里并发执行，结果写回代理池
+    def check_proxies(self, proxy_ids=None):
+        if self._proxy_check_thread is not None and self._proxy_check_thread.is_alive():
+            return {"success": False, "error": "代理检测正在进行中"}
+        proxies = [p for p in self._proxies.list() if not proxy_ids or p["id"] in proxy_ids]
+
+        def run():
+            try:
+                self._proxies.record_checks(asyncio.run(check_proxies_async(proxies)))
+            except Exception:
+                traceback.print_exc()
+
+        self._proxy_check_thread = threading.Thread(target=run, daemon=True)
+        self._proxy_check_thread.start()
+        return {"success": True, "queued": len(proxies)}
+
+    # proxy_id 为 "auto" 时自动选择负载最低的健康代理，为空时解绑
+    def bind_proxy(self, profile_id, proxy_id):
+        profile_id = self._resolve_id(profile_id)
+        if proxy_id == "auto":
+            proxy_id = self._proxies.pick(self._proxy_bindings())
+            if proxy_id is None:
+                return {"success": False, "error": "没有可用的代理"}
+        proxy = self._proxies.get(proxy_id) if proxy_id else None
+        if proxy_id and proxy is None:
+            return {"success": False, "error": "代理不存在"}
+        with self._profile_lock(profile_id):
+            with self._lock:
+                profile = self.profiles.get(profile_id)
+                if profile is None:
+                    return {"success": False, "error": "环境不存在"}
+                if profile.get("status") == "running":
+                    return {"success": False, "error": "无法修改正在运行的环境"}
+                previous = profile["config"]
+                if proxy is None:
+                    profile["config"] = {k: v for k, v in profile["config"].items() if k != "proxy_id"}
+                else:
+                    profile["config"] = align_config_to_proxy(profile["config"], {**proxy, "id": proxy_id})
+                self._valid_ids.discard(profile_id)
+                self._save()
+            self._history.record(profile_id, previous, profile["config"], profile.get("created_at"))
+            return {"success": True, "proxy_id": proxy_id, "config": profile["config"]}
+
+    def choose_archive_path(self, save):
+        import webview
+        window = webview.windows[0]
+        if save:
+            result = window.create_file_dialog(
+                webview.SAVE_DIALOG, save_filename=time.strftime("profiles-%Y%m%d-%H%M%S") + ARCHIVE_EXT)
+        else:
+            result = window.create_file_dialog(
+                webview.OPEN_DIALOG, file_types=('环境归档 (*.tar.zst;*.tar.gz)', '所有文件 (*.*)'))
+        if not result:
+            return None
+        return result if isinstance(result, str) else result[0]
+
+    def export_profiles(self, profile_ids, path):
+        started = time.perf_counter()
+        with self._lock:
+            profile_ids = list(profile_ids) if profile_ids else list(self.profiles)
+        manifest = {"format": ARCHIVE_FORMAT, "export_id": uuid.uuid4().hex,
+                    "exported_at": time.strftime("%Y-%m-%d %H:%M:%S"), "profiles": {}}
+        skipped = []
+        total_bytes = 0
+        part_path = path + ".part"
+        try:
+            with open_profile_archive(part_path, 'w') as tar:
+                # 清单放在第一个成员，导入时无需回读就能拿到全部配置
+                with self._lock:
+                    for p_id in profile_ids:
+                        if p_id in self.profiles:
+                            record = self.profiles[p_id]
+                            manifest["profiles"][p_id] = {k: v for k, v in record.items()
+                                                          if k not in ("status", "pid", "user_data_dir")}
+                data = json.dumps(manifest, ensure_ascii=False).encode('utf-8')
+                info = tarfile.TarInfo("manifest.json")
+                info.size = len(data)
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+
+                for p_id in manifest["profiles"]:
+                    # 持有环境锁，导出期间该环境不会被启动或删除
+                    with self._profile_lock(p_id):
+                        with self._lock:
+                            profile = self.profiles.get(p_id)
+                            if profile is None or profile.get("status") == "running":
+                                skipped.append(p_id)
+                                continue
+                            user_data_dir = profile.get("user_data_dir", "")
+                        if os.path.isdir(user_data_dir):
+                            total_bytes += add_profile_dir_to_archive(tar, user_data_dir, f"profiles/{p_id}")
+            os.replace(part_path, path)
+        except Exception as e:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            return {"success": False, "error": str(e)}
 
-function confirmDelete(id) {
-    const profile = allProfiles.find(p => p.id === id);
-    document.getElementById('confirmTitle').textContent = '删除环境';
-    document.getElementById('confirmMessage').textContent = `确定要删除环境 "${profile ? profile.name : id}" 吗？此操作将删除所有浏览器数据且不可恢复。`;
-    pendingConfirmAction = async () => {
-        const result = await pywebview.api.delete_profile(id);
-        if (result.success) {
-            showToast('环境已删除', 'success');
-            refreshProfiles();
-        } else {
-            showToast(result.error || '删除失败', 'error');
+        elapsed = time.perf_counter() - started
+        return {
+            "success": True,
+            "count": len(manifest["profiles"]) - len(skipped),
+            "skipped": skipped,
+            "bytes": total_bytes,
+            "archive_bytes": os.path.getsize(path),
+            "seconds": round(elapsed, 3),
+            "mb_per_sec": round(total_bytes / 1048576 / elapsed, 2) if elapsed > 0 else 0,
         }
-    };
-    document.getElementById('confirmOverlay').classList.add('active');
-}
 
-function confirmAction() {
-    if (pendingConfirmAction) {
-        pendingConfirmAction();
-        pendingConfirmAction = null;
-    }
-    closeConfirm();
-}
+    # 每个环境先解压到 .importing 暂存目录，完整解出后再改名并登记；
+    # 已登记的环境（imported_from 相同）在重复导入时直接跳过，中断后重新导入即可续传
+    def import_profiles(self, path):
+        # 归档来自外部，没有 data 过滤器时链接和设备文件可能写到用户目录以外，宁可拒绝导入
+        if not hasattr(tarfile, 'data_filter'):
+            return {"success": False, "error": "当前 Python 的 tarfile 不支持安全解压（需要 3.12 或带 data_filter 的补丁版本）"}
+        started = time.perf_counter()
+        staging_root = os.path.join(PROFILES_DIR, ".importing")
+        os.makedirs(staging_root, exist_ok=True)
+        imported = []
+        failed = {}
+        total_bytes = 0
+        try:
+            with open_profile_archive(path, 'r') as tar:
+                first = tar.next()
+                if first is None or first.name != "manifest.json":
+                    return {"success": False, "error": "不是有效的环境归档"}
+                manifest = json.load(tar.extractfile(first))
+                if manifest.get("format") != ARCHIVE_FORMAT:
+                    return {"success": False, "error": "不支持的归档版本"}
+                export_id = manifest["export_id"]
+                if not isinstance(manifest.get("profiles"), dict):
+                    return {"success": False, "error": "不是有效的环境归档"}
+                # 不合法的记录整条跳过（连同它的目录数据），在结果的 failed 里列出原因
+                records = {}
+                for old_id, record in manifest["profiles"].items():
+                    record, error = normalize_import_record(record)
+                    if error:
+                        failed[old_id] = error
+                    else:
+                        records[old_id] = record
+                with self._lock:
+                    done = {p.get("imported_from") for p in self.profiles.values() if p.get("imported_from")}
+
+                current = None
+                staging_dir = None
+                seen = set()
+
+                def commit():
+                    if current is not None and staging_dir is not None:
+                        new_id = self._commit_imported_profile(current, records[current], staging_dir,
+                                                               f"{export_id}/{current}")
+                        imported.append(new_id)
+
+                for member in tar:
+                    parts = member.name.split('/', 2)
+                    if len(parts) < 2 or parts[0] != "profiles" or parts[1] not in records:
+                        continue
+                    old_id = parts[1]
+                    if old_id != current:
+                        commit()
+                        current = old_id
+                        staging_dir = None
+                        seen.add(old_id)
+                        if f"{export_id}/{old_id}" in done:
+                            continue
+                        staging_dir = import_staging_dir(staging_root, export_id, old_id)
+                        if os.path.exists(staging_dir):
+                            shutil.rmtree(staging_dir)
+                        os.makedirs(staging_dir)
+                    if staging_dir is None or len(parts) < 3:
+                        continue
+                    rel = os.path.normpath(parts[2])
+                    if os.path.isabs(rel) or rel.startswith('..'):
+                        continue
+                    member.name = rel
+                    tar.extract(member, staging_dir, filter='data')
+                    if member.isreg():
+                        total_bytes += member.size
+                commit()
+                # 归档里没有目录数据的环境（例如导出时正在运行）只导入配置
+                for old_id, record in records.items():
+                    key = f"{export_id}/{old_id}"
+                    if old_id not in seen and key not in done:
+                        empty_dir = import_staging_dir(staging_root, export_id, old_id)
+                        os.makedirs(empty_dir, exist_ok=True)
+                        imported.append(self._commit_imported_profile(old_id, record, empty_dir, key))
+        except Exception as e:
+            return {"success": False, "error": str(e), "imported": imported, "failed": failed}
+
+        elapsed = time.perf_counter() - started
+        return {
+            "success": True,
+            "count": len(imported),
+            "imported": imported,
+            "failed": failed,
+            "bytes": total_bytes,
+            "seconds": round(elapsed, 3),
+            "mb_per_sec": round(total_bytes / 1048576 / elapsed, 2) if elapsed > 0 else 0,
+        }
 
-function closeConfirm() {
-    document.getElementById('confirmOverlay').classList.remove('active');
-}
+    def _commit_imported_profile(self, old_id, record, staging_dir, import_key):
+        with self._lock:
+            new_id = old_id
+            if (not isinstance(new_id, str) or not PROFILE_ID_PATTERN.fullmatch(new_id) or new_id in self.profiles
+                    or profile_alias(new_id) in self._index.aliases or os.path.exists(profile_dir_path(new_id))):
+                new_id = self._ids.allocate(self.profiles, self._index.aliases)
+            user_data_dir = profile_dir_path(new_id)
+            if not path_within(user_data_dir, PROFILES_DIR):
+                raise ValueError(f"环境目录超出 {PROFILES_DIR}: {user_data_dir}")
+            os.makedirs(os.path.dirname(user_data_dir), exist_ok=True)
+            os.replace(staging_dir, user_data_dir)
+            self.profiles[new_id] = {**record, "user_data_dir": user_data_dir, "status": "stopped",
+                                     "pid": None, "imported_from": import_key}
+            self._index.add(new_id, self.profiles[new_id])
+            self._valid_ids.add(new_id)
+            self._save()
+        return new_id
+
+
+# 本地静态资源服务器：带内容哈希的文件一年强缓存，index.html 每次协商。
+# http.server 导入较慢，只在显示窗口时才加载
+def start_asset_server():
+    import http.server
+
+    root = WEB_DIST_DIR if os.path.exists(os.path.join(WEB_DIST_DIR, "index.html")) else WEB_DIR
+    hashed_asset = re.compile(r"\.[0-9a-f]{10}\.(css|js)$")
+
+    class AssetRequestHandler(http.server.SimpleHTTPRequestHandler):
+        def end_headers(self):
+            if hashed_asset.search(self.path.split('?', 1)[0]):
+                self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+            else:
+                self.send_header("Cache-Control", "no-cache")
+            super().end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    handler = functools.partial(AssetRequestHandler, directory=root)
+    try:
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", UI_PORT), handler)
+    except OSError:
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/index.html"
+
+
+def start_metrics_server(api, host=None, port=None):
+    import http.server
+
+    class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = api.metrics.render(api).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host or METRICS_HOST, METRICS_PORT if port is None else port),
+                                             MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# 多机部署：每台机器以 --agent 运行无界面的 Api，向协调器注册并定期上报负载；
+# 协调器把启动请求放到负载最低的机器上，环境不在那台机器时先用导出/导入归档迁移用户目录
+CLUSTER_HEARTBEAT_SECONDS = float(os.environ.get("FPM_CLUSTER_HEARTBEAT", "5"))
+# 超过这么多个心跳周期没有消息的 agent 视为离线，不再分配环境
+CLUSTER_DEAD_AFTER_BEATS = 3
+# 协调器和 agent 之间的共享口令，放在 X-FPM-Token 请求头里；监听非回环地址时必须设置
+CLUSTER_TOKEN = os.environ.get("FPM_CLUSTER_TOKEN", "")
+# 单台 agent 的最大运行数，0 表示按 CPU 核数的两倍估算
+AGENT_MAX_RUNNING = int(os.environ.get("FPM_AGENT_MAX_RUNNING", "0"))
+# 环境当前所在机器的负载只比最优机器高这么多时就地启动，避免为一点负载差异搬运用户目录
+CLUSTER_MIGRATE_MARGIN = 0.2
+AGENT_METHODS = ("create_profile", "update_profile", "delete_profile", "start_profile", "stop_profile",
+                 "get_profile_detail", "get_profile_history", "revert_profile", "select_profiles",
+                 "acquire_lease", "heartbeat_lease", "release_lease", "get_leases")
+
+
+# body 可以是打开的文件，按块发送；指定 save_to 时二进制响应按块写入该文件并返回 None，
+# 对方返回 JSON（通常是错误）时照常解析返回
+def cluster_request(base_url, path, payload=None, body=None, timeout=30, save_to=None):
+    import urllib.request
+
+    headers = {"X-FPM-Token": CLUSTER_TOKEN} if CLUSTER_TOKEN else {}
+    if payload is not None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers["Content-Type"] = "application/json"
+    elif hasattr(body, "read"):
+        headers["Content-Length"] = str(os.fstat(body.fileno()).st_size)
+        headers["Content-Type"] = "application/octet-stream"
+    request = urllib.request.Request(base_url.rstrip("/") + path, data=body, headers=headers,
+                                     method="POST" if body is not None else "GET")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        if save_to is not None and response.headers.get("Content-Type") != "application/json":
+            with open(save_to, 'wb') as f:
+                shutil.copyfileobj(response, f, 1 << 20)
+            return None
+        return json.loads(response.read())
+
+
+def memory_info():
+    if psutil is not None:
+        mem = psutil.virtual_memory()
+        return mem.total, mem.available
+    try:
+        with open("/proc/meminfo", 'r') as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return (int(fields["MemTotal"].split()[0]) * 1024, int(fields["MemAvailable"].split()[0]) * 1024)
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def agent_capacity(api):
+    running = len(api.running_pids())
+    total = api.profile_count()
+    cpus = os.cpu_count() or 1
+    if hasattr(os, "getloadavg"):
+        load = os.getloadavg()[0]
+    elif psutil is not None:
+        load = psutil.cpu_percent() / 100 * cpus
+    else:
+        load = None
+    mem_total, mem_available = memory_info()
+    return {"cpus": cpus, "load": load, "mem_total": mem_total, "mem_available": mem_available,
+            "running": running, "profiles": total, "max_running": AGENT_MAX_RUNNING or cpus * 2}
+
+
+# 0 表示空闲，1 表示满载：取运行数、CPU 负载、内存占用三者中最紧张的一项
+def load_score(capacity):
+    scores = [capacity["running"] / max(1, capacity["max_running"])]
+    if capacity.get("load") is not None:
+        scores.append(capacity["load"] / max(1, capacity["cpus"]))
+    if capacity.get("mem_total"):
+        scores.append(1 - capacity["mem_available"] / capacity["mem_total"])
+    return max(scores)
+
+
+def make_json_handler(routes):
+    import http.server
+
+    class JsonRequestHandler(http.server.BaseHTTPRequestHandler):
+        def _dispatch(self):
+            if CLUSTER_TOKEN and not hmac.compare_digest(self.headers.get("X-FPM-Token", "").encode('utf-8'),
+                                                         CLUSTER_TOKEN.encode('utf-8')):
+                self.send_error(403)
+                return
+            parsed = urllib.parse.urlsplit(self.path)
+            handler = routes.get((self.command, parsed.path))
+            if handler is None:
+                self.send_error(404)
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            query = dict(urllib.parse.parse_qsl(parsed.query))
+
+            # 二进制请求体（导入归档）不读进内存，由处理函数指定落盘位置
+            def save_body(path):
+                remaining = length
+                with open(path, 'wb') as f:
+                    while remaining > 0:
+                        chunk = self.rfile.read(min(remaining, 1 << 20))
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        remaining -= len(chunk)
 
-// Detail
-async function viewDetail(id) {
-    const detail = await pywebview.api.get_profile_detail(id);
-    if (!detail) {
-        showToast('环境不存在', 'error');
-        return;
-    }
-    const cfg = detail.config || {};
-    const isRunning = detail.status === 'running';
-    document.getElementById('detailBody').innerHTML = `
-        <div style="display:flex;align-items:center;gap:16px;margin-bottom:24px;">
-            <div style="width:56px;height:56px;border-radius:16px;background:linear-gradient(135deg,var(--accent),var(--accent2));display:flex;align-items:center;justify-content:center;font-size:24px;font-weight:700;color:white;">
-                ${(detail.name || '?')[0].toUpperCase()}
-            </div>
-            <div>
-                <div style="font-size:20px;font-weight:700;">${escapeHtml(detail.name)}</div>
-                <div style="font-size:13px;color:var(--text3);font-family:monospace;">#${detail.id}</div>
-            </div>
-            <div class="status-badge ${isRunning ? 'running' : 'stopped'}" style="margin-left:auto;">
-                <span class="status-dot"></span>
-                ${isRunning ? '运行中' : '已停止'}
-            </div>
-        </div>
-        <div style="display:grid;grid-template-columns:1fr 1fr;gap:16px;">
-            ${detailItem('平台', cfg.platform)}
-            ${detailItem('CPU 核心数', cfg.hardwareConcurrency)}
-            ${detailItem('设备内存', cfg.deviceMemory ? cfg.deviceMemory + ' GB' : '-')}
-            ${detailItem('触摸点数', cfg.maxTouchPoints)}
-            ${detailItem('WebGL 供应商', cfg.webgl_vendor, true)}
-            ${detailItem('WebGL 渲染器', cfg.webgl_renderer, true)}
-            ${detailItem('Canvas 噪声', cfg.canvas_noise)}
-            ${detailItem('WebGL 噪声', cfg.webgl_noise)}
-            ${detailItem('Audio 噪声', cfg.audio_noise)}
-            ${detailItem('ClientRects 噪声', cfg.clientRects_noise)}
-            ${detailItem('WebRTC IP', cfg.webrtc_ip)}
-            ${detailItem('时区', cfg.timezone)}
-            ${detailItem('语言', cfg.language)}
-            ${detailItem('创建时间', detail.created_at)}
-        </div>
-    `;
-    document.getElementById('detailModal').classList.add('active');
-}
+            try:
+                if self.headers.get("Content-Type") == "application/json":
+                    result = handler(json.loads(self.rfile.read(length) or b"{}"), query, None)
+                else:
+                    result = handler(None, query, save_body)
+            except Exception as e:
+                traceback.print_exc()
+                result = {"success": False, "error": str(e)}
+            if isinstance(result, str):
+                # 返回临时文件路径：以二进制流发送后删除，用于导出归档
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/octet-stream")
+                    self.send_header("Content-Length", str(os.path.getsize(result)))
+                    self.end_headers()
+                    with open(result, 'rb') as f:
+                        shutil.copyfileobj(f, self.wfile)
+                finally:
+                    os.remove(result)
+                return
+            body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = _dispatch
+
+        def log_message(self, format, *args):
+            pass
+
+    return JsonRequestHandler
+
+
+def is_loopback_host(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def parse_listen(listen):
+    host, _, port = listen.rpartition(":")
+    host = host.strip("[]") or "127.0.0.1"
+    # agent 的 RPC 可以启停、删除环境，暴露到回环地址以外时不允许无口令运行
+    if not CLUSTER_TOKEN and not is_loopback_host(host):
+        raise SystemExit(f"监听非回环地址 {host} 时必须设置 FPM_CLUSTER_TOKEN")
+    return host, int(port)
+
+
+class ClusterAgent:
+    def __init__(self, api, coordinator_url, agent_id=None):
+        self.api = api
+        self.coordinator_url = coordinator_url
+        self.agent_id = agent_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+        self.url = None
+        self._registered = False
+
+    def routes(self):
+        return {("GET", "/capacity"): lambda *request: agent_capacity(self.api),
+                ("POST", "/rpc"): self.rpc,
+                ("GET", "/export"): self.export,
+                ("POST", "/import"): self.import_archive,
+                ("GET", "/profiles"): lambda *request: self.api.get_profiles()}
+
+    def rpc(self, payload, query, save_body):
+        method = payload.get("method")
+        if method not in AGENT_METHODS:
+            return {"success": False, "error": f"agent 不接受的方法: {method}"}
+        return {"success": True, "result": getattr(self.api, method)(*payload.get("args", []))}
+
+    def _transfer_path(self):
+        transfer_dir = os.path.join(PROFILES_DIR, ".transfer")
+        os.makedirs(transfer_dir, exist_ok=True)
+        return os.path.join(transfer_dir, f"{uuid.uuid4().hex}.fpm")
+
+    def export(self, payload, query, save_body):
+        path = self._transfer_path()
+        result = self.api.export_profiles(query["ids"].split(","), path)
+        if not result["success"]:
+            return result
+        if result.get("skipped"):
+            os.remove(path)
+            return {"success": False, "error": f"环境正在运行，无法迁移: {result['skipped']}"}
+        return path
+
+    def import_archive(self, payload, query, save_body):
+        path = self._transfer_path()
+        try:
+            save_body(path)
+            return self.api.import_profiles(path)
+        finally:
+            os.remove(path)
 
-function detailItem(label, value, wide) {
-    return `
-        <div style="${wide ? 'grid-column:1/-1;' : ''}background:var(--bg);padding:12px 16px;border-radius:10px;">
-            <div style="font-size:11px;color:var(--text3);text-transform:uppercase;letter-spacing:0.5px;margin-bottom:4px;">${label}</div>
-            <div style="font-size:13px;color:var(--text);word-break:break-all;">${value != null ? value : '-'}</div>
-        </div>
-    `;
-}
+    def heartbeat_loop(self):
+        while True:
+            try:
+                capacity = agent_capacity(self.api)
+                if not self._registered:
+                    profile_ids = self.api.profile_ids()
+                    cluster_request(self.coordinator_url, "/register",
+                                    {"agent_id": self.agent_id, "url": self.url, "capacity": capacity,
+                                     "profile_ids": profile_ids})
+                    self._registered = True
+                else:
+                    reply = cluster_request(self.coordinator_url, "/heartbeat",
+                                            {"agent_id": self.agent_id, "capacity": capacity})
+                    # 协调器重启后不认识这个 agent，重新注册并上报全部环境
+                    self._registered = reply.get("known", False)
+            except Exception as e:
+                print(f"[agent] 无法连接协调器 {self.coordinator_url}: {e}")
+                self._registered = False
+            time.sleep(CLUSTER_HEARTBEAT_SECONDS)
+
+
+# 同一台机器上跑多个 agent 时，每个 agent 的配置和用户目录都放在各自的数据目录下
+def use_data_dir(data_dir):
+    global PROFILES_DIR, CONFIG_FILE, PROXIES_FILE, SCHEDULE_FILE, LIMITS_FILE, HISTORY_DIR
+    PROFILES_DIR = os.path.join(data_dir, "profiles")
+    CONFIG_FILE = os.path.join(data_dir, "profiles_config.json")
+    PROXIES_FILE = os.path.join(data_dir, "proxies.json")
+    SCHEDULE_FILE = os.path.join(data_dir, "schedule.json")
+    LIMITS_FILE = os.path.join(data_dir, "resource_limits.json")
+    HISTORY_DIR = os.path.join(data_dir, "profile_history")
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+
+
+def run_agent(coordinator_url, listen="127.0.0.1:0", agent_id=None, advertise_url=None):
+    import http.server
 
-function closeDetailModal() {
-    document.getElementById('detailModal').classList.remove('active');
-}
+    api = Api()
+    api.profiles
+    agent = ClusterAgent(api, coordinator_url, agent_id)
+    server = http.server.ThreadingHTTPServer(parse_listen(listen), make_json_handler(agent.routes()))
+    agent.url = advertise_url or f"http://{server.server_address[0]}:{server.server_address[1]}"
+    threading.Thread(target=agent.heartbeat_loop, daemon=True).start()
+    print(f"[agent] {agent.agent_id} listening on {agent.url}", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        api._saver.flush()
+
+
+class ClusterCoordinator:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.agents = {}
+        # profile_id -> agent_id，由注册时上报的环境列表和之后的创建/迁移维护
+        self.placement = {}
+        self._profile_locks = {}
+
+    def routes(self):
+        return {("POST", "/register"): self.register,
+                ("POST", "/heartbeat"): self.heartbeat,
+                ("GET", "/agents"): lambda *request: self.list_agents(),
+                ("GET", "/placement"): lambda *request: dict(self.placement),
+                ("POST", "/profiles/create"): self.create_profile,
+                ("POST", "/profiles/start"): self.start_profile,
+                ("POST", "/profiles/stop"): self.stop_profile}
+
+    def register(self, payload, query, save_body):
+        with self._lock:
+            self.agents[payload["agent_id"]] = {"url": payload["url"], "capacity": payload["capacity"],
+                                                "last_seen": time.time()}
+            for p_id in payload.get("profile_ids", ()):
+                self.placement[p_id] = payload["agent_id"]
+        return {"success": True}
 
-// Toast
-function showToast(message, type) {
-    const container = document.getElementById('toastContainer');
-    const icons = { success: '✅', error: '❌', info: 'ℹ️' };
-    const toast = document.createElement('div');
-    toast.className = `toast ${type}`;
-    toast.innerHTML = `<span>${icons[type] || ''}</span> ${message}`;
-    container.appendChild(toast);
-    setTimeout(() => {
-        toast.style.opacity = '0';
-        toast.style.transform = 'translateX(100px)';
-        toast.style.transition = '0.3s ease';
-        setTimeout(() => toast.remove(), 300);
-    }, 3000);
-}
+    def heartbeat(self, payload, query, save_body):
+        with self._lock:
+            agent = self.agents.get(payload["agent_id"])
+            if agent is None:
+                return {"known": False}
+            agent["capacity"] = payload["capacity"]
+            agent["last_seen"] = time.time()
+        return {"known": True}
+
+    def _alive(self, agent):
+        return time.time() - agent["last_seen"] < CLUSTER_HEARTBEAT_SECONDS * CLUSTER_DEAD_AFTER_BEATS
+
+    def list_agents(self):
+        with self._lock:
+            return [{"agent_id": a_id, "url": a["url"], "alive": self._alive(a), "score": round(load_score(a["capacity"]), 3),
+                     **a["capacity"]} for a_id, a in self.agents.items()]
+
+    # 负载相同（例如都空闲）时按环境数量分散，避免新建的环境都堆在同一台机器上；
+    # 运行数已到上限的 agent 和 exclude 指定的 agent 不参与比较，没有可选的 agent 时返回 (None, None)
+    def _least_loaded(self, exclude=None):
+        with self._lock:
+            candidates = [(load_score(a["capacity"]), a["capacity"]["profiles"], a_id)
+                          for a_id, a in self.agents.items()
+                          if a_id != exclude and self._alive(a)
+                          and a["capacity"]["running"] < a["capacity"]["max_running"]]
+        if not candidates:
+            return None, None
+        score, _, agent_id = min(candidates)
+        return score, agent_id
+
+    def _rpc(self, agent_id, method, *args):
+        with self._lock:
+            url = self.agents[agent_id]["url"]
+        reply = cluster_request(url, "/rpc", {"method": method, "args": list(args)})
+        if not reply["success"]:
+            raise RuntimeError(reply["error"])
+        return reply["result"]
+
+    # 在心跳之间本地预估负载变化，避免同一批请求全部落到同一台机器
+    def _adjust(self, agent_id, key, delta):
+        with self._lock:
+            capacity = self.agents[agent_id]["capacity"]
+            capacity[key] = max(0, capacity[key] + delta)
+
+    def _profile_lock(self, profile_id):
+        with self._lock:
+            return self._profile_locks.setdefault(profile_id, threading.Lock())
+
+    def create_profile(self, payload, query, save_body):
+        _, agent_id = self._least_loaded()
+        if agent_id is None:
+            return {"success": False, "error": "没有在线且未满载的 agent"}
+        result = self._rpc(agent_id, "create_profile", payload["name"], payload["config"],
+                           payload.get("tags"), payload.get("group"))
+        if result.get("success"):
+            with self._lock:
+                self.placement[result["id"]] = agent_id
+            self._adjust(agent_id, "profiles", 1)
+            result["agent_id"] = agent_id
+        return result
 
-// Start
-window.addEventListener('pywebviewready', init);
-</script>
-</body>
-</html>
-"""
+    def migrate(self, profile_id, source, target):
+        with self._lock:
+            source_url = self.agents[source]["url"]
+            target_url = self.agents[target]["url"]
+        # 归档经协调器本地的临时文件按块转发，不整个读进内存
+        fd, archive_path = tempfile.mkstemp(suffix=".fpm")
+        os.close(fd)
+        try:
+            error = cluster_request(source_url, f"/export?ids={urllib.parse.quote(profile_id)}",
+                                    timeout=600, save_to=archive_path)
+            if error is not None:
+                raise RuntimeError(error["error"])
+            with open(archive_path, 'rb') as archive:
+                result = cluster_request(target_url, "/import", body=archive, timeout=600)
+        finally:
+            os.remove(archive_path)
+        imported = result.get("imported") or []
+        if not result.get("success") or len(imported) != 1:
+            # 导入了但结果不对时删掉目标上的副本，源 agent 上的环境保持不变
+            for new_id in imported:
+                self._rpc(target, "delete_profile", new_id)
+            raise RuntimeError(f"迁移到 {target} 失败: {result}")
+        # 目标 agent 上 ID 已被占用时导入会分配新 ID，之后按新 ID 记录位置
+        new_id = imported[0]
+        self._rpc(source, "delete_profile", profile_id)
+        with self._lock:
+            self.placement.pop(profile_id, None)
+            self.placement[new_id] = target
+        self._adjust(source, "profiles", -1)
+        self._adjust(target, "profiles", 1)
+        return new_id
+
+    def start_profile(self, payload, query, save_body):
+        profile_id = payload["profile_id"]
+        with self._profile_lock(profile_id):
+            with self._lock:
+                owner = self.placement.get(profile_id)
+                owner_agent = self.agents.get(owner)
+            if owner_agent is None:
+                return {"success": False, "error": "环境不在任何已注册的 agent 上"}
+            best_score, target = self._least_loaded(exclude=owner)
+            owner_capacity = owner_agent["capacity"]
+            if (self._alive(owner_agent) and owner_capacity["running"] < owner_capacity["max_running"]
+                    and (target is None or load_score(owner_capacity) <= best_score + CLUSTER_MIGRATE_MARGIN)):
+                target = owner
+            else:
+                if not self._alive(owner_agent):
+                    return {"success": False, "error": f"环境所在的 agent {owner} 已离线"}
+                if target is None:
+                    return {"success": False, "error": "所有 agent 都已满载"}
+                profile_id = self.migrate(profile_id, owner, target)
+            result = self._rpc(target, "start_profile", profile_id, payload.get("lease_token"))
+            if result.get("success"):
+                self._adjust(target, "running", 1)
+            return {**result, "profile_id": profile_id, "agent_id": target,
+                    "migrated_from": owner if target != owner else None}
+
+    def stop_profile(self, payload, query, save_body):
+        profile_id = payload["profile_id"]
+        with self._profile_lock(profile_id):
+            with self._lock:
+                owner = self.placement.get(profile_id)
+            if owner not in self.agents:
+                return {"success": False, "error": "环境不在任何已注册的 agent 上"}
+            result = self._rpc(owner, "stop_profile", profile_id, payload.get("lease_token"))
+            if result.get("success"):
+                self._adjust(owner, "running", -1)
+            return {**result, "agent_id": owner}
+
+
+def run_coordinator(listen="127.0.0.1:18400"):
+    import http.server
+
+    coordinator = ClusterCoordinator()
+    server = http.server.ThreadingHTTPServer(parse_listen(listen), make_json_handler(coordinator.routes()))
+    print(f"[coordinator] listening on http://{server.server_address[0]}:{server.server_address[1]}", flush=True)
+    server.serve_forever()
 
 
 if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agent", metavar="COORDINATOR_URL", help="以无界面 agent 运行并向该协调器注册")
+    parser.add_argument("--coordinator", action="store_true", help="以协调器运行")
+    parser.add_argument("--listen", help="agent / 协调器的监听地址 host:port")
+    parser.add_argument("--agent-id")
+    parser.add_argument("--advertise", help="协调器访问本 agent 用的 URL，默认取监听地址")
+    parser.add_argument("--data-dir", help="agent 的配置和环境目录，默认使用程序目录")
+    cli = parser.parse_args()
+    if cli.data_dir:
+        use_data_dir(cli.data_dir)
+    if cli.coordinator:
+        run_coordinator(cli.listen or "127.0.0.1:18400")
+        sys.exit(0)
+    if cli.agent:
+        run_agent(cli.agent, cli.listen or "127.0.0.1:0", cli.agent_id, cli.advertise)
+        sys.exit(0)
+
+    # 最小化控制台窗口
+    if sys.platform == 'win32':
+        import ctypes
+        ctypes.windll.user32.ShowWindow(ctypes.windll.kernel32.GetConsoleWindow(), 6)
+
+    # GUI 工具包只在真正显示窗口时导入，benchmarks 等脚本 import main 时不需要它
+    import webview
+
     api = Api()
+    if METRICS_PORT:
+        start_metrics_server(api)
+    url = start_asset_server()
+    api.window_created_at = time.perf_counter()
     window = webview.create_window(
         '指纹浏览器管理器',
-        html=HTML,
+        url=url,
         js_api=api,
         width=1280,
         height=850,
@@ -1604,4 +4040,6 @@ if __name__ == '__main__':
         background_color='#0f1117',
         text_select=False
     )
-    webview.start(debug=False)
+    # 关闭隐私模式，静态资源的 HTTP 缓存才能在多次启动间保留
+    webview.start(debug=False, private_mode=False)
+    api._saver.flush()
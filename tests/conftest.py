@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import fake_chrome  # noqa: E402
+import main  # noqa: E402
+
+PATCHED = ("CHROME_PATH", "PROFILES_DIR", "CONFIG_FILE", "PROXIES_FILE", "SCHEDULE_FILE", "LIMITS_FILE",
+           "HISTORY_DIR", "CGROUP_ROOT")
+
+
+# 数据文件都放在 tmp_path 下的 Api，不跑后台监控线程；启动器测试另有自己的版本
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    for name in PATCHED:
+        monkeypatch.setattr(main, name, getattr(main, name))
+    fake_chrome.install(str(tmp_path))
+    main.CGROUP_ROOT = ""
+    monkeypatch.setattr(main.Api, "_monitor_processes", lambda self: None)
+    api = main.Api()
+    api.profiles
+    yield api
+    for p_id in list(api.profiles):
+        api.stop_profile(p_id)
+    # 防抖写入要在 monkeypatch 还原路径之前落盘，否则会写到仓库里的数据文件
+    for saver in (api._saver, api._proxies._saver, api._scheduler._saver):
+        saver.flush()
+
+
+@pytest.fixture
+def make_profile(api):
+    def make(name="p", tags=None, group=None, **config):
+        result = api.create_profile(name, {**main.generate_random_profile(), **config}, tags, group)
+        assert result["success"], result
+        return result["id"]
+    return make
@@ -0,0 +1,107 @@
+# 筛选表达式与批量操作：索引加速的条件和逐个匹配的条件结果一致，参数缺失时返回错误而不是抛异常
+import pytest
+
+import main
+
+
+@pytest.fixture
+def fleet(make_profile):
+    return {
+        "eu1": make_profile("shop eu 1", tags=["shop", "eu"], group="Farm", platform="Win32"),
+        "eu2": make_profile("shop eu 2", tags="shop, EU", group="farm", platform="MacIntel"),
+        "us": make_profile("shop us", tags=["shop", "us"], group="Other", platform="Win32"),
+        "bare": make_profile("bare"),
+    }
+
+
+def test_parse_selector():
+    assert main.parse_selector("tag:a,B -status:running group:") == [
+        ("tag", ["a", "b"], False), ("status", ["running"], True), ("group", [""], False)]
+    assert main.parse_selector("  ") == []
+    with pytest.raises(ValueError):
+        main.parse_selector("colour:red")
+
+
+def test_select_profiles(api, fleet):
+    def select(selector):
+        return sorted(k for k, v in fleet.items() if v in api.select_profiles(selector))
+
+    assert select("") == ["bare", "eu1", "eu2", "us"]
+    assert select("tag:eu") == ["eu1", "eu2"]
+    assert select("tag:eu,us") == ["eu1", "eu2", "us"]
+    assert select("tag:shop -tag:us") == ["eu1", "eu2"]
+    assert select("group:farm platform:win32") == ["eu1"]
+    assert select("-group:farm") == ["bare", "us"]
+    assert select("group:") == ["bare"]
+    assert select("status:stopped tag:us") == ["us"]
+    assert select("name:bare") == ["bare"]
+    assert select(f"id:{main.profile_alias(fleet['us'])}") == ["us"]
+    assert select("eu") == ["eu1", "eu2"]
+
+
+def test_bulk_operation_rejects_unknown_action_and_selector(api, fleet):
+    assert not api.bulk_operation("", "explode")["success"]
+    result = api.bulk_operation("colour:red", "stop")
+    assert not result["success"]
+    assert "colour" in result["error"]
+
+
+@pytest.mark.parametrize("action, params, missing", [
+    ("export", None, "path"),
+    ("update", {"field": "timezone"}, "value"),
+    ("update", {"value": "Asia/Tokyo"}, "field"),
+    ("tag", {}, "tags"),
+    ("untag", {"tags": None}, "tags"),
+])
+def test_bulk_operation_reports_missing_params(api, fleet, action, params, missing):
+    result = api.bulk_operation("tag:eu", action, params)
+    assert result == {"success": False, "error": f"批量操作 {action} 缺少参数: {missing}"}
+
+
+def test_bulk_tag_untag_and_group_update_the_index(api, fleet):
+    result = api.bulk_operation("tag:eu", "tag", {"tags": "Promo, sale"})
+    assert result["success"]
+    assert sorted(result["done"]) == sorted([fleet["eu1"], fleet["eu2"]])
+    assert api.select_profiles("tag:promo") == sorted([fleet["eu1"], fleet["eu2"]])
+
+    assert api.bulk_operation("tag:promo", "untag", {"tags": ["promo"]})["success"]
+    assert api.select_profiles("tag:promo") == []
+    assert api.get_tags()["tags"]["sale"] == 2
+
+    assert api.bulk_operation("group:farm", "group", {"group": "Moved"})["success"]
+    assert api.select_profiles("group:moved") == sorted([fleet["eu1"], fleet["eu2"]])
+    assert "farm" not in api.get_tags()["groups"]
+
+
+def test_bulk_update_validates_each_value(api, fleet):
+    result = api.bulk_operation("tag:shop", "update", {"field": "timezone", "value": "Asia/Tokyo"})
+    assert result["success"]
+    assert result["matched"] == 3
+    assert all(api.get_profile_detail(p)["config"]["timezone"] == "Asia/Tokyo" for p in result["done"])
+
+    result = api.bulk_operation("tag:shop", "update", {"field": "deviceMemory", "value": "huge"})
+    assert not result["success"]
+    assert sorted(result["failed"]) == sorted(api.select_profiles("tag:shop"))
+    assert all(api.get_profile_detail(p)["config"]["deviceMemory"] != "huge" for p in result["failed"])
+
+
+def test_bulk_start_stop_and_delete(api, fleet):
+    result = api.bulk_operation("group:farm", "start")
+    assert result["success"]
+    assert api.select_profiles("status:running") == sorted([fleet["eu1"], fleet["eu2"]])
+    assert api.bulk_operation("status:running", "stop")["success"]
+    assert api.select_profiles("status:running") == []
+
+    result = api.bulk_operation("tag:us", "delete")
+    assert result["done"] == [fleet["us"]]
+    assert api.get_profile_detail(fleet["us"]) is None
+    assert "us" not in api.get_tags()["tags"]
+
+
+def test_bulk_export_writes_matching_profiles(api, fleet, tmp_path):
+    path = str(tmp_path / "eu.fpm")
+    result = api.bulk_operation("tag:eu", "export", {"path": path})
+    assert result["success"]
+    assert result["matched"] == 2
+    assert api.import_profiles(path)["count"] == 2
+    assert len(api.select_profiles("tag:eu")) == 4
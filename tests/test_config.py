@@ -0,0 +1,85 @@
+# 配置校验与规范化：旧版本写入的宽松取值要被规范化，不合法的配置要被拒绝
+import main
+
+NVIDIA = main.WEBGL_CONFIGS[0]
+INTEL = main.WEBGL_CONFIGS[-1]
+
+
+def test_legacy_values_are_normalized():
+    config, errors = main.normalize_config({
+        "platform": " Win32 ",
+        "hardwareConcurrency": "8",
+        "deviceMemory": 8.0,
+        "maxTouchPoints": "0",
+        "canvas_noise": "0.01",
+        "webrtc_ip": " 10.0.0.1 ",
+        "timezone": "Europe/Lisbon",
+        "language": "",
+        "proxy_id": None,
+    })
+    assert errors == []
+    assert config == {"platform": "Win32", "hardwareConcurrency": 8, "deviceMemory": 8, "maxTouchPoints": 0,
+                      "canvas_noise": 0.01, "webrtc_ip": "10.0.0.1", "timezone": "Europe/Lisbon"}
+    assert main.validate_config(config) == []
+
+
+def test_generated_profile_is_valid():
+    config = main.generate_random_profile()
+    assert main.normalize_config(config) == (config, [])
+    assert main.validate_config(config) == []
+
+
+def test_invalid_values_are_reported_per_field():
+    config, errors = main.normalize_config({
+        "platform": "<img src=x onerror=alert(1)>",
+        "hardwareConcurrency": True,
+        "deviceMemory": 4096,
+        "canvas_noise": 1.5,
+        "webrtc_ip": "not-an-ip",
+        "timezone": "Mars/Olympus",
+        "evil": 1,
+    })
+    fields = sorted(error.split(":")[0] for error in errors)
+    assert fields == ["canvas_noise", "deviceMemory", "evil", "hardwareConcurrency", "platform", "timezone",
+                      "webrtc_ip"]
+    assert config == {}
+
+
+def test_webgl_renderer_must_match_vendor():
+    _, errors = main.normalize_config({"webgl_vendor": NVIDIA["vendor"], "webgl_renderer": INTEL["renderer"]})
+    assert errors == ["webgl_renderer: 与 webgl_vendor 不匹配"]
+    assert main.validate_config({"webgl_vendor": NVIDIA["vendor"], "webgl_renderer": INTEL["renderer"]})
+
+
+def test_non_dict_config_is_rejected():
+    assert main.normalize_config(["platform"]) == (None, ["配置必须是对象"])
+    assert main.validate_config(None) == ["配置必须是对象"]
+
+
+def test_validate_config_falls_back_to_full_check_for_unnormalized_values():
+    # 快速判断只认规范化后的类型，"8" 要走完整校验，结果仍然合法
+    assert main.validate_config({"hardwareConcurrency": "8"}) == []
+    assert main.validate_config({"hardwareConcurrency": "0"}) == ["hardwareConcurrency: 应为1-256 的整数"]
+
+
+def test_create_and_update_reject_invalid_config(api, make_profile):
+    result = api.create_profile("bad", {"deviceMemory": -1})
+    assert not result["success"]
+    assert "deviceMemory" in result["error"]
+
+    profile_id = make_profile()
+    before = api.get_profile_detail(profile_id)["config"]
+    result = api.update_profile(profile_id, "p", {**before, "timezone": "Nowhere/Else"})
+    assert not result["success"]
+    assert api.get_profile_detail(profile_id)["config"] == before
+
+
+def test_validate_profiles_flags_stored_legacy_config(api, make_profile):
+    good = make_profile()
+    legacy = make_profile()
+    with api._lock:
+        api.profiles[legacy]["config"] = {**api.profiles[legacy]["config"], "deviceMemory": "lots"}
+        api._valid_ids.discard(legacy)
+    result = api.validate_profiles()
+    assert list(result["invalid"]) == [legacy]
+    assert good not in result["invalid"]
@@ -0,0 +1,59 @@
+# 配置历史：增量记录、回滚和压缩后仍能还原出每个保留版本的完整配置
+import main
+
+
+def test_delta_round_trip():
+    old = {"a": 1, "b": 2, "c": 3}
+    new = {"a": 1, "b": 5, "d": 4}
+    delta = main.config_delta(old, new)
+    assert delta == {"set": {"b": 5, "d": 4}, "unset": ["c"]}
+    assert main.apply_config_delta(old, delta) == new
+    assert main.config_delta(new, dict(new)) == {}
+
+
+def test_update_records_versions_and_revert_restores(api, make_profile):
+    profile_id = make_profile(timezone="Europe/Berlin")
+    original = api.get_profile_detail(profile_id)["config"]
+    assert api.get_profile_history(profile_id)["current"] == 1
+
+    api.update_profile(profile_id, "p", {**original, "timezone": "Europe/Paris"})
+    api.update_profile(profile_id, "p", {**original, "timezone": "Europe/Rome", "deviceMemory": 1000})
+    history = api.get_profile_history(profile_id)
+    assert history["current"] == 3
+    assert [v["version"] for v in history["versions"]] == [3, 2, 1]
+    assert history["versions"][0]["set"] == {"timezone": "Europe/Rome", "deviceMemory": 1000}
+
+    result = api.revert_profile(profile_id, 1)
+    assert result["success"]
+    assert result["version"] == 4
+    assert api.get_profile_detail(profile_id)["config"] == original
+
+
+def test_unchanged_update_adds_no_version(api, make_profile):
+    profile_id = make_profile()
+    config = api.get_profile_detail(profile_id)["config"]
+    api.update_profile(profile_id, "renamed", config)
+    assert api.get_profile_history(profile_id)["current"] == 1
+
+
+def test_compaction_keeps_recent_versions_reconstructible(api, make_profile, monkeypatch):
+    monkeypatch.setattr(main, "HISTORY_KEEP_VERSIONS", 3)
+    profile_id = make_profile()
+    base = api.get_profile_detail(profile_id)["config"]
+    expected = {1: base}
+    for version in range(2, 12):
+        config = {**base, "deviceMemory": 100 + version}
+        api.update_profile(profile_id, "p", config)
+        expected[version] = config
+    assert len(api._history.read(profile_id)) <= 2 * 3
+    versions = [v["version"] for v in api.get_profile_history(profile_id)["versions"]]
+    assert versions[0] == 11
+    for version in versions:
+        assert api._history.config_at(profile_id, version) == expected[version]
+    # 被压缩掉的版本不能再回滚
+    assert not api.revert_profile(profile_id, 2)["success"]
+
+
+def test_revert_refuses_unknown_version(api, make_profile):
+    profile_id = make_profile()
+    assert not api.revert_profile(profile_id, 7)["success"]
@@ -0,0 +1,138 @@
+# 启动器回归测试：用 benchmarks/fake_chrome.py 代替真浏览器，检查启动、停止时整个进程组被结束，
+# 以及浏览器崩溃后由监控流程回收残留子进程和相关资源
+#
+#   python -m pytest -q tests
+import os
+import signal
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import fake_chrome  # noqa: E402
+import main  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="按 /proc 检查进程组，仅支持 Linux")
+
+CHILDREN = 2
+PATCHED = ("CHROME_PATH", "PROFILES_DIR", "CONFIG_FILE", "PROXIES_FILE", "SCHEDULE_FILE", "LIMITS_FILE",
+           "HISTORY_DIR", "CGROUP_ROOT")
+
+
+# 进程组里还活着（不是僵尸）的进程
+def group_members(pgid):
+    members = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", 'r') as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if fields[0] != "Z" and int(fields[2]) == pgid:
+            members.append(int(name))
+    return members
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    for name in PATCHED:
+        monkeypatch.setattr(main, name, getattr(main, name))
+    monkeypatch.setenv("FAKE_CHROME_CHILDREN", str(CHILDREN))
+    fake_chrome.install(str(tmp_path))
+    # 假的 cgroup 根目录：只检查创建和回收的簿记，不真正限制资源
+    cgroup_root = tmp_path / "cgroup"
+    cgroup_root.mkdir()
+    (cgroup_root / "cgroup.controllers").write_text("cpu memory pids\n")
+    main.CGROUP_ROOT = str(cgroup_root)
+    # 不跑后台监控线程，崩溃回收只由测试里显式的 get_profiles 触发，结果不受时序影响
+    monkeypatch.setattr(main.Api, "_monitor_processes", lambda self: None)
+    api = main.Api()
+    api.profiles
+    yield api
+    for p_id in list(api.profiles):
+        api.stop_profile(p_id)
+    api._saver.flush()
+
+
+def start(api):
+    config = main.generate_random_profile()
+    config["limits"] = {"memory_mb": 512}
+    profile_id = api.create_profile("launcher-test", config)["id"]
+    result = api.start_profile(profile_id)
+    assert result["success"], result
+    pid = result["pid"]
+    assert wait_until(lambda: len(group_members(pid)) == 1 + CHILDREN)
+    return profile_id, pid
+
+
+def test_spawn_puts_browser_in_own_process_group(api):
+    profile_id, pid = start(api)
+    assert os.getpgid(pid) == pid
+    assert os.getpgid(pid) != os.getpgid(0)
+    assert pid in api.running_processes
+    cgroup = api._cgroup_paths[pid]
+    assert cgroup["profile_id"] == profile_id
+    with open(os.path.join(cgroup["path"], "cgroup.procs"), 'r') as f:
+        assert f.read().strip() == str(pid)
+    detail = api.get_profile_detail(profile_id)
+    assert detail["status"] == "running"
+    assert detail["pid"] == pid
+
+
+def test_stop_kills_whole_group(api):
+    profile_id, pid = start(api)
+    assert api.stop_profile(profile_id)["success"]
+    assert wait_until(lambda: not group_members(pid))
+    assert pid not in api.running_processes
+    assert pid not in api._cgroup_paths
+    assert api.get_profile_detail(profile_id)["status"] == "stopped"
+    assert api.metrics.counters["crashes"] == 0
+
+
+def test_crash_cleans_up_children_and_resources(api):
+    profile_id, pid = start(api)
+    os.kill(pid, signal.SIGKILL)
+    assert wait_until(lambda: api.running_processes[pid].poll() is not None)
+    # 主进程死了，子进程还在同一个进程组里
+    assert len(group_members(pid)) == CHILDREN
+    profiles = api.get_profiles()
+    assert [p["status"] for p in profiles if p["id"] == profile_id] == ["stopped"]
+    assert wait_until(lambda: not group_members(pid))
+    assert pid not in api.running_processes
+    assert pid not in api._cgroup_paths
+    assert api.metrics.counters["crashes"] == 1
+
+
+def test_missing_binary_is_reported(api):
+    main.CHROME_PATH = os.path.join(main.PROFILES_DIR, "no-such-chrome")
+    profile_id = api.create_profile("missing", main.generate_random_profile())["id"]
+    result = api.start_profile(profile_id)
+    assert not result["success"]
+    assert "no-such-chrome" in result["error"]
+    assert api.metrics.counters["launch_failure"] == 1
+
+
+def test_cgroup_join_failure_does_not_leave_browser_running(api, monkeypatch):
+    missing = os.path.join(main.CGROUP_ROOT, "missing", "profile")
+    monkeypatch.setattr(api._cgroups, "prepare", lambda *args: missing)
+    config = main.generate_random_profile()
+    config["limits"] = {"memory_mb": 512}
+    profile_id = api.create_profile("cgroup-fail", config)["id"]
+    result = api.start_profile(profile_id)
+    assert not result["success"]
+    assert "cgroup" in result["error"]
+    assert not api.running_processes
+    assert api.get_profile_detail(profile_id)["status"] == "stopped"
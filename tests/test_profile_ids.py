@@ -0,0 +1,70 @@
+# 环境 ID：按创建时间有序、短 ID 不重复，接受环境 ID 的接口都能用 8 位短 ID 调用
+import main
+
+
+def test_allocated_ids_are_unique_sorted_and_well_formed():
+    allocator = main.ProfileIdAllocator()
+    profiles, aliases = {}, {}
+    ids = []
+    for _ in range(2000):
+        profile_id = allocator.allocate(profiles, aliases)
+        profiles[profile_id] = {}
+        aliases[main.profile_alias(profile_id)] = profile_id
+        ids.append(profile_id)
+    assert len(set(ids)) == len(ids) == len(aliases)
+    assert all(main.PROFILE_ID_PATTERN.fullmatch(p_id) for p_id in ids)
+    # 同一毫秒内的后缀是随机的，只比较时间戳部分
+    assert [p_id[:12] for p_id in ids] == sorted(p_id[:12] for p_id in ids)
+
+
+def test_allocator_does_not_go_backwards(monkeypatch):
+    allocator = main.ProfileIdAllocator()
+    first = allocator.allocate({}, {})
+    monkeypatch.setattr(main.time, "time", lambda: 0.0)
+    assert allocator.allocate({}, {})[:12] == first[:12]
+
+
+def test_legacy_id_is_its_own_alias():
+    assert main.profile_alias("abcdef12") == "abcdef12"
+
+
+def test_short_id_works_for_profile_methods(api, make_profile):
+    profile_id = make_profile(timezone="Europe/Berlin")
+    alias = main.profile_alias(profile_id)
+    assert alias != profile_id
+
+    assert api.get_profile_detail(alias)["id"] == profile_id
+    config = {**api.get_profile_detail(alias)["config"], "timezone": "Asia/Tokyo"}
+    assert api.update_profile(alias, "renamed", config)["success"]
+    assert api.get_profile_detail(profile_id)["name"] == "renamed"
+    assert api.get_profile_history(alias)["current"] == 2
+
+    lease = api.acquire_lease(alias, "tester")
+    assert lease["success"]
+    assert api.heartbeat_lease(alias, lease["token"])["success"]
+    assert api.release_lease(alias, lease["token"])["success"]
+
+    assert api.start_profile(alias)["success"]
+    assert api.get_profile_detail(profile_id)["status"] == "running"
+    assert api.stop_profile(alias)["success"]
+
+    assert api.delete_profile(alias)["success"]
+    assert api.get_profile_detail(profile_id) is None
+    assert api.get_profile_detail(alias) is None
+
+
+def test_bind_proxy_accepts_short_id(api, make_profile):
+    profile_id = make_profile()
+    api.import_proxies("127.0.0.1:8080")
+    proxy_id = api.get_proxies()[0]["id"]
+    result = api.bind_proxy(main.profile_alias(profile_id), proxy_id)
+    assert result["success"], result
+    assert api.get_profile_detail(profile_id)["config"]["proxy_id"] == proxy_id
+    assert api.get_proxies()[0]["bound"] == 1
+
+
+def test_unknown_short_id_is_not_found(api, make_profile):
+    make_profile()
+    assert api.get_profile_detail("00000000") is None
+    assert not api.bind_proxy("00000000", None)["success"]
+    assert not api.start_profile("00000000")["success"]
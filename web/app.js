@@ -0,0 +1,1009 @@
+let allProfiles = [];
+let editingId = null;
+let pendingConfirmAction = null;
+let webglConfigs = [];
+let timezones = [];
+let languages = [];
+let platforms = [];
+let proxies = [];
+
+// 同一轮事件循环里发起的调用合并成一次 batch 桥接调用，只有一个时直接调用
+let pendingCalls = [];
+
+function callApi(method, ...args) {
+    return new Promise((resolve, reject) => {
+        pendingCalls.push({ method, args, resolve, reject });
+        if (pendingCalls.length === 1) queueMicrotask(flushCalls);
+    });
+}
+
+async function flushCalls() {
+    const calls = pendingCalls;
+    pendingCalls = [];
+    if (calls.length === 1) {
+        const call = calls[0];
+        pywebview.api[call.method](...call.args).then(call.resolve, call.reject);
+        return;
+    }
+    try {
+        const results = await pywebview.api.batch(calls.map(c => ({ method: c.method, args: c.args })));
+        results.forEach((r, i) => 'error' in r ? calls[i].reject(new Error(r.error)) : calls[i].resolve(r.result));
+    } catch (e) {
+        calls.forEach(c => c.reject(e));
+    }
+}
+
+// Init
+async function init() {
+    // 环境列表与指纹目录在同一次桥接调用里加载，窗口先显示骨架卡片
+    refreshProfiles();
+
+    const catalog = await loadCatalog();
+    platforms = catalog.platforms;
+    timezones = catalog.timezones;
+    languages = catalog.languages;
+    webglConfigs = catalog.webgl_configs;
+
+    const platformSel = document.getElementById('fp_platform');
+    platforms.forEach(p => {
+        const opt = document.createElement('option');
+        opt.value = p; opt.textContent = p;
+        platformSel.appendChild(opt);
+    });
+
+    const tzSel = document.getElementById('fp_timezone');
+    timezones.forEach(t => {
+        const opt = document.createElement('option');
+        opt.value = t; opt.textContent = t;
+        tzSel.appendChild(opt);
+    });
+
+    const langSel = document.getElementById('fp_language');
+    languages.forEach(l => {
+        const opt = document.createElement('option');
+        opt.value = l; opt.textContent = l;
+        langSel.appendChild(opt);
+    });
+
+    // 按平台分组，目录有上千条时也能快速定位
+    const presetSel = document.getElementById('webglPreset');
+    const groups = {};
+    webglConfigs.forEach((c, i) => {
+        const platform = c.platform || '';
+        if (!groups[platform]) {
+            groups[platform] = document.createElement('optgroup');
+            groups[platform].label = platform || '其他';
+            presetSel.appendChild(groups[platform]);
+        }
+        const opt = document.createElement('option');
+        opt.value = i;
+        const shortRenderer = c.renderer.length > 60 ? c.renderer.substring(0, 60) + '...' : c.renderer;
+        opt.textContent = shortRenderer;
+        groups[platform].appendChild(opt);
+    });
+
+    setInterval(refreshProfiles, 3000);
+    pywebview.api.report_ui_timing(Math.round(performance.now()));
+}
+
+// 指纹目录缓存在 localStorage，带版本号询问后端，未变化时后端只回 unchanged
+const CATALOG_CACHE_KEY = 'fpm.catalog';
+
+async function loadCatalog() {
+    let cached = null;
+    try {
+        cached = JSON.parse(localStorage.getItem(CATALOG_CACHE_KEY));
+    } catch (e) {
+        cached = null;
+    }
+    const result = await callApi('get_catalog', cached ? cached.version : null);
+    if (result.unchanged && cached) return cached;
+    try {
+        localStorage.setItem(CATALOG_CACHE_KEY, JSON.stringify(result));
+    } catch (e) {
+        // 存储空间不足时只是下次启动重新拉取
+    }
+    return result;
+}
+
+function applyWebGLPreset() {
+    const idx = document.getElementById('webglPreset').value;
+    if (idx !== '') {
+        const config = webglConfigs[parseInt(idx)];
+        document.getElementById('fp_webgl_vendor').value = config.vendor;
+        document.getElementById('fp_webgl_renderer').value = config.renderer;
+    }
+}
+
+async function matchGeoFromIp() {
+    const ip = document.getElementById('fp_webrtc_ip').value.trim();
+    if (!ip) {
+        showToast('请先填写 WebRTC IP', 'error');
+        return;
+    }
+    const geo = await pywebview.api.lookup_geo(ip);
+    if (!geo) {
+        showToast('GeoIP 数据库中没有该 IP', 'error');
+        return;
+    }
+    if (geo.timezone) document.getElementById('fp_timezone').value = geo.timezone;
+    if (geo.language) document.getElementById('fp_language').value = geo.language;
+    showToast(`已按 ${geo.country} 设置时区和语言`, 'success');
+}
+
+async function randomizeAll() {
+    const rnd = await pywebview.api.get_random_profile();
+    document.getElementById('fp_platform').value = rnd.platform;
+    document.getElementById('fp_hardwareConcurrency').value = rnd.hardwareConcurrency;
+    document.getElementById('fp_deviceMemory').value = rnd.deviceMemory;
+    document.getElementById('fp_maxTouchPoints').value = rnd.maxTouchPoints;
+    document.getElementById('fp_webgl_vendor').value = rnd.webgl_vendor;
+    document.getElementById('fp_webgl_renderer').value = rnd.webgl_renderer;
+    document.getElementById('fp_canvas_noise').value = rnd.canvas_noise;
+    document.getElementById('fp_webgl_noise').value = rnd.webgl_noise;
+    document.getElementById('fp_audio_noise').value = rnd.audio_noise;
+    document.getElementById('fp_clientRects_noise').value = rnd.clientRects_noise;
+    document.getElementById('fp_webrtc_ip').value = rnd.webrtc_ip;
+    document.getElementById('fp_timezone').value = rnd.timezone;
+    document.getElementById('fp_language').value = rnd.language;
+    document.getElementById('webglPreset').value = '';
+    showToast('已随机生成所有参数', 'info');
+}
+
+const PAGE_SIZE = 500;
+let refreshing = false;
+
+async function refreshProfiles() {
+    if (refreshing) return;
+    refreshing = true;
+    try {
+        const events = reportResourceEvents();
+        const first = await callApi('get_profiles', 0, PAGE_SIZE);
+        let profiles = first.profiles;
+        if (first.total > profiles.length) {
+            // 先渲染第一页，其余分页补齐
+            allProfiles = profiles;
+            renderProfiles();
+            for (let offset = PAGE_SIZE; offset < first.total; offset += PAGE_SIZE) {
+                const page = await pywebview.api.get_profiles(offset, PAGE_SIZE);
+                profiles = profiles.concat(page.profiles);
+            }
+        }
+        allProfiles = profiles;
+        renderProfiles();
+        updateStats();
+        await events;
+    } finally {
+        refreshing = false;
+    }
+}
+
+const RESOURCE_EVENT_TEXT = {
+    memory_max_hits: '触及内存上限',
+    oom_kills: '因内存不足被结束进程',
+    pids_max_hits: '触及进程数上限',
+    cpu_throttled: 'CPU 被限流',
+};
+let lastResourceEventSeq = 0;
+
+// cgroup 限制被触发时提示一次，seq 之前的事件不会重复提示
+async function reportResourceEvents() {
+    const events = await callApi('get_resource_events', lastResourceEventSeq);
+    events.forEach(e => {
+        lastResourceEventSeq = Math.max(lastResourceEventSeq, e.seq);
+        showToast(`${escapeHtml(e.name || e.profile_id)} ${RESOURCE_EVENT_TEXT[e.kind] || e.kind}`, e.kind === 'oom_kills' ? 'error' : 'info');
+    });
+}
+
+async function editGroupLimits() {
+    const current = await pywebview.api.get_group_limits();
+    if (!current.cgroup_enabled) showToast('当前系统未启用 cgroup v2 委派，限制不会生效', 'error');
+    const group = prompt('分组名称');
+    if (!group) return;
+    const old = current.groups[group.trim().toLowerCase()] || {};
+    const input = prompt('内存MB,CPU%,进程数（留空表示不限制，例如 4096,200,512）',
+        [old.memory_mb, old.cpu_percent, old.pids].map(v => v == null ? '' : v).join(','));
+    if (input === null) return;
+    const [memory, cpu, pids] = input.split(',').map(v => v.trim());
+    const limits = {};
+    if (memory) limits.memory_mb = Number(memory);
+    if (cpu) limits.cpu_percent = Number(cpu);
+    if (pids) limits.pids = Number(pids);
+    const result = await pywebview.api.set_group_limits(group, limits);
+    showToast(result.success ? '分组限制已保存，下次启动生效' : result.error, result.success ? 'success' : 'error');
+}
+
+// 新版 ID 以时间戳开头，界面显示末尾 8 位短 ID；旧版 8 位 ID 原样显示
+function shortId(id) {
+    return id.slice(-8);
+}
+
+function updateStats() {
+    const running = allProfiles.filter(p => p.status === 'running').length;
+    document.getElementById('runningCount').textContent = running;
+    document.getElementById('totalCount').textContent = allProfiles.length;
+}
+
+function filterProfiles() {
+    renderProfiles();
+}
+
+// 与后端 parse_selector 相同的筛选语法：空格分隔取交集，逗号表示任一，前缀 - 取反
+function matchesSelector(p, query) {
+    const cfg = p.config || {};
+    const tags = p.tags || [];
+    return query.split(/\s+/).filter(Boolean).every(token => {
+        const negate = token.startsWith('-') && token.length > 1;
+        if (negate) token = token.slice(1);
+        const idx = token.indexOf(':');
+        const key = idx > 0 ? token.slice(0, idx) : 'text';
+        const values = (idx > 0 ? token.slice(idx + 1) : token).split(',').filter(Boolean);
+        if (values.length === 0) values.push('');
+        let hit;
+        switch (key) {
+            case 'tag': hit = values.some(v => tags.includes(v)); break;
+            case 'group': hit = values.includes((p.group || '').toLowerCase()); break;
+            case 'status': hit = values.includes(p.status); break;
+            case 'name': hit = values.some(v => p.name.toLowerCase().includes(v)); break;
+            case 'id': hit = values.some(v => p.id.toLowerCase().startsWith(v) || shortId(p.id).startsWith(v)); break;
+            case 'proxy': hit = values.includes((cfg.proxy_id || 'none').toLowerCase()); break;
+            case 'platform': hit = values.includes((cfg.platform || '').toLowerCase()); break;
+            default: hit = p.name.toLowerCase().includes(values[0]) || p.id.toLowerCase().includes(values[0]);
+        }
+        return negate ? !hit : hit;
+    });
+}
+
+function getFilteredProfiles() {
+    const query = document.getElementById('searchInput').value.toLowerCase().trim();
+    if (!query) return allProfiles;
+    return allProfiles.filter(p => matchesSelector(p, query));
+}
+
+function applyFilter(selector) {
+    document.getElementById('searchInput').value = selector;
+    renderProfiles();
+}
+
+async function runBulkAction() {
+    const sel = document.getElementById('bulkAction');
+    const action = sel.value;
+    sel.value = '';
+    const selector = document.getElementById('searchInput').value.trim();
+    const count = getFilteredProfiles().length;
+    if (!action) return;
+    if (action === 'limits') {
+        await editGroupLimits();
+        return;
+    }
+    if (!selector) {
+        showToast('请先在搜索框输入筛选条件', 'error');
+        return;
+    }
+    const params = {};
+    if (action === 'tag' || action === 'untag') {
+        params.tags = prompt('标签（逗号分隔）');
+        if (!params.tags) return;
+    } else if (action === 'group') {
+        params.group = prompt('分组名称（留空表示移出分组）');
+        if (params.group === null) return;
+    } else if (action === 'update') {
+        const input = prompt('字段=值，例如 language=en-US');
+        if (!input || !input.includes('=')) return;
+        const [field, ...rest] = input.split('=');
+        const raw = rest.join('=');
+        params.field = field.trim();
+        params.value = raw !== '' && !isNaN(raw) ? Number(raw) : raw;
+    }
+    const run = async () => {
+        const result = await pywebview.api.bulk_operation(selector, action, params);
+        if (result.success) {
+            showToast(`已处理 ${result.done.length} 个环境`, 'success');
+        } else {
+            const failed = result.failed ? Object.keys(result.failed).length : 0;
+            showToast(result.error || `${failed} 个环境处理失败`, 'error');
+        }
+        refreshProfiles();
+    };
+    if (action === 'delete' || action === 'stop') {
+        document.getElementById('confirmTitle').textContent = '批量操作';
+        document.getElementById('confirmMessage').textContent = `确定要对 "${selector}" 匹配的 ${count} 个环境执行此操作吗？`;
+        pendingConfirmAction = run;
+        document.getElementById('confirmOverlay').classList.add('active');
+    } else {
+        run();
+    }
+}
+
+function renderProfiles() {
+    const query = document.getElementById('searchInput').value.toLowerCase();
+    const grid = document.getElementById('profileGrid');
+    const filtered = getFilteredProfiles();
+
+    if (filtered.length === 0) {
+        grid.innerHTML = `
+            <div class="empty-state" style="grid-column: 1/-1;">
+                <div class="empty-icon">📁</div>
+                <h3>${query ? '未找到匹配的环境' : '还没有任何环境'}</h3>
+                <p>${query ? '尝试使用其他关键词搜索' : '点击上方"新建环境"按钮创建你的第一个浏览器环境'}</p>
+                ${!query ? '<button class="btn btn-primary" onclick="openCreateModal()">＋ 新建环境</button>' : ''}
+            </div>
+        `;
+        return;
+    }
+
+    grid.innerHTML = filtered.map(p => {
+        const isRunning = p.status === 'running';
+        const cfg = p.config || {};
+        const initial = escapeHtml((p.name || '?')[0].toUpperCase());
+        const avatarColors = [
+            'linear-gradient(135deg, #6c5ce7, #a29bfe)',
+            'linear-gradient(135deg, #00b894, #55efc4)',
+            'linear-gradient(135deg, #e17055, #ff7675)',
+            'linear-gradient(135deg, #fdcb6e, #f39c12)',
+            'linear-gradient(135deg, #0984e3, #74b9ff)',
+            'linear-gradient(135deg, #e84393, #fd79a8)',
+        ];
+        const colorIdx = shortId(p.id).charCodeAt(0) % avatarColors.length;
+
+        return `
+        <div class="card">
+            <div class="card-header">
+                <div class="card-title-group">
+                    <div class="card-avatar" style="background:${avatarColors[colorIdx]}">${initial}</div>
+                    <div>
+                        <div class="card-name">${escapeHtml(p.name)}</div>
+                        <div class="card-id" title="${p.id}">#${shortId(p.id)}</div>
+                    </div>
+                </div>
+                <div class="status-badge ${isRunning ? 'running' : 'stopped'}">
+                    <span class="status-dot"></span>
+                    ${isRunning ? '运行中' : '已停止'}
+                </div>
+            </div>
+            ${(p.tags && p.tags.length) || p.group ? `
+            <div class="card-tags">
+                ${p.group ? `<span class="tag-chip" data-filter="group:${escapeAttr(p.group.toLowerCase())}" onclick="applyFilter(this.dataset.filter)">📂 ${escapeHtml(p.group)}</span>` : ''}
+                ${(p.tags || []).map(t => `<span class="tag-chip" data-filter="tag:${escapeAttr(t)}" onclick="applyFilter(this.dataset.filter)">#${escapeHtml(t)}</span>`).join('')}
+            </div>` : ''}
+            <div class="card-info">
+                <div class="info-item">
+                    <span class="info-label">平台</span>
+                    <span class="info-value">${escapeHtml(cfg.platform || '-')}</span>
+                </div>
+                <div class="info-item">
+                    <span class="info-label">CPU / 内存</span>
+                    <span class="info-value">${escapeHtml(cfg.hardwareConcurrency || '-')}核 / ${escapeHtml(cfg.deviceMemory || '-')}GB</span>
+                </div>
+                <div class="info-item">
+                    <span class="info-label">语言</span>
+                    <span class="info-value">${escapeHtml(cfg.language || '-')}</span>
+                </div>
+                <div class="info-item">
+                    <span class="info-label">时区</span>
+                    <span class="info-value">${escapeHtml(cfg.timezone || '-')}</span>
+                </div>
+            </div>
+            <div class="card-actions">
+                ${isRunning
+                    ? `<button class="btn btn-danger btn-sm" onclick="stopProfile('${p.id}')">⏹ 停止</button>`
+                    : `<button class="btn btn-success btn-sm" onclick="startProfile('${p.id}')">▶ 启动</button>`
+                }
+                <button class="btn btn-ghost btn-sm" onclick="viewDetail('${p.id}')">📋 详情</button>
+                <button class="btn btn-ghost btn-sm" onclick="openEditModal('${p.id}')" ${isRunning ? 'disabled style="opacity:0.4;pointer-events:none;"' : ''}>✏️ 编辑</button>
+                <button class="btn btn-ghost btn-sm" onclick="confirmDelete('${p.id}')" ${isRunning ? 'disabled style="opacity:0.4;pointer-events:none;"' : ''}>🗑</button>
+            </div>
+        </div>
+        `;
+    }).join('');
+}
+
+function escapeHtml(s) {
+    const d = document.createElement('div');
+    d.textContent = s;
+    return d.innerHTML;
+}
+
+function escapeAttr(s) {
+    return escapeHtml(s).replace(/"/g, '&quot;');
+}
+
+// Modal
+async function openCreateModal() {
+    editingId = null;
+    document.getElementById('modalTitle').textContent = '新建环境';
+    document.getElementById('modalSaveBtn').textContent = '创建环境';
+    clearForm();
+    await loadProxyOptions();
+    randomizeAll();
+    document.getElementById('profileModal').classList.add('active');
+}
+
+async function openEditModal(id) {
+    editingId = id;
+    document.getElementById('modalTitle').textContent = '编辑环境';
+    document.getElementById('modalSaveBtn').textContent = '保存修改';
+    const detail = await pywebview.api.get_profile_detail(id);
+    if (!detail) {
+        showToast('环境不存在', 'error');
+        return;
+    }
+    const cfg = detail.config || {};
+    await loadProxyOptions();
+    document.getElementById('profileName').value = detail.name || '';
+    document.getElementById('profileTags').value = (detail.tags || []).join(',');
+    document.getElementById('profileGroup').value = detail.group || '';
+    document.getElementById('fp_platform').value = cfg.platform || '';
+    document.getElementById('fp_hardwareConcurrency').value = cfg.hardwareConcurrency || '';
+    document.getElementById('fp_deviceMemory').value = cfg.deviceMemory || '';
+    document.getElementById('fp_maxTouchPoints').value = cfg.maxTouchPoints != null ? cfg.maxTouchPoints : '';
+    document.getElementById('fp_webgl_vendor').value = cfg.webgl_vendor || '';
+    document.getElementById('fp_webgl_renderer').value = cfg.webgl_renderer || '';
+    document.getElementById('fp_canvas_noise').value = cfg.canvas_noise || '';
+    document.getElementById('fp_webgl_noise').value = cfg.webgl_noise || '';
+    document.getElementById('fp_audio_noise').value = cfg.audio_noise || '';
+    document.getElementById('fp_clientRects_noise').value = cfg.clientRects_noise || '';
+    document.getElementById('fp_webrtc_ip').value = cfg.webrtc_ip || '';
+    document.getElementById('fp_timezone').value = cfg.timezone || '';
+    document.getElementById('fp_language').value = cfg.language || '';
+    document.getElementById('fp_proxy_id').value = cfg.proxy_id || '';
+    document.getElementById('fp_display_mode').value = cfg.display_mode || '';
+    const limits = cfg.limits || {};
+    document.getElementById('fp_limit_memory').value = limits.memory_mb || '';
+    document.getElementById('fp_limit_cpu').value = limits.cpu_percent || '';
+    document.getElementById('fp_limit_pids').value = limits.pids || '';
+    document.getElementById('webglPreset').value = '';
+    document.getElementById('profileModal').classList.add('active');
+}
+
+function closeModal() {
+    document.getElementById('profileModal').classList.remove('active');
+    editingId = null;
+}
+
+function clearForm() {
+    document.getElementById('profileName').value = '';
+    document.getElementById('profileTags').value = '';
+    document.getElementById('profileGroup').value = '';
+    document.getElementById('fp_platform').value = '';
+    document.getElementById('fp_hardwareConcurrency').value = '';
+    document.getElementById('fp_deviceMemory').value = '';
+    document.getElementById('fp_maxTouchPoints').value = '';
+    document.getElementById('fp_webgl_vendor').value = '';
+    document.getElementById('fp_webgl_renderer').value = '';
+    document.getElementById('fp_canvas_noise').value = '';
+    document.getElementById('fp_webgl_noise').value = '';
+    document.getElementById('fp_audio_noise').value = '';
+    document.getElementById('fp_clientRects_noise').value = '';
+    document.getElementById('fp_webrtc_ip').value = '';
+    document.getElementById('fp_timezone').value = '';
+    document.getElementById('fp_language').value = '';
+    document.getElementById('fp_proxy_id').value = '';
+    document.getElementById('fp_display_mode').value = '';
+    document.getElementById('fp_limit_memory').value = '';
+    document.getElementById('fp_limit_cpu').value = '';
+    document.getElementById('fp_limit_pids').value = '';
+    document.getElementById('webglPreset').value = '';
+}
+
+async function saveProfile() {
+    const name = document.getElementById('profileName').value.trim();
+    if (!name) {
+        showToast('请输入环境名称', 'error');
+        document.getElementById('profileName').focus();
+        return;
+    }
+
+    const getVal = id => document.getElementById(id).value;
+
+    const config = {};
+    if (getVal('fp_platform')) config.platform = getVal('fp_platform');
+    if (getVal('fp_hardwareConcurrency')) config.hardwareConcurrency = parseInt(getVal('fp_hardwareConcurrency'));
+    if (getVal('fp_deviceMemory')) config.deviceMemory = parseInt(getVal('fp_deviceMemory'));
+    if (getVal('fp_maxTouchPoints') !== '') config.maxTouchPoints = parseInt(getVal('fp_maxTouchPoints'));
+    if (getVal('fp_webgl_vendor')) config.webgl_vendor = getVal('fp_webgl_vendor');
+    if (getVal('fp_webgl_renderer')) config.webgl_renderer = getVal('fp_webgl_renderer');
+    if (getVal('fp_canvas_noise')) config.canvas_noise = parseFloat(getVal('fp_canvas_noise'));
+    if (getVal('fp_webgl_noise')) config.webgl_noise = parseFloat(getVal('fp_webgl_noise'));
+    if (getVal('fp_audio_noise')) config.audio_noise = parseFloat(getVal('fp_audio_noise'));
+    if (getVal('fp_clientRects_noise')) config.clientRects_noise = parseFloat(getVal('fp_clientRects_noise'));
+    if (getVal('fp_webrtc_ip')) config.webrtc_ip = getVal('fp_webrtc_ip');
+    if (getVal('fp_timezone')) config.timezone = getVal('fp_timezone');
+    if (getVal('fp_language')) config.language = getVal('fp_language');
+    if (getVal('fp_proxy_id')) config.proxy_id = getVal('fp_proxy_id');
+    if (getVal('fp_display_mode')) config.display_mode = getVal('fp_display_mode');
+    const limits = {};
+    if (getVal('fp_limit_memory')) limits.memory_mb = parseInt(getVal('fp_limit_memory'));
+    if (getVal('fp_limit_cpu')) limits.cpu_percent = parseFloat(getVal('fp_limit_cpu'));
+    if (getVal('fp_limit_pids')) limits.pids = parseInt(getVal('fp_limit_pids'));
+    if (Object.keys(limits).length) config.limits = limits;
+
+    // 没填的参数用随机值
+    const rnd = await pywebview.api.get_random_profile();
+    if (!config.platform) config.platform = rnd.platform;
+    if (!config.hardwareConcurrency) config.hardwareConcurrency = rnd.hardwareConcurrency;
+    if (!config.deviceMemory) config.deviceMemory = rnd.deviceMemory;
+    if (config.maxTouchPoints == null || isNaN(config.maxTouchPoints)) config.maxTouchPoints = rnd.maxTouchPoints;
+    if (!config.webgl_vendor) config.webgl_vendor = rnd.webgl_vendor;
+    if (!config.webgl_renderer) config.webgl_renderer = rnd.webgl_renderer;
+    if (!config.canvas_noise) config.canvas_noise = rnd.canvas_noise;
+    if (!config.webgl_noise) config.webgl_noise = rnd.webgl_noise;
+    if (!config.audio_noise) config.audio_noise = rnd.audio_noise;
+    if (!config.clientRects_noise) config.clientRects_noise = rnd.clientRects_noise;
+    if (!config.webrtc_ip) config.webrtc_ip = rnd.webrtc_ip;
+    if (!config.timezone) config.timezone = rnd.timezone;
+    if (!config.language) config.language = rnd.language;
+
+    const tags = getVal('profileTags');
+    const group = getVal('profileGroup');
+    let result;
+    if (editingId) {
+        result = await pywebview.api.update_profile(editingId, name, config, tags, group);
+    } else {
+        result = await pywebview.api.create_profile(name, config, tags, group);
+    }
+
+    if (result.success) {
+        showToast(editingId ? '环境已更新' : '环境创建成功', 'success');
+        closeModal();
+        refreshProfiles();
+    } else {
+        showToast(result.error || '操作失败', 'error');
+    }
+}
+
+// Proxy
+async function loadProxyOptions() {
+    proxies = await pywebview.api.get_proxies();
+    const sel = document.getElementById('fp_proxy_id');
+    sel.innerHTML = '<option value="">直连 (不使用代理)</option>';
+    proxies.forEach(p => {
+        const opt = document.createElement('option');
+        opt.value = p.id;
+        opt.textContent = `${p.scheme}://${p.host}:${p.port}${p.status === 'dead' ? ' (不可用)' : ''}`;
+        sel.appendChild(opt);
+    });
+}
+
+// 选择代理后让 WebRTC IP / 时区 / 语言与代理出口保持一致
+function applyProxyGeo() {
+    const proxy = proxies.find(p => p.id === document.getElementById('fp_proxy_id').value);
+    if (!proxy) return;
+    if (proxy.egress_ip) document.getElementById('fp_webrtc_ip').value = proxy.egress_ip;
+    if (proxy.timezone) document.getElementById('fp_timezone').value = proxy.timezone;
+    if (proxy.language) document.getElementById('fp_language').value = proxy.language;
+}
+
+async function openProxyModal() {
+    await renderProxyTable();
+    document.getElementById('proxyModal').classList.add('active');
+}
+
+function closeProxyModal() {
+    document.getElementById('proxyModal').classList.remove('active');
+}
+
+async function renderProxyTable() {
+    proxies = await pywebview.api.get_proxies();
+    const body = document.getElementById('proxyTableBody');
+    if (proxies.length === 0) {
+        body.innerHTML = '<tr><td colspan="6">还没有代理</td></tr>';
+        return;
+    }
+    const statusText = { ok: '可用', dead: '不可用', unknown: '未检测' };
+    body.innerHTML = proxies.map(p => `
+        <tr>
+            <td>${escapeHtml(`${p.scheme}://${p.host}:${p.port}`)}</td>
+            <td class="${p.status}">${statusText[p.status] || p.status}</td>
+            <td>${p.latency_ms != null ? p.latency_ms + ' ms' : '-'}</td>
+            <td>${escapeHtml(p.egress_ip || '-')}</td>
+            <td>${p.bound}</td>
+            <td><button class="btn btn-ghost btn-sm" onclick="deleteProxy('${p.id}')" ${p.bound ? 'disabled' : ''}>🗑</button></td>
+        </tr>
+    `).join('');
+}
+
+async function importProxies() {
+    const text = document.getElementById('proxyImportText').value;
+    const result = await pywebview.api.import_proxies(text);
+    if (result.invalid.length) {
+        showToast(`已导入 ${result.added} 个，${result.invalid.length} 行无法解析`, 'error');
+    } else {
+        showToast(`已导入 ${result.added} 个代理`, 'success');
+        document.getElementById('proxyImportText').value = '';
+    }
+    renderProxyTable();
+}
+
+async function checkProxies() {
+    const result = await pywebview.api.check_proxies(null);
+    if (!result.success) {
+        showToast(result.error, 'error');
+        return;
+    }
+    showToast(`正在检测 ${result.queued} 个代理...`, 'info');
+    setTimeout(renderProxyTable, 3000);
+}
+
+async function deleteProxy(id) {
+    const result = await pywebview.api.delete_proxies([id]);
+    if (!result.success) showToast(result.error, 'error');
+    renderProxyTable();
+}
+
+// Schedule
+const SCHEDULE_ACTION_TEXT = { start: '启动', stop: '停止', rotate: '轮换' };
+
+async function openScheduleModal() {
+    await renderSchedule();
+    document.getElementById('scheduleModal').classList.add('active');
+}
+
+function closeScheduleModal() {
+    document.getElementById('scheduleModal').classList.remove('active');
+}
+
+async function renderSchedule() {
+    const schedule = await pywebview.api.get_schedule();
+    document.getElementById('sched_max_running').value = schedule.settings.max_running || 0;
+    document.getElementById('sched_group_quotas').value = Object.entries(schedule.settings.group_quotas || {})
+        .map(([g, n]) => `${g}=${n}`).join(', ');
+
+    const jobs = document.getElementById('scheduleJobsBody');
+    jobs.innerHTML = schedule.jobs.length === 0 ? '<tr><td colspan="6">还没有任务</td></tr>' : schedule.jobs.map(j => `
+        <tr>
+            <td>${escapeHtml(j.name || j.id)}</td>
+            <td>${escapeHtml(j.selector || '全部')}</td>
+            <td>${SCHEDULE_ACTION_TEXT[j.action]}${j.batch ? ' ×' + j.batch : ''}</td>
+            <td>${escapeHtml(j.trigger.type === 'cron' ? j.trigger.expr : `每 ${j.trigger.seconds} 秒`)}</td>
+            <td>${j.next_run || '-'}</td>
+            <td>
+                <button class="btn btn-ghost btn-sm" onclick="runScheduleJob('${j.id}')">▶</button>
+                <button class="btn btn-ghost btn-sm" onclick="deleteScheduleJob('${j.id}')">🗑</button>
+            </td>
+        </tr>
+    `).join('');
+
+    document.getElementById('scheduleUpcomingBody').innerHTML = schedule.upcoming.length === 0
+        ? '<tr><td>暂无</td></tr>'
+        : schedule.upcoming.map(r => `<tr><td>${r.at}</td><td>${escapeHtml(r.name || r.job_id)}</td><td>${SCHEDULE_ACTION_TEXT[r.action] || r.action}</td></tr>`).join('');
+
+    document.getElementById('scheduleHistoryBody').innerHTML = schedule.history.length === 0
+        ? '<tr><td colspan="5">暂无</td></tr>'
+        : schedule.history.map(h => {
+            const skipped = Object.entries(h.skipped);
+            return `
+            <tr>
+                <td>${h.ran_at}</td>
+                <td>${escapeHtml(h.name || h.job_id)}</td>
+                <td>${SCHEDULE_ACTION_TEXT[h.action]}</td>
+                <td>${h.done.length}</td>
+                <td title="${escapeAttr(skipped.map(([id, reason]) => `${id}: ${reason}`).join('\n'))}">${skipped.length}</td>
+            </tr>`;
+        }).join('');
+}
+
+async function saveScheduleJob() {
+    const triggerText = document.getElementById('sched_trigger').value.trim();
+    const trigger = /^\d+(\.\d+)?$/.test(triggerText)
+        ? { type: 'interval', seconds: parseFloat(triggerText) }
+        : { type: 'cron', expr: triggerText };
+    const result = await pywebview.api.save_schedule_job({
+        name: document.getElementById('sched_name').value.trim(),
+        selector: document.getElementById('sched_selector').value.trim(),
+        action: document.getElementById('sched_action').value,
+        trigger,
+        batch: parseInt(document.getElementById('sched_batch').value) || 0,
+        run_for: (parseFloat(document.getElementById('sched_run_for').value) || 0) * 60,
+    });
+    if (!result.success) {
+        showToast(result.error, 'error');
+        return;
+    }
+    showToast('任务已添加', 'success');
+    renderSchedule();
+}
+
+async function saveScheduleLimits() {
+    const quotas = {};
+    document.getElementById('sched_group_quotas').value.split(',').forEach(part => {
+        const [group, n] = part.split('=').map(x => x.trim());
+        if (group && n) quotas[group] = parseInt(n) || 0;
+    });
+    const result = await pywebview.api.set_schedule_limits(
+        parseInt(document.getElementById('sched_max_running').value) || 0, quotas);
+    showToast(result.success ? '限制已保存' : result.error, result.success ? 'success' : 'error');
+}
+
+async function runScheduleJob(id) {
+    await pywebview.api.run_schedule_job(id);
+    showToast('任务已触发', 'info');
+    setTimeout(renderSchedule, 1500);
+}
+
+async function deleteScheduleJob(id) {
+    await pywebview.api.delete_schedule_job(id);
+    renderSchedule();
+}
+
+// Actions
+async function startProfile(id) {
+    const result = await pywebview.api.start_profile(id);
+    if (result.success) {
+        showToast('浏览器环境已启动', 'success');
+        refreshProfiles();
+    } else {
+        showToast(result.error || '启动失败', 'error');
+    }
+}
+
+async function stopProfile(id) {
+    const result = await pywebview.api.stop_profile(id);
+    if (result.success) {
+        showToast('浏览器环境已停止', 'success');
+        refreshProfiles();
+    } else {
+        showToast(result.error || '停止失败', 'error');
+    }
+}
+
+// Export / Import
+async function exportProfiles() {
+    const ids = getFilteredProfiles().map(p => p.id);
+    if (ids.length === 0) {
+        showToast('没有可导出的环境', 'error');
+        return;
+    }
+    const path = await pywebview.api.choose_archive_path(true);
+    if (!path) return;
+    showToast(`正在导出 ${ids.length} 个环境...`, 'info');
+    const result = await pywebview.api.export_profiles(ids, path);
+    if (result.success) {
+        const skipped = result.skipped.length ? `，跳过 ${result.skipped.length} 个运行中的环境` : '';
+        showToast(`已导出 ${result.count} 个环境 (${result.mb_per_sec} MB/s)${skipped}`, 'success');
+    } else {
+        showToast(result.error || '导出失败', 'error');
+    }
+}
+
+async function importProfiles() {
+    const path = await pywebview.api.choose_archive_path(false);
+    if (!path) return;
+    showToast('正在导入...', 'info');
+    const result = await pywebview.api.import_profiles(path);
+    if (result.success) {
+        const failed = Object.keys(result.failed || {}).length;
+        showToast(`已导入 ${result.count} 个环境 (${result.mb_per_sec} MB/s)${failed ? `，${failed} 个记录无效已跳过` : ''}`,
+            failed ? 'info' : 'success');
+        refreshProfiles();
+    } else {
+        showToast(result.error || '导入失败', 'error');
+    }
+}
+
+async function purgeCaches() {
+    const ids = getFilteredProfiles().map(p => p.id);
+    const result = await pywebview.api.purge_caches(ids);
+    showToast(`已在后台清理 ${result.queued} 个已停止环境的缓存`, 'info');
+}
+
+function confirmDelete(id) {
+    const profile = allProfiles.find(p => p.id === id);
+    document.getElementById('confirmTitle').textContent = '删除环境';
+    document.getElementById('confirmMessage').textContent = `确定要删除环境 "${profile ? profile.name : id}" 吗？此操作将删除所有浏览器数据且不可恢复。`;
+    pendingConfirmAction = async () => {
+        const result = await pywebview.api.delete_profile(id);
+        if (result.success) {
+            showToast('环境已删除', 'success');
+            refreshProfiles();
+            setTimeout(checkDeleteFailures, 5000);
+        } else {
+            showToast(result.error || '删除失败', 'error');
+        }
+    };
+    document.getElementById('confirmOverlay').classList.add('active');
+}
+
+let reportedDeleteFailures = new Set();
+async function checkDeleteFailures() {
+    const failures = await pywebview.api.get_delete_failures();
+    failures.filter(f => !reportedDeleteFailures.has(f.path)).forEach(f => {
+        reportedDeleteFailures.add(f.path);
+        showToast(`目录清理失败 (${f.error_count} 项): ${escapeHtml(f.errors[0])}`, 'error');
+    });
+}
+
+function confirmAction() {
+    if (pendingConfirmAction) {
+        pendingConfirmAction();
+        pendingConfirmAction = null;
+    }
+    closeConfirm();
+}
+
+function closeConfirm() {
+    document.getElementById('confirmOverlay').classList.remove('active');
+}
+
+// Detail
+async function viewDetail(id) {
+    const [detail, storageUsage, resourceStats, history] = await Promise.all([
+        callApi('get_profile_detail', id),
+        callApi('get_storage_usage', [id]),
+        callApi('get_resource_stats', [id]),
+        callApi('get_profile_history', id),
+    ]);
+    if (!detail) {
+        showToast('环境不存在', 'error');
+        return;
+    }
+    const cfg = detail.config || {};
+    const isRunning = detail.status === 'running';
+    const storage = storageUsage.profiles[0];
+    const usage = isRunning ? resourceStats[id] : null;
+    document.getElementById('detailBody').innerHTML = `
+        <div style="display:flex;align-items:center;gap:16px;margin-bottom:24px;">
+            <div style="width:56px;height:56px;border-radius:16px;background:linear-gradient(135deg,var(--accent),var(--accent2));display:flex;align-items:center;justify-content:center;font-size:24px;font-weight:700;color:white;">
+                ${escapeHtml((detail.name || '?')[0].toUpperCase())}
+            </div>
+            <div>
+                <div style="font-size:20px;font-weight:700;">${escapeHtml(detail.name)}</div>
+                <div style="font-size:13px;color:var(--text3);font-family:monospace;" title="${detail.id}">#${shortId(detail.id)}</div>
+            </div>
+            <div class="status-badge ${isRunning ? 'running' : 'stopped'}" style="margin-left:auto;">
+                <span class="status-dot"></span>
+                ${isRunning ? '运行中' : '已停止'}
+            </div>
+        </div>
+        <div style="display:grid;grid-template-columns:1fr 1fr;gap:16px;">
+            ${detailItem('平台', cfg.platform)}
+            ${detailItem('CPU 核心数', cfg.hardwareConcurrency)}
+            ${detailItem('设备内存', cfg.deviceMemory ? cfg.deviceMemory + ' GB' : '-')}
+            ${detailItem('触摸点数', cfg.maxTouchPoints)}
+            ${detailItem('WebGL 供应商', cfg.webgl_vendor, true)}
+            ${detailItem('WebGL 渲染器', cfg.webgl_renderer, true)}
+            ${detailItem('Canvas 噪声', cfg.canvas_noise)}
+            ${detailItem('WebGL 噪声', cfg.webgl_noise)}
+            ${detailItem('Audio 噪声', cfg.audio_noise)}
+            ${detailItem('ClientRects 噪声', cfg.clientRects_noise)}
+            ${detailItem('WebRTC IP', cfg.webrtc_ip)}
+            ${detailItem('时区', cfg.timezone)}
+            ${detailItem('语言', cfg.language)}
+            ${detailItem('创建时间', detail.created_at)}
+            ${detailItem('磁盘占用', storage ? `${formatBytes(storage.bytes)} (缓存 ${formatBytes(storage.cache_bytes)})` : '-')}
+            ${usage ? detailItem('内存 / 进程数', `${usage.memory_bytes != null ? formatBytes(usage.memory_bytes) : '-'} / ${usage.pids != null ? usage.pids : '-'}`) : ''}
+            ${usage ? detailItem('限制触发', `内存 ${usage.memory_max_hits} · OOM ${usage.oom_kills} · 进程 ${usage.pids_max_hits} · CPU 限流 ${usage.cpu_throttled}`) : ''}
+        </div>
+        ${history.success ? renderHistory(detail.id, history, isRunning) : ''}
+    `;
+    document.getElementById('detailModal').classList.add('active');
+}
+
+// 只列最近 20 个版本；快照版本显示完整配置的字段数
+function renderHistory(id, history, isRunning) {
+    const rows = history.versions.slice(0, 20).map(v => {
+        const changes = v.snapshot
+            ? `完整配置（${Object.keys(v.set).length} 项）`
+            : Object.entries(v.set).map(([k, val]) => `${k}=${JSON.stringify(val)}`)
+                .concat(v.unset.map(k => `-${k}`)).join(' ');
+        const action = v.version === history.current
+            ? '当前'
+            : `<button class="btn btn-ghost btn-sm" onclick="revertProfile('${id}', ${v.version})" ${isRunning ? 'disabled' : ''}>回滚</button>`;
+        return `<tr><td>v${v.version}</td><td>${escapeHtml(v.at || '-')}</td><td>${escapeHtml(changes)}</td><td>${action}</td></tr>`;
+    }).join('');
+    return `
+        <div class="form-section-title" style="margin-top:24px;"><span>🕘</span> 配置历史</div>
+        <table class="data-table"><tbody>${rows}</tbody></table>
+    `;
+}
+
+async function revertProfile(id, version) {
+    const result = await pywebview.api.revert_profile(id, version);
+    if (result.success) {
+        showToast(`已回滚到 v${version}`, 'success');
+        viewDetail(id);
+        refreshProfiles();
+    } else {
+        showToast(result.error, 'error');
+    }
+}
+
+function detailItem(label, value, wide) {
+    return `
+        <div style="${wide ? 'grid-column:1/-1;' : ''}background:var(--bg);padding:12px 16px;border-radius:10px;">
+            <div style="font-size:11px;color:var(--text3);text-transform:uppercase;letter-spacing:0.5px;margin-bottom:4px;">${label}</div>
+            <div style="font-size:13px;color:var(--text);word-break:break-all;">${escapeHtml(value != null ? value : '-')}</div>
+        </div>
+    `;
+}
+
+function formatBytes(n) {
+    const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+    let i = 0;
+    while (n >= 1024 && i < units.length - 1) { n /= 1024; i++; }
+    return `${n.toFixed(i ? 1 : 0)} ${units[i]}`;
+}
+
+function closeDetailModal() {
+    document.getElementById('detailModal').classList.remove('active');
+}
+
+// Diagnostics（隐藏面板，Ctrl+Shift+D 打开）
+let diagTimer = null;
+
+document.addEventListener('keydown', e => {
+    if (e.ctrlKey && e.shiftKey && e.key.toLowerCase() === 'd') {
+        e.preventDefault();
+        openDiagnostics();
+    }
+});
+
+function openDiagnostics() {
+    document.getElementById('diagModal').classList.add('active');
+    renderDiagnostics();
+    clearInterval(diagTimer);
+    diagTimer = setInterval(renderDiagnostics, 2000);
+}
+
+function closeDiagnostics() {
+    clearInterval(diagTimer);
+    diagTimer = null;
+    document.getElementById('diagModal').classList.remove('active');
+}
+
+async function renderDiagnostics() {
+    const diag = await pywebview.api.get_diagnostics();
+    document.getElementById('diagTableBody').innerHTML = diag.methods.map(m => `
+        <tr>
+            <td>${m.method}</td>
+            <td>${m.calls}</td>
+            <td class="${m.errors ? 'dead' : ''}">${m.errors}</td>
+            <td>${m.failures}</td>
+            <td>${m.p50_ms}</td>
+            <td>${m.p95_ms}</td>
+            <td>${m.p99_ms}</td>
+            <td>${m.max_ms}</td>
+            <td>${formatBytes(m.avg_arg_bytes)}</td>
+        </tr>
+    `).join('');
+    const displays = await pywebview.api.get_display_pool();
+    document.getElementById('diagDisplaySection').style.display = displays.length ? '' : 'none';
+    document.getElementById('diagDisplayBody').innerHTML = displays.map(d => `
+        <tr>
+            <td>${d.display || '启动中'}</td>
+            <td class="${d.alive ? 'ok' : 'dead'}">${d.alive ? '运行' : '已退出'}</td>
+            <td>${d.load} / ${d.capacity}</td>
+            <td>${d.pinned ? '是' : '否'}</td>
+            <td>${d.assigned_total}</td>
+        </tr>
+    `).join('');
+    const armed = Object.entries(diag.armed).map(([m, mode]) => `等待中: ${m} (${mode})`);
+    const captures = diag.captures.map(c => `=== ${c.at} ${c.method} [${c.mode}] ${c.ms} ms ===\n${c.report}`);
+    document.getElementById('diagCaptures').textContent = armed.concat(captures).join('\n\n');
+}
+
+async function armCapture() {
+    const result = await pywebview.api.capture_next_call(
+        document.getElementById('diagMethod').value.trim(), document.getElementById('diagMode').value);
+    showToast(result.success ? '将抓取下一次调用' : result.error, result.success ? 'info' : 'error');
+    renderDiagnostics();
+}
+
+// Toast
+function showToast(message, type) {
+    const container = document.getElementById('toastContainer');
+    const icons = { success: '✅', error: '❌', info: 'ℹ️' };
+    const toast = document.createElement('div');
+    toast.className = `toast ${type}`;
+    toast.innerHTML = `<span>${icons[type] || ''}</span> ${message}`;
+    container.appendChild(toast);
+    setTimeout(() => {
+        toast.style.opacity = '0';
+        toast.style.transform = 'translateX(100px)';
+        toast.style.transition = '0.3s ease';
+        setTimeout(() => toast.remove(), 300);
+    }, 3000);
+}
+
+// Start
+window.addEventListener('pywebviewready', init);